@@ -547,6 +547,9 @@ class service:
     def do_getVdsStats(self, args):
         return self.ExecAndExit(self.s.getVdsStats())
 
+    def do_getRpcStats(self, args):
+        return self.ExecAndExit(self.s.getRpcStats())
+
     def do_getVmStats(self, args):
         vmId = args[0]
         if len(args) > 1:
@@ -2257,6 +2260,10 @@ if __name__ == '__main__':
                         ('',
                          'Get Statistics info on the VDS'
                          )),
+        'getRpcStats': (serv.do_getRpcStats,
+                        ('',
+                         'Get per-method statistics of the rpc servers'
+                         )),
         'getVmStats': (serv.do_getVmStats,
                        ('<vmId>',
                         'Get Statistics info on the VM'
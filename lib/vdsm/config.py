@@ -0,0 +1,535 @@
+#
+# Copyright 2011-2013 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+import os
+import textwrap
+import ConfigParser
+
+parameters = [
+    # Section: [vars]
+    ('vars', [
+
+        ('core_dump_enable', 'true',
+            'Enable core dump.'),
+
+        ('host_mem_reserve', '256',
+            'Reserves memory for the host to prevent VMs from using all the '
+            'physical pages. The values are in Mbytes.'),
+
+        ('guest_ram_overhead', '65', None),
+
+        ('extra_mem_reserve', '65',
+            'Memory reserved for non-vds-administered programs.'),
+
+        ('fake_nics', 'dummy_*,veth_*',
+            'Comma-separated list of fnmatch-patterns for dummy hosts nics to '
+            'be shown to vdsm.'),
+
+        ('net_configurator', 'ifcfg',
+            'Whether to use "ifcfg", "pyroute2" or "iproute2" to configure '
+            'networks. pyroute2 and iproute2 configurators are not ready '
+            'yet for general usage.'),
+
+        ('net_persistence', 'unified',
+            'Whether to use "ifcfg" or "unified" persistence for networks.'),
+
+        ('hwaddr_in_ifcfg', 'always',
+            'Whether to set HWADDR in ifcfg files. Set to "never" if '
+            'NetworkManager is disabled and device name persistence does '
+            'not depend on HWADDR.'),
+
+        ('ethtool_opts', '',
+            'Which special ethtool options should be applied to NICs after '
+            'they are taken up, e.g. "lro off" on buggy devices. '
+            'To apply options to a single interface, '
+            'set ethtool_opts.iface_name.'),
+
+        ('nic_model', 'rtl8139,pv',
+            'NIC model is rtl8139, ne2k_pci pv or any other valid device '
+            'recognized by kvm/qemu if a coma separated list given then a '
+            'NIC per device will be created.'),
+
+        ('migration_destination_timeout', '21600',
+            'Maximum time the destination waits for the migration to finish.'),
+
+        ('migration_progress_timeout', '150',
+            'Maximum time the source host waits during a migration in case '
+            'that there is no progress. If the time has passed, the migration '
+            'will be aborted.'),
+
+        ('migration_max_time_per_gib_mem', '64',
+            'The maximum time in seconds per GiB memory a migration may take '
+            'before the migration will be aborted by the source host. '
+            'Setting this value to 0 will disable this feature.'),
+
+        ('migration_listener_timeout', '30',
+            'Time to wait (in seconds) for migration destination to start '
+            'listening before migration begins.'),
+
+        ('migration_max_bandwidth', '32',
+            'Maximum bandwidth for migration, in MiBps, 0 means libvirt\'s '
+            'default, since 0.10.x default in libvirt is unlimited'),
+
+        ('migration_monitor_interval', '10',
+            'How often (in seconds) should the monitor thread pulse, 0 means '
+            'the thread is disabled.'),
+
+        ('hidden_nics', 'w*,usb*',
+            'Comma-separated list of fnmatch-patterns for host nics to be '
+            'hidden from vdsm.'),
+
+        ('hidden_bonds', '',
+            'Comma-separated list of fnmatch-patterns for host bonds to be '
+            'hidden from vdsm.'),
+
+        ('hidden_vlans', '',
+            'Comma-separated list of fnmatch-patterns for host vlans to be '
+            'hidden from vdsm. vlan names must be in the format "dev.VLANID" '
+            '(e.g. eth0.100, em1.20, eth2.200). '
+            'vlans with alternative names must be hidden from vdsm '
+            '(e.g. eth0.10-fcoe, em1.myvlan100, vlan200)'),
+
+        ('default_bridge', 'engine', None),
+
+        ('migration_downtime', '500',
+            'Maxmium allowed downtime for live migration in milliseconds '
+            '(anything below 100ms is ignored) if you do not care about '
+            'liveness of migration, set to a very high value, such as '
+            '600000.'),
+
+        ('migration_downtime_delay', '75',
+            'This value is used on the source host to define the delay before '
+            'setting/increasing the downtime of a migration. '
+            'The value is per GiB of RAM. A minimum of twice this value is '
+            'used for VMs with less than 2 GiB of RAM'),
+
+        ('migration_downtime_steps', '10',
+            'Incremental steps used to reach migration_downtime.'),
+
+        ('migration_policy', 'legacy',
+            'Policy driving outgoing migrations. "legacy" raises the '
+            'downtime in migration_downtime_steps fixed steps. '
+            '"convergence" estimates the dirty and transfer rates of the '
+            'migration on every migration_monitor_interval, raises the '
+            'downtime only when the migration does not converge, and aborts '
+            'it early if migration_downtime is not enough to converge.'),
+
+        ('max_outgoing_migrations', '3',
+            'Maximum concurrent outgoing migrations'),
+
+        ('migration_total_bandwidth', '0',
+            'Total bandwidth of outgoing migrations, in MiBps. If set, '
+            'outgoing migrations are started while the running migrations '
+            'leave enough bandwidth, up to max_outgoing_migrations, and the '
+            'bandwidth is shared by the running migrations according to '
+            'their measured throughput, ignoring migration_max_bandwidth. '
+            '0 limits every migration to migration_max_bandwidth.'),
+
+        ('migration_max_queue_time', '600',
+            'Outgoing migrations are started cheapest first. Migrations '
+            'waiting longer than this (seconds) are started first, in '
+            'arrival order, so expensive migrations are not starved.'),
+
+        ('sys_shutdown_timeout', '120',
+            'Destroy and shutdown timeouts (in sec) before completing the '
+            'action.'),
+
+        ('user_shutdown_timeout', '30',
+            'Grace period (seconds) to let guest user close his '
+            'applications before shutdown.'),
+
+        ('guest_agent_timeout', '30',
+            'Time (in sec) to wait for guest agent.'),
+
+        ('vm_recovery_flush_interval', '1',
+            'How often to write the changed VMs recovery state (seconds). '
+            'Changes made since the last write are lost if vdsm is '
+            'killed.'),
+
+        ('vm_channels_listener_shards', '1',
+            'Number of threads reading the guest agent channels. The VMs '
+            'are spread between the threads, so a VM flooding its channel '
+            'delays only the VMs read by the same thread.'),
+
+        ('vm_command_timeout', '60',
+            'Time to wait (in seconds) for vm to respond to a monitor '
+            'command, 30 secs is a nice default. Set to 300 if the vm is '
+            'expected to freeze during cluster failover.'),
+
+        ('hotunplug_timeout', '30',
+            'Time to wait (in seconds) for a VM to detach its disk'),
+
+        ('vm_watermark_interval', '2',
+            'How often should we check drive watermark on block storage for '
+            'automatic extension of thin provisioned volumes (seconds).'),
+
+        ('vm_watermark_events', 'true',
+            'Use libvirt block threshold events to trigger automatic '
+            'extension of thin provisioned volumes, if supported by '
+            'libvirt.'),
+
+        ('vm_watermark_fallback_interval', '60',
+            'How often should we check drive watermark of drives using '
+            'block threshold events (seconds).'),
+
+        ('vm_sample_interval', '15', None),
+
+        ('vm_stats_snapshot_max_age', '5',
+            'Maximum time to reuse the stats of all VMs reported by '
+            'getAllVmStats, if no new stats were sampled and no VM changed '
+            'its status (seconds). 0 disables the reuse.'),
+
+        ('vm_sample_jobs_interval', '15', None),
+
+        ('vm_sample_numa_interval', '15',
+            'How often should we sample NUMA CPU assignments'),
+
+        ('host_sample_stats_interval', '15', None),
+
+        ('trust_store_path', '/etc/pki/vdsm',
+            'Where the certificates and keys are situated.'),
+
+        ('ssl', 'true',
+            'Whether to use ssl encryption and authentication.'),
+
+        ('vds_responsiveness_timeout', '60', None),
+
+        ('vdsm_nice', '-5', None),
+
+        ('qemu_drive_cache', 'none', None),
+
+        ('fake_kvm_support', 'false', None),
+
+        ('fake_kvm_architecture', 'x86_64',
+            'Choose the target architecture of the fake KVM mode'),
+
+        ('fake_kvm_memory', '0', 'Set memory of fake KVM hosts. '
+         'Set to \'0\' to use supplied memory value'),
+
+        ('fake_vmstats_enable', 'false', 'Enable reporting of fake VM stats.'),
+
+        ('xmlrpc_enable', 'true', 'Enable the xmlrpc server'),
+
+        ('xmlrpc_http11', 'true',
+            'Enable HTTP/1.1 keep-alive connections'),
+
+        ('jsonrpc_enable', 'true', 'Enable the JSON RPC server'),
+
+        ('broker_enable', 'false', 'Enable outgoing connection to broker'),
+
+        ('report_host_threads_as_cores', 'false',
+            'Count each cpu hyperthread as an individual core'),
+
+        ('libvirt_env_variable_log_filters', '',
+            'Specify the log filters to track libvirt calls'),
+
+        ('libvirt_env_variable_log_outputs', '',
+            'Specify the output to track libvirt calls'),
+
+        ('transient_disks_repository', '/var/lib/vdsm/transient',
+            'Local path to the transient disks repository.'),
+
+        ('ssl_protocol', 'sslv23',
+            'SSL protocol used by encrypted connection'),
+
+        ('connection_stats_timeout', '3600',
+            'Time in seconds defining how frequently we log transport stats'),
+
+        ('cpu_affinity', '',
+            'Comma separated whitelist of CPU cores on which VDSM is allowed '
+            'to run. The default is "", meaning VDSM can be scheduled by '
+            ' the OS to run on any core. '
+            'Valid examples: "1", "0,1", "0,2,3"')
+
+    ]),
+
+    # Section: [mom]
+    ('mom', [
+
+        ('conf', '/etc/vdsm/mom.conf', 'mom configuration file'),
+
+        ('tuning_policy', '01-parameters',
+            'name of the mom policy to be updated from '
+            'updatePolicyParameters API call'),
+
+    ]),
+
+    # Section: [irs]
+    ('irs', [
+
+        ('irs_enable', 'true', None),
+
+        ('repository', '/rhev/data-center',
+            'Image repository.'),
+
+        ('hsm_tasks', '%(repository)s/hsm-tasks', None),
+
+        ('images', '/images', None),
+
+        ('irsd', '%(images)s/irsd', None),
+
+        ('volume_utilization_percent', '50',
+            'Together with volume_utilization_chunk_mb, set the minimal free '
+            'space before a thin provisioned block volume is extended. Use '
+            'lower values to extend earlier.'),
+
+        ('volume_utilization_chunk_mb', '1024',
+            'Size of extension chunk in megabytes, and together with '
+            'volume_utilization_percent, set the free space limit. Use higher '
+            'values to extend in bigger chunks.'),
+
+        ('vol_size_sample_interval', '60',
+            'How often should the volume size be checked (seconds).'),
+
+        ('scsi_rescan_maximal_timeout', '30',
+            'The maximal number of seconds to wait for scsi scan to return.'),
+
+        ('scsi_settle_timeout', '5',
+            'Maximum number of seconds to wait until udev events are handled '
+            'after modifying scsi interconnects.'),
+
+        ('sd_health_check_delay', '10',
+            'Storage domain health check delay, the amount of seconds to '
+            'wait between two successive run of the domain health check.'),
+
+        ('nfs_mount_options', 'soft,nosharecache',
+            'NFS mount options, comma-separated list (NB: no white space '
+            'allowed!)'),
+
+        ('vol_extend_policy', 'ON', None),
+
+        ('lock_util_path', '/usr/libexec/vdsm', None),
+
+        ('lock_cmd', 'spmprotect.sh', None),
+
+        ('free_lock_cmd', 'spmstop.sh', None),
+
+        ('thread_pool_size', '10',
+            'The number of threads to allocate to the task manager.'),
+
+        ('max_tasks', '500', None),
+
+        ('mailbox_min_interval', '0.2',
+            'Minimal interval in seconds between storage mailbox checks. '
+            'The mailbox is checked at this interval after extend requests '
+            'or replies are seen, and the interval is doubled on each idle '
+            'check up to the mailbox monitor interval. Set to the monitor '
+            'interval (2) to disable adaptive polling.'),
+
+        ('lvm_dev_whitelist', '', None),
+
+        ('lvm_refresh_max_lvs', '16',
+            'Maximum number of stale lvs in a vg reloaded using a single lvs '
+            'command for these lvs. When more lvs are stale, the entire vg '
+            'is reloaded.'),
+
+        ('md_backup_versions', '30', None),
+
+        ('md_backup_dir', '/var/lib/vdsm/netconfback', None),
+
+        ('maximum_allowed_pvs', '8',
+            'The number of PVs per VG has a hard-coded limit of 10.'),
+
+        ('repo_stats_cache_refresh_timeout', '300', None),
+
+        ('task_resource_default_timeout', '120000', None),
+
+        ('prepare_image_timeout', '600000', None),
+
+        ('gc_blocker_force_collect_interval', '60', None),
+
+        ('maximum_domains_in_pool', '100',
+            'Process pool configuration.'),
+
+        ('process_pool_timeout', '60', None),
+
+        ('max_ioprocess_idle_time', '60',
+            'TTL of an unused IOProcess instance'),
+
+        ('process_pool_max_slots_per_domain', '10', None),
+
+        ('process_pool_max_queued_slots_per_domain', '10', None),
+
+        ('iscsi_default_ifaces', 'default',
+            'Comma seperated ifaces to connect with. '
+            'i.e. iser,default'),
+
+        ('use_volume_leases', 'false',
+            'Whether to use the volume leases or not.'),
+
+        ('oop_impl', 'ioprocess',
+            'Whether to use RFH or ioprocess implementation for oop.'
+            'Values can be either ioprocess or rfh.'),
+    ]),
+
+    # Section: [addresses]
+    ('addresses', [
+
+        ('management_port', '54321',
+            'Port on which the vdsmd XMPRPC server listens to network '
+            'clients.'),
+
+        ('management_ip', '0.0.0.0', 'Set to "::" to listen on IPv6.'),
+
+        ('guests_gateway_ip', '', None),
+
+        ('broker_address', '127.0.0.1',
+            'Address where the broker is listening at. Use an empty string '
+            'for none'),
+
+        ('broker_port', '5445',
+            'Port where the broker is listening at.'),
+
+        ('request_queues',
+            'jms.topic.vdsm_requests,jms.topic.vdsm_irs_requests',
+            'Queues for vdsm to subscribe to'),
+
+        ('event_queue', 'jms.queue.events',
+            'Queue used for events'),
+    ]),
+
+    # Section: [sampling]
+    ('sampling', [
+
+        ('periodic_workers', '4',
+            'Number of worker threads to serve the periodic tasks.'
+            ' This is for internal usage and may change without warning'),
+
+        ('periodic_task_per_worker', '100',
+            'Max number of tasks which can be queued on workers.'
+            ' This is for internal usage and may change without warning'),
+    ]),
+
+    # Section: [rpc]
+    ('rpc', [
+
+        ('worker_threads', '8',
+            'Number of worker threads serving jsonrpc requests in the '
+            'control lane, used for verbs without an explicit lane in the '
+            'schema.'),
+
+        ('monitoring_worker_threads', '4',
+            'Number of worker threads serving jsonrpc requests in the '
+            'monitoring lane (e.g. Host.getStats, VM.getStats).'),
+
+        ('storage_worker_threads', '4',
+            'Number of worker threads serving jsonrpc requests in the '
+            'storage lane (e.g. StoragePool.connect), which may block for '
+            'a long time.'),
+
+        ('tasks_per_worker', '10',
+            'Max number of jsonrpc requests which can be queued per worker. '
+            'Requests beyond this limit are rejected with a "server busy" '
+            'error.'),
+
+        ('worker_timeout', '60',
+            'Time in seconds after which a worker blocked on a request is '
+            'replaced with a fresh one.'),
+
+        ('worker_timeout_overrides', '',
+            'Comma-separated list of "method:seconds" pairs overriding '
+            'worker_timeout for specific verbs, e.g. '
+            '"StoragePool.connect:600,Host.getStats:10".'),
+
+        ('reactor', 'poll',
+            'Event loop serving rpc connections: "poll" for the asyncore '
+            'based loop, or "epoll" for a loop scaling better with many '
+            'connections.'),
+
+        ('stomp_max_batch_size', '65536',
+            'Maximum number of bytes of pending stomp frames coalesced into '
+            'a single socket write.'),
+
+        ('stats_report_interval', '0',
+            'Interval in seconds for logging the rpc methods taking most '
+            'of the time, or 0 to disable. The statistics are also '
+            'available using the Host.getRpcStats verb.'),
+    ]),
+
+    # Section: [devel]
+    ('devel', [
+
+        ('cpu_profile_enable', 'false',
+            'Enable whole process profiling (requires yappi profiler).'),
+
+        ('cpu_profile_format', 'pstat',
+            'Profile file format (pstat, callgrind, ystat)'),
+
+        ('cpu_profile_builtins', 'false',
+            'Profile builtin functions used by standard Python modules. '
+            'false by default.'),
+
+        ('cpu_profile_clock', 'cpu',
+            'Sets the underlying clock type (cpu, wall)'),
+
+        ('python_warnings_enable', 'false',
+            'Display python warnings in the log'),
+
+        ('memory_profile_enable', 'false',
+            'Enable whole process profiling (requires dowser profiler).'),
+
+        ('memory_profile_port', '9090',
+            'Port on which the dowser Web UI will be reachable.'),
+
+        ('manhole_enable', 'false',
+            'Enable manhole debugging service (requires manhole package).'),
+
+    ]),
+
+    # Section: [gluster]
+    ('gluster', [
+
+        ('allowed_replica_counts', '1,3',
+            'Only replica 1 and 3 are supported. This configuration is for '
+            'development only. Value is comma delimeted.'),
+    ]),
+
+]
+
+
+def set_defaults(config):
+    for section, keylist in parameters:
+        config.add_section(section)
+        for key, value, comment in keylist:
+            config.set(section, key, value)
+
+
+def print_config():
+    twp = textwrap.TextWrapper(initial_indent='# ', subsequent_indent='# ')
+
+    print(twp.fill("VDSM Sample Configuration"))
+    print('')
+
+    for section, keylist in parameters:
+        print("[%s]\n" % section)
+
+        for key, value, comment in keylist:
+            if comment:
+                print(twp.fill(comment))
+            print(twp.fill("%s = %s" % (key, value)))
+            print('')
+
+config = ConfigParser.ConfigParser()
+set_defaults(config)
+config.read([os.path.join('/etc/vdsm', 'vdsm.conf')])
+
+if __name__ == '__main__':
+    print_config()
@@ -0,0 +1,222 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+"""
+This module collects per-method statistics of the rpc servers.
+
+For each protocol and method we count calls and errors, and keep latency
+histograms for the phases of serving a request:
+
+    queue       waiting for a worker thread
+    dispatch    running the verb
+    encode      encoding the response
+    send        until the response was written to the socket
+
+The servers report to the module level collector:
+
+    rpcstats.add(rpcstats.JSONRPC, 'Host.getStats', rpcstats.DISPATCH, 0.01)
+    rpcstats.add_error(rpcstats.JSONRPC, 'Host.getStats')
+
+Latencies should be measured using time.time(); utils.monotonic_time
+resolution is too low for fast verbs.
+
+The collected statistics are returned by info(), used by the
+Host.getRpcStats verb, and logged periodically by report().
+"""
+from __future__ import absolute_import
+
+import bisect
+import logging
+import threading
+
+JSONRPC = 'jsonrpc'
+XMLRPC = 'xmlrpc'
+
+QUEUE = 'queue'
+DISPATCH = 'dispatch'
+ENCODE = 'encode'
+SEND = 'send'
+
+PHASES = (QUEUE, DISPATCH, ENCODE, SEND)
+
+# Upper bounds of the histogram buckets in seconds. The last bucket has no
+# upper bound.
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5,
+           10, 30, 60)
+
+_log = logging.getLogger("rpc.stats")
+
+
+class Histogram(object):
+    """
+    Latency histogram using fixed buckets. Not thread safe.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def add(self, value):
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self._count += 1
+        self._total += value
+        self._max = max(self._max, value)
+
+    @property
+    def count(self):
+        return self._count
+
+    def percentile(self, percent):
+        """
+        Return the upper bound of the bucket containing the given
+        percentile, or the maximum value if it is in the last bucket.
+        """
+        if self._count == 0:
+            return 0.0
+        threshold = self._count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self._buckets, self._counts):
+            seen += count
+            if seen >= threshold:
+                return min(bound, self._max)
+        return self._max
+
+    def info(self):
+        return {
+            'count': self._count,
+            'total': self._total,
+            'max': self._max,
+            'avg': self._total / self._count if self._count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': dict(
+                (str(bound), count)
+                for bound, count in zip(self._buckets + ('inf',),
+                                        self._counts)
+                if count),
+        }
+
+
+class MethodStats(object):
+    """
+    Statistics of a single method. Not thread safe.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.phases = dict((phase, Histogram()) for phase in PHASES)
+
+    def info(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'latency': dict((phase, histogram.info())
+                            for phase, histogram in self.phases.iteritems()
+                            if histogram.count),
+        }
+
+
+class RpcStats(object):
+    """
+    Thread safe collector of per-protocol, per-method statistics.
+
+    A call is counted when its dispatch phase is added.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def add(self, protocol, method, phase, seconds):
+        # time.time() may go backwards when the system time is modified.
+        seconds = max(seconds, 0.0)
+        with self._lock:
+            stats = self._get(protocol, method)
+            if phase == DISPATCH:
+                stats.calls += 1
+            stats.phases[phase].add(seconds)
+
+    def add_error(self, protocol, method):
+        with self._lock:
+            self._get(protocol, method).errors += 1
+
+    def info(self):
+        with self._lock:
+            result = {}
+            for (protocol, method), stats in self._methods.iteritems():
+                result.setdefault(protocol, {})[method] = stats.info()
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._methods.clear()
+
+    def _get(self, protocol, method):
+        key = (protocol, method)
+        try:
+            return self._methods[key]
+        except KeyError:
+            stats = self._methods[key] = MethodStats()
+            return stats
+
+
+_stats = RpcStats()
+
+
+def add(protocol, method, phase, seconds):
+    _stats.add(protocol, method, phase, seconds)
+
+
+def add_error(protocol, method):
+    _stats.add_error(protocol, method)
+
+
+def info():
+    return _stats.info()
+
+
+def clear():
+    _stats.clear()
+
+
+def report(top=10):
+    """
+    Log the methods with the largest total dispatch time.
+    """
+    methods = []
+    for protocol, protocol_info in info().iteritems():
+        for method, method_info in protocol_info.iteritems():
+            dispatch = method_info['latency'].get(DISPATCH)
+            if dispatch is not None:
+                methods.append((dispatch['total'], protocol, method,
+                                method_info, dispatch))
+
+    methods.sort(reverse=True)
+    for total, protocol, method, method_info, dispatch in methods[:top]:
+        _log.info("%s %s: calls=%d errors=%d dispatch total=%.3f avg=%.3f "
+                  "p90=%.3f max=%.3f",
+                  protocol, method, method_info['calls'],
+                  method_info['errors'], total, dispatch['avg'],
+                  dispatch['p90'], dispatch['max'])
@@ -14,6 +14,7 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 from __future__ import absolute_import
 import logging
+import time
 from functools import partial
 from Queue import Queue
 from weakref import ref
@@ -21,6 +22,7 @@ from threading import Lock, Event
 
 from vdsm.compat import json
 
+from vdsm import rpcstats
 from vdsm.password import protect_passwords, unprotect_passwords
 from vdsm.utils import monotonic_time, traceback
 
@@ -32,6 +34,12 @@ _STATE_INCOMING = 1
 _STATE_OUTGOING = 2
 _STATE_ONESHOT = 4
 
+# Responses are encoded in chunks of about this size, so large responses are
+# framed and sent without building the entire message in memory.
+_CHUNK_SIZE = 64 * 1024
+
+_encode = json.JSONEncoder(skipkeys=True).encode
+
 
 class JsonRpcError(RuntimeError):
     def __init__(self, code, msg):
@@ -92,6 +100,13 @@ class JsonRpcNoResponseError(JsonRpcError):
                               "%s request." % method)
 
 
+class JsonRpcServerBusyError(JsonRpcError):
+    def __init__(self, method=''):
+        JsonRpcError.__init__(self, -32606,
+                              "Server is too busy to serve JSON-RPC "
+                              "%s request." % method)
+
+
 class JsonRpcRequest(object):
     def __init__(self, method, params=(), reqId=None):
         self.method = method
@@ -163,6 +178,20 @@ class JsonRpcResponse(object):
         res = self.toDict()
         return json.dumps(res, 'utf-8')
 
+    def iterencode(self):
+        """
+        Encode the response in pieces. Lists and dicts results are encoded
+        item by item, so the response is never encoded as a single string.
+        """
+        if self.error is not None:
+            yield _encode(self.toDict())
+            return
+
+        yield '{"jsonrpc": "2.0", "id": %s, "result": ' % _encode(self.id)
+        for piece in _iterencode_items(self.result):
+            yield piece
+        yield '}'
+
     @staticmethod
     def decode(msg):
         obj = json.loads(msg, 'utf-8')
@@ -185,6 +214,80 @@ class JsonRpcResponse(object):
         return JsonRpcResponse(result, error, reqId)
 
 
+def _iterencode_items(obj):
+    """
+    Encode a list or a dict item by item. JSONEncoder.iterencode does not
+    use the encoder C speedups, so each item is encoded in one call.
+    """
+    if isinstance(obj, (list, tuple)):
+        yield '['
+        separator = ''
+        for item in obj:
+            yield separator
+            yield _encode(item)
+            separator = ', '
+        yield ']'
+    elif isinstance(obj, dict):
+        yield '{'
+        separator = ''
+        for key, value in obj.iteritems():
+            # Encoding a single item dict handles keys like JSONEncoder,
+            # including skipped keys.
+            item = _encode({key: value})[1:-1]
+            if not item:
+                continue
+            yield separator
+            yield item
+            separator = ', '
+        yield '}'
+    else:
+        yield _encode(obj)
+
+
+def _chunks(pieces, size=_CHUNK_SIZE):
+    """
+    Join small pieces into chunks of about size bytes. Pieces larger than
+    size are returned as is.
+    """
+    chunk = []
+    chunk_size = 0
+    for piece in pieces:
+        if len(piece) >= size:
+            if chunk:
+                yield ''.join(chunk)
+                chunk = []
+                chunk_size = 0
+            yield piece
+            continue
+
+        chunk.append(piece)
+        chunk_size += len(piece)
+        if chunk_size >= size:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_size = 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+class ChunkedMessage(list):
+    """
+    Encoded JSON message sent as a list of chunks. Transports send the
+    chunks without joining them, and can find the ids of the responses in
+    the message without decoding it. If on_sent is set, transports call it
+    after the message was written to the socket.
+    """
+
+    def __init__(self, chunks, ids=(), on_sent=None):
+        list.__init__(self, chunks)
+        self.ids = list(ids)
+        self.on_sent = on_sent
+
+    def __str__(self):
+        return ''.join(self)
+
+
 class Notification(object):
     """
     Represents jsonrpc notification message. It builds proper jsonrpc
@@ -252,6 +355,7 @@ class _JsonRpcServeRequestContext(object):
         self._counter = 0
         self._requests = {}
         self._responses = []
+        self._methods = []
 
     def setRequests(self, requests):
         for request in requests:
@@ -274,27 +378,48 @@ class _JsonRpcServeRequestContext(object):
             return
 
         encodedObjects = []
-        for response in self._responses:
+        for response, method in zip(self._responses, self._methods):
+            start = time.time()
             try:
-                encodedObjects.append(response.encode())
+                encodedObjects.append(list(_chunks(response.iterencode())))
             except:  # Error encoding data
-                response = JsonRpcResponse(None, JsonRpcInternalError,
+                response = JsonRpcResponse(None, JsonRpcInternalError(),
                                            response.id)
-                encodedObjects.append(response.encode())
+                encodedObjects.append(list(response.iterencode()))
+            if method is not None:
+                rpcstats.add(rpcstats.JSONRPC, method, rpcstats.ENCODE,
+                             time.time() - start)
 
         if len(encodedObjects) == 1:
-            data = encodedObjects[0]
+            pieces = encodedObjects[0]
         else:
-            data = '[' + ','.join(encodedObjects) + ']'
-
-        self._client.send(data.encode('utf-8'))
-
-    def addResponse(self, response):
+            pieces = ['[']
+            for i, chunks in enumerate(encodedObjects):
+                if i > 0:
+                    pieces.append(',')
+                pieces.extend(chunks)
+            pieces.append(']')
+
+        start = time.time()
+        methods = [method for method in self._methods if method is not None]
+
+        def sent():
+            elapsed = time.time() - start
+            for method in methods:
+                rpcstats.add(rpcstats.JSONRPC, method, rpcstats.SEND,
+                             elapsed)
+
+        self._client.send(ChunkedMessage(
+            _chunks(pieces), (response.id for response in self._responses),
+            on_sent=sent))
+
+    def addResponse(self, response, method=None):
         self._responses.append(response)
+        self._methods.append(method)
 
     def requestDone(self, response):
-        del self._requests[response.id]
-        self.addResponse(response)
+        request = self._requests.pop(response.id)
+        self.addResponse(response, request.method)
         self.sendReply()
 
 
@@ -466,6 +591,10 @@ class JsonRpcServer(object):
     Creates new JsonrRpcServer by providing a bridge, timeout in seconds
     which defining how often we should log connections stats and thread
     factory.
+
+    The thread factory is called with a callable serving the request and
+    the name of the requested method. It may raise JsonRpcError (e.g.
+    JsonRpcServerBusyError) to reject the request.
     """
     def __init__(self, bridge, timeout, threadFactory=None):
         self._bridge = bridge
@@ -491,8 +620,11 @@ class JsonRpcServer(object):
             self._next_report += self._timeout
             self._counter = 0
 
-    def _serveRequest(self, ctx, req):
+    def _serveRequest(self, ctx, req, queued=None):
         self._attempt_log_stats()
+        if queued is not None:
+            rpcstats.add(rpcstats.JSONRPC, req.method, rpcstats.QUEUE,
+                         time.time() - queued)
         mangledMethod = req.method.replace(".", "_")
         logLevel = logging.DEBUG
         if mangledMethod in ('Host_getVMList', 'Host_getAllVmStats',
@@ -512,6 +644,7 @@ class JsonRpcServer(object):
                                             req.id))
             return
 
+        start = time.time()
         try:
             params = req.params
             self._bridge.register_server_address(ctx.address)
@@ -521,18 +654,27 @@ class JsonRpcServer(object):
                 res = method(**params)
             self._bridge.unregister_server_address()
         except JsonRpcError as e:
+            self._account(req.method, start, error=True)
             ctx.requestDone(JsonRpcResponse(None, e, req.id))
         except Exception as e:
+            self._account(req.method, start, error=True)
             self.log.exception("Internal server error")
             ctx.requestDone(JsonRpcResponse(None,
                                             JsonRpcInternalError(str(e)),
                                             req.id))
         else:
+            self._account(req.method, start)
             res = True if res is None else res
             self.log.log(logLevel, "Return '%s' in bridge with %s",
                          req.method, res)
             ctx.requestDone(JsonRpcResponse(res, None, req.id))
 
+    def _account(self, method, start, error=False):
+        rpcstats.add(rpcstats.JSONRPC, method, rpcstats.DISPATCH,
+                     time.time() - start)
+        if error:
+            rpcstats.add_error(rpcstats.JSONRPC, method)
+
     @traceback(on=log.name)
     def serve_requests(self):
         while True:
@@ -595,7 +737,15 @@ class JsonRpcServer(object):
             self._serveRequest(ctx, request)
         else:
             try:
-                self._threadFactory(partial(self._serveRequest, ctx, request))
+                self._threadFactory(partial(self._serveRequest, ctx, request,
+                                            time.time()),
+                                    request.method)
+            except JsonRpcError as e:
+                self.log.warning("Rejecting request %r: %s",
+                                 request.method, e)
+                rpcstats.add_error(rpcstats.JSONRPC, request.method)
+                if not request.isNotification():
+                    ctx.requestDone(JsonRpcResponse(None, e, request.id))
             except Exception as e:
                 self.log.exception("could not allocate request thread")
                 ctx.requestDone(
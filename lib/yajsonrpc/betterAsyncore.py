@@ -18,10 +18,15 @@
 # while enabling compositing instead of inheritance.
 from __future__ import absolute_import
 import asyncore
+import collections
+import errno
+import heapq
+import select
 import socket
 from errno import EWOULDBLOCK
 
 from vdsm.infra.eventfd import EventFD
+from vdsm.utils import monotonic_time
 
 
 class Dispatcher(asyncore.dispatcher):
@@ -80,6 +85,17 @@ class Dispatcher(asyncore.dispatcher):
         default_func = lambda: None
         return getattr(self.__impl, "next_check_interval", default_func)()
 
+    def mark_changed(self):
+        """
+        Tell the reactor that readable() or writable() may have changed,
+        for example after queuing data to send from another thread. The
+        caller should wake up the reactor after this.
+        """
+        changes = getattr(self._map, "changes", None)
+        fd = self._fileno
+        if changes is not None and fd is not None:
+            changes.append(fd)
+
     def handle_read_event(self):
         if self.accepting:
             self.handle_accept()
@@ -226,3 +242,163 @@ class Reactor(object):
         except (IOError, OSError):
             # Client woke up and closed the event dispatcher without our help
             pass
+
+
+class _ChannelMap(dict):
+    """
+    Socket map recording the file descriptors added or removed by the
+    dispatchers, so EpollReactor can update its registrations without
+    scanning all the channels.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.changes = collections.deque()
+
+    def __setitem__(self, fd, obj):
+        dict.__setitem__(self, fd, obj)
+        self.changes.append(fd)
+
+    def __delitem__(self, fd):
+        dict.__delitem__(self, fd)
+        self.changes.append(fd)
+
+
+class EpollReactor(Reactor):
+    """
+    Reactor using epoll instead of asyncore poll loop.
+
+    asyncore.loop registers every channel and asks every channel for its
+    next_check_interval on each iteration. EpollReactor keeps the channels
+    registered with epoll and keeps their next check deadlines in a heap.
+    Channels are checked again only when they had events, when their
+    deadline expired, when they were added or removed, or when they were
+    marked as changed by Dispatcher.mark_changed(). Code queuing data on a
+    channel from another thread must mark the channel before waking up the
+    reactor.
+    """
+
+    def __init__(self):
+        self._map = _ChannelMap()
+        self._is_running = False
+        self._epoll = select.epoll()
+        # fd -> (channel, mask)
+        self._registered = {}
+        # fd -> deadline of the next check, and a heap of (deadline, fd).
+        # Entries in the heap not matching _deadlines are stale.
+        self._deadlines = {}
+        self._timers = []
+        self._wakeupEvent = AsyncoreEvent(self._map)
+
+    def process_requests(self):
+        self._is_running = True
+        try:
+            while self._is_running:
+                self._update_channels()
+                try:
+                    events = self._epoll.poll(self._get_timeout(self._map))
+                except IOError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+                    continue
+                self._handle_events(events)
+                self._expire_timers()
+        finally:
+            for dispatcher in self._map.values():
+                dispatcher.close()
+
+            self._map.clear()
+            self._epoll.close()
+
+    def _get_timeout(self, map):
+        timers = self._timers
+        while timers:
+            deadline, fd = timers[0]
+            if self._deadlines.get(fd) == deadline:
+                return min(max(deadline - monotonic_time(), 0), 30.0)
+            heapq.heappop(timers)
+        return 30.0
+
+    def _update_channels(self):
+        fds = set()
+        changes = self._map.changes
+        while changes:
+            fds.add(changes.popleft())
+
+        for fd in fds:
+            self._update_channel(fd)
+
+    def _update_channel(self, fd):
+        obj = self._map.get(fd)
+        mask = 0
+        if obj is not None:
+            if obj.readable():
+                mask |= select.EPOLLIN | select.EPOLLPRI
+            if obj.writable() and not obj.accepting:
+                mask |= select.EPOLLOUT
+            # readable() may close the channel
+            if self._map.get(fd) is not obj:
+                obj = None
+                mask = 0
+
+        self._register(fd, obj, mask)
+
+        self._deadlines.pop(fd, None)
+        if obj is not None and hasattr(obj, "next_check_interval"):
+            interval = obj.next_check_interval()
+            if interval is not None and interval >= 0:
+                deadline = monotonic_time() + interval
+                self._deadlines[fd] = deadline
+                heapq.heappush(self._timers, (deadline, fd))
+
+    def _register(self, fd, obj, mask):
+        old = self._registered.get(fd)
+        if old == (obj, mask):
+            return
+
+        if old is not None:
+            del self._registered[fd]
+            try:
+                self._epoll.unregister(fd)
+            except (IOError, OSError) as e:
+                # The kernel removes closed file descriptors.
+                if e.errno not in (errno.ENOENT, errno.EBADF):
+                    raise
+
+        if mask:
+            self._epoll.register(fd, mask)
+            self._registered[fd] = (obj, mask)
+
+    def _handle_events(self, events):
+        for fd, flags in events:
+            obj = self._map.get(fd)
+            if obj is None:
+                continue
+            asyncore.readwrite(obj, flags)
+            self._map.changes.append(fd)
+
+    def _expire_timers(self):
+        timers = self._timers
+        now = monotonic_time()
+        while timers and timers[0][0] <= now:
+            deadline, fd = heapq.heappop(timers)
+            if self._deadlines.get(fd) == deadline:
+                del self._deadlines[fd]
+                self._map.changes.append(fd)
+
+
+_REACTORS = {
+    "poll": Reactor,
+    "epoll": EpollReactor,
+}
+
+
+def create_reactor(name="poll"):
+    """
+    Create a reactor by name, "poll" for the asyncore based Reactor, or
+    "epoll" for EpollReactor.
+    """
+    try:
+        return _REACTORS[name]()
+    except KeyError:
+        raise ValueError("Unsupported reactor %r" % name)
@@ -85,6 +85,9 @@ class _HeartBeatFrame(object):
     def encode(self):
         return "\n"
 
+    def encode_chunks(self):
+        return ["\n"]
+
 # There is no reason to have multiple instances
 _heartBeatFrame = _HeartBeatFrame()
 
@@ -104,10 +107,26 @@ class Frame(object):
         self.body = body
 
     def encode(self):
+        return ''.join(self.encode_chunks())
+
+    def encode_chunks(self):
+        """
+        Return the encoded frame as a list of strings. If the body is a list
+        of chunks, the chunks are returned as is instead of joining them.
+        """
         body = self.body
+        if isinstance(body, list):
+            chunks = body
+            length = sum(len(chunk) for chunk in chunks)
+        elif body is not None:
+            chunks = [body]
+            length = len(body)
+        else:
+            chunks = []
+
         # We do it here so we are sure header is up to date
         if body is not None:
-            self.headers["content-length"] = len(body)
+            self.headers["content-length"] = length
 
         data = [self.command, '\n']
         for key, value in self.headers.iteritems():
@@ -117,11 +136,13 @@ class Frame(object):
             data.append("\n")
 
         data.append('\n')
-        if body is not None:
-            data.append(body)
+        if len(chunks) < 2:
+            data.extend(chunks)
+            data.append("\0")
+            return [''.join(data)]
 
-        data.append("\0")
-        return ''.join(data)
+        data.append(chunks[0])
+        return [''.join(data)] + chunks[1:-1] + [chunks[-1] + "\0"]
 
     def __repr__(self):
         return "<StompFrame command=%s>" % (repr(self.command))
@@ -159,6 +180,22 @@ def encodeValue(s):
 
 
 class Parser(object):
+    """
+    Incremental STOMP frame parser.
+
+    Incoming data is appended to a bytearray; self._offset marks the
+    beginning of the data which was not parsed yet, and self._scanned
+    (never behind self._offset) marks how far we already searched for the
+    current terminator, so partial lines and bodies are never scanned
+    twice. Consumed data is dropped from the buffer only when it takes more
+    than half of it, which keeps the cost of parsing linear in the size of
+    the frame.
+
+    Each part of a frame (command, header line, body) is copied out of the
+    buffer exactly once using a memoryview. The copied property reports
+    the total number of bytes copied, including the unparsed data moved
+    when dropping consumed data.
+    """
     _STATE_CMD = "Parsing command"
     _STATE_HEADER = "Parsing headers"
     _STATE_BODY = "Receiving body"
@@ -171,29 +208,38 @@ class Parser(object):
         self._frames = deque()
         self._change_state(self._STATE_CMD)
         self._contentLength = -1
-        self._flush()
+        self._buffer = bytearray()
+        self._offset = 0
+        self._scanned = 0
+        self._copied = 0
 
     def _change_state(self, new_state):
         self._state = new_state
         self._state_cb = self._states[new_state]
 
-    def _flush(self):
-        self._buffer = ""
-
     def _write_buffer(self, buff):
-        self._buffer += buff
+        offset = self._offset
+        if offset > 0 and offset * 2 >= len(self._buffer):
+            del self._buffer[:offset]
+            self._copied += len(self._buffer)
+            self._scanned -= offset
+            self._offset = 0
+        self._buffer.extend(buff)
 
-    def _get_buffer(self):
-        return self._buffer
+    def _available(self):
+        return len(self._buffer) - self._offset
 
     def _handle_terminator(self, term):
-        res, sep, rest = self._buffer.partition(term)
-        if not sep:
+        buf = self._buffer
+        index = buf.find(term, self._scanned)
+        if index == -1:
+            self._scanned = len(buf)
             return None
 
-        self._buffer = rest
-
-        return res
+        start = self._offset
+        self._copied += index - start
+        self._offset = self._scanned = index + 1
+        return memoryview(buf)[start:index].tobytes()
 
     def _parse_command(self):
         cmd = self._handle_terminator('\n')
@@ -260,20 +306,18 @@ class Parser(object):
         return True
 
     def _parse_body_length(self):
-        buf = self._get_buffer()
         cl = self._contentLength
-        ndata = len(buf)
-        if ndata < (cl + 1):
+        if self._available() < (cl + 1):
             return False
 
-        if buf[cl] != "\0":
+        if self._buffer[self._offset + cl] != 0:
             raise RuntimeError("Frame end is missing \\0")
 
-        self._flush()
-        self._write_buffer(buf[cl + 1:])
-        body = buf[:cl]
-
-        self._tmpFrame.body = body
+        start = self._offset
+        end = start + cl
+        self._tmpFrame.body = memoryview(self._buffer)[start:end].tobytes()
+        self._copied += cl
+        self._offset = self._scanned = end + 1
         self._pushFrame()
 
         return True
@@ -282,6 +326,10 @@ class Parser(object):
     def pending(self):
         return len(self._frames)
 
+    @property
+    def copied(self):
+        return self._copied
+
     def parse(self, data):
         self._write_buffer(data)
         while self._state_cb():
@@ -310,8 +358,8 @@ class AsyncDispatcher(object):
         Process received frame
         def handle_frame(self, frame)
 
-        Returns response frame to be sent
-        def peek_message(self)
+        Removes and returns the next frame to be sent
+        def pop_message(self)
 
         Returns Ture if there are messages to be sent
         def has_outgoing_messages(self)
@@ -322,14 +370,27 @@ class AsyncDispatcher(object):
     There are two implementations available:
     - StompAdapterImpl - responsible for server side
     - AsyncClient - responsible for client side
+
+    Pending frames are coalesced into batches of up to maxBatchSize bytes,
+    so many small responses and events are written to the socket using a
+    single send call. A frame larger than maxBatchSize is sent alone.
+    Frames with a chunked body are sent chunk by chunk, without joining
+    the chunks. If the body has an on_sent callback, it is called after the
+    batch including the frame was written.
     """
-    def __init__(self, connection, frame_handler, bufferSize=4096):
+    def __init__(self, connection, frame_handler, bufferSize=4096,
+                 maxBatchSize=65536):
         self._frame_handler = frame_handler
         self.connection = connection
         self._bufferSize = bufferSize
+        self._maxBatchSize = maxBatchSize
         self._parser = Parser()
-        self._outbuf = None
+        self._outbuf = deque()
+        # on_sent callbacks of the frames in _outbuf
+        self._sent_callbacks = []
         self._outgoing_heartbeat_in_milis = 0
+        self._frames_sent = 0
+        self._sends = 0
 
     def setHeartBeat(self, outgoing, incoming=0):
         if incoming != 0:
@@ -339,7 +400,8 @@ class AsyncDispatcher(object):
         self._outgoing_heartbeat_in_milis = outgoing
 
     def handle_connect(self, dispatcher):
-        self._outbuf = None
+        self._outbuf.clear()
+        self._sent_callbacks = []
         self._frame_handler.handle_connect(self)
 
     def handle_read(self, dispatcher):
@@ -373,32 +435,77 @@ class AsyncDispatcher(object):
 
         return max(self._outgoing_heartbeat_expiration_interval(), 0)
 
+    @property
+    def frames_sent(self):
+        return self._frames_sent
+
+    @property
+    def sends(self):
+        """
+        Number of send calls, each sending one or more frames.
+        """
+        return self._sends
+
+    def _next_batch(self):
+        handler = self._frame_handler
+        batch = deque()
+        frames = []
+        size = 0
+        while handler.has_outgoing_messages and size < self._maxBatchSize:
+            frame = handler.pop_message()
+            on_sent = getattr(frame.body, "on_sent", None)
+            if on_sent is not None:
+                self._sent_callbacks.append(on_sent)
+            chunks = frame.encode_chunks()
+            self._frames_sent += 1
+            size += sum(len(chunk) for chunk in chunks)
+            if len(chunks) == 1:
+                frames.append(chunks[0])
+                continue
+
+            # Frame with a chunked body, send the chunks without joining
+            # them.
+            if frames:
+                batch.append(''.join(frames))
+                frames = []
+            batch.extend(chunks)
+
+        if frames:
+            batch.append(''.join(frames))
+
+        return batch
+
     def handle_write(self, dispatcher):
-        if self._outbuf is None:
-            try:
-                frame = self._frame_handler.peek_message()
-            except IndexError:
+        if not self._outbuf:
+            self._outbuf = self._next_batch()
+            if not self._outbuf:
                 return
 
-            self._outbuf = frame.encode()
-
-        data = self._outbuf
+        data = self._outbuf[0]
         numSent = dispatcher.send(data)
+        self._sends += 1
         self._update_outgoing_heartbeat()
         if numSent == len(data):
-            self._outbuf = None
-            # Throw away the frame that was sent to the server
-            # we do not want to do it for partially processed
-            # messages.
-            self._frame_handler.pop_message()
+            self._outbuf.popleft()
+            if not self._outbuf:
+                self._batch_sent()
         else:
-            self._outbuf = data[numSent:]
+            self._outbuf[0] = data[numSent:]
+
+    def _batch_sent(self):
+        callbacks = self._sent_callbacks
+        self._sent_callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                self.log.exception("Error running on_sent callback")
 
     def writable(self, dispatcher):
         if self._frame_handler.has_outgoing_messages:
             return True
 
-        if self._outbuf is not None:
+        if self._outbuf:
             return True
 
         if (self.next_check_interval() == 0):
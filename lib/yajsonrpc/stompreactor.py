@@ -24,9 +24,9 @@ from vdsm import utils
 from vdsm.config import config
 from vdsm.compat import json
 from vdsm.m2cutils import SSLSocket
-from . import JsonRpcClient, JsonRpcServer
+from . import ChunkedMessage, JsonRpcClient, JsonRpcServer
 from . import stomp
-from .betterAsyncore import Dispatcher, Reactor
+from .betterAsyncore import Dispatcher, Reactor, create_reactor
 
 _STATE_LEN = "Waiting for message length"
 _STATE_MSG = "Waiting for message"
@@ -249,10 +249,16 @@ class _StompConnection(object):
 
         self._async_client = aclient
         self._dispatcher = reactor.create_dispatcher(
-            sock, stomp.AsyncDispatcher(self, aclient))
+            sock, stomp.AsyncDispatcher(
+                self, aclient,
+                maxBatchSize=config.getint('rpc', 'stomp_max_batch_size')))
 
     def send_raw(self, msg):
         self._async_client.queue_frame(msg)
+        self.wakeup()
+
+    def wakeup(self):
+        self._dispatcher.mark_changed()
         self._reactor.wakeup()
 
     def setTimeout(self, timeout):
@@ -303,10 +309,13 @@ class StompServer(object):
     def send(self, message, destination=stomp.LEGACY_SUBSCRIPTION_ID_RESPONSE):
         self.log.debug("Sending response")
         try:
-            resp = json.loads(message)
-            destination = self._req_dest[resp.get("id")]
-            del self._req_dest["id"]
-        except KeyError:
+            if isinstance(message, ChunkedMessage):
+                # Responses are chunked, no need to decode them
+                resp_id = message.ids[0]
+            else:
+                resp_id = json.loads(message).get("id")
+            destination = self._req_dest.pop(resp_id)
+        except (KeyError, IndexError):
             # we could have no reply-to
             pass
 
@@ -369,7 +378,7 @@ class StompClient(object):
 
     def subscribe(self, *args, **kwargs):
         sub = self._aclient.subscribe(*args, **kwargs)
-        self._reactor.wakeup()
+        self._stompConn.wakeup()
         return sub
 
     def send(self, message, destination=stomp.LEGACY_SUBSCRIPTION_ID_RESPONSE,
@@ -380,7 +389,7 @@ class StompClient(object):
             message,
             headers
         )
-        self._reactor.wakeup()
+        self._stompConn.wakeup()
 
     def close(self):
         self._stompConn.close()
@@ -414,7 +423,7 @@ class StompListenerImpl(object):
 
 class StompReactor(object):
     def __init__(self, subs):
-        self._reactor = Reactor()
+        self._reactor = create_reactor(config.get('rpc', 'reactor'))
         self._server = StompServer(self._reactor, subs)
 
     def createListener(self, connected_socket, acceptHandler):
@@ -0,0 +1,162 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import socket
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from yajsonrpc import betterAsyncore
+from vdsm.utils import monotonic_time
+
+from testlib import VdsmTestCase, expandPermutations, permutations
+
+REACTORS = (("poll",), ("epoll",))
+
+
+class Echo(object):
+    """
+    Dispatcher implementation echoing received data, and sending queued
+    data. If interval is set, sends a heartbeat every interval seconds.
+    """
+
+    def __init__(self, interval=None):
+        self._outbox = deque()
+        self._interval = interval
+        self._last_write = monotonic_time()
+
+    def queue(self, data):
+        self._outbox.append(data)
+
+    def readable(self, dispatcher):
+        return True
+
+    def writable(self, dispatcher):
+        if self._interval is not None and self.next_check_interval() == 0:
+            self._outbox.append("\n")
+        return len(self._outbox) > 0
+
+    def next_check_interval(self):
+        if self._interval is None:
+            return None
+        return max(self._interval - (monotonic_time() - self._last_write), 0)
+
+    def handle_read(self, dispatcher):
+        data = dispatcher.recv(1024)
+        if data:
+            self._outbox.append(data)
+
+    def handle_write(self, dispatcher):
+        data = self._outbox.popleft()
+        dispatcher.send(data)
+        self._last_write = monotonic_time()
+
+
+@contextmanager
+def running_reactor(name):
+    reactor = betterAsyncore.create_reactor(name)
+    t = threading.Thread(target=reactor.process_requests)
+    t.daemon = True
+    t.start()
+    try:
+        yield reactor
+    finally:
+        reactor.stop()
+        t.join()
+
+
+@expandPermutations
+class ReactorTests(VdsmTestCase):
+
+    TIMEOUT = 2.0
+
+    def setUp(self):
+        self.server, self.client = socket.socketpair()
+        self.server.setblocking(0)
+        self.client.settimeout(self.TIMEOUT)
+
+    def tearDown(self):
+        self.client.close()
+
+    @permutations(REACTORS)
+    def test_echo(self, name):
+        with running_reactor(name) as reactor:
+            reactor.create_dispatcher(self.server, Echo())
+            reactor.wakeup()
+            for i in range(10):
+                msg = "message %d" % i
+                self.client.sendall(msg)
+                self.assertEqual(self.client.recv(1024), msg)
+
+    @permutations(REACTORS)
+    def test_wakeup(self, name):
+        impl = Echo()
+        with running_reactor(name) as reactor:
+            dispatcher = reactor.create_dispatcher(self.server, impl)
+            reactor.wakeup()
+            impl.queue("queued")
+            dispatcher.mark_changed()
+            reactor.wakeup()
+            self.assertEqual(self.client.recv(1024), "queued")
+
+    def test_wakeup_checks_marked_channels(self):
+        server, client = socket.socketpair()
+        server.setblocking(0)
+        client.settimeout(0.2)
+        try:
+            impl = Echo()
+            with running_reactor("epoll") as reactor:
+                reactor.create_dispatcher(self.server, Echo())
+                dispatcher = reactor.create_dispatcher(server, impl)
+                reactor.wakeup()
+                # Make sure the reactor checked both dispatchers
+                self.client.sendall("ping")
+                self.assertEqual(self.client.recv(1024), "ping")
+                impl.queue("queued")
+                reactor.wakeup()
+                self.assertRaises(socket.timeout, client.recv, 1024)
+                dispatcher.mark_changed()
+                reactor.wakeup()
+                self.assertEqual(client.recv(1024), "queued")
+        finally:
+            client.close()
+
+    @permutations(REACTORS)
+    def test_next_check_interval(self, name):
+        with running_reactor(name) as reactor:
+            reactor.create_dispatcher(self.server, Echo(interval=0.1))
+            reactor.wakeup()
+            for i in range(3):
+                self.assertEqual(self.client.recv(1024), "\n")
+
+    @permutations(REACTORS)
+    def test_close(self, name):
+        with running_reactor(name) as reactor:
+            dispatcher = reactor.create_dispatcher(self.server, Echo())
+            reactor.wakeup()
+            # Make sure the reactor is serving the dispatcher
+            self.client.sendall("ping")
+            self.assertEqual(self.client.recv(1024), "ping")
+            dispatcher.close()
+            reactor.wakeup()
+            self.assertEqual(self.client.recv(1024), "")
+
+    def test_unsupported_reactor(self):
+        self.assertRaises(ValueError, betterAsyncore.create_reactor, "foo")
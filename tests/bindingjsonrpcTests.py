@@ -0,0 +1,145 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import threading
+
+from vdsm import schedule
+from vdsm import utils
+from yajsonrpc import JsonRpcServerBusyError
+from rpc import bindingjsonrpc
+from rpc import vdsmapi
+
+from testlib import VdsmTestCase as TestCaseBase
+
+
+class RequestExecutorTests(TestCaseBase):
+
+    def setUp(self):
+        self.scheduler = schedule.Scheduler(clock=utils.monotonic_time)
+        self.scheduler.start()
+        self.executor = bindingjsonrpc.RequestExecutor(
+            self.scheduler, workers=1, max_tasks=1, timeout=60,
+            method_timeouts={'StoragePool.connect': 600})
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+        self.scheduler.stop()
+
+    def test_dispatch(self):
+        done = threading.Event()
+        self.executor.dispatch(done.set, 'Host.getStats')
+        done.wait(1)
+        self.assertTrue(done.is_set())
+
+    def test_server_busy(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait(1)
+
+        try:
+            self.executor.dispatch(blocked, 'StoragePool.connect')
+            started.wait(1)
+            self.executor.dispatch(blocked, 'StoragePool.connect')
+            self.assertRaises(JsonRpcServerBusyError,
+                              self.executor.dispatch,
+                              blocked, 'Host.getStats')
+        finally:
+            release.set()
+        self.assertEqual(self.executor.stats()['rejected'], 1)
+
+    def test_method_timeout(self):
+        self.assertEqual(self.executor.timeout('StoragePool.connect'), 600)
+        self.assertEqual(self.executor.timeout('Host.getStats'), 60)
+
+
+class ParseTimeoutsTests(TestCaseBase):
+
+    def test_empty(self):
+        self.assertEqual(bindingjsonrpc._parse_timeouts(''), {})
+
+    def test_pairs(self):
+        self.assertEqual(
+            bindingjsonrpc._parse_timeouts('A.b:10, C.d:600'),
+            {'A.b': 10, 'C.d': 600})
+
+    def test_malformed(self):
+        self.assertEqual(
+            bindingjsonrpc._parse_timeouts('A.b, C.d:x, E.f:30'),
+            {'E.f': 30})
+
+
+class LaneDispatcherTests(TestCaseBase):
+
+    def setUp(self):
+        self.scheduler = schedule.Scheduler(clock=utils.monotonic_time)
+        self.scheduler.start()
+        lanes = {'Host.getStats': bindingjsonrpc.LANE_MONITORING,
+                 'StoragePool.connect': bindingjsonrpc.LANE_STORAGE,
+                 'VM.foo': 'no-such-lane'}
+        lane_threads = {bindingjsonrpc.LANE_MONITORING: 1,
+                        bindingjsonrpc.LANE_CONTROL: 1,
+                        bindingjsonrpc.LANE_STORAGE: 1}
+        # Allow queuing a second task before the worker takes the first one
+        self.dispatcher = bindingjsonrpc.LaneDispatcher(
+            self.scheduler, lanes, lane_threads=lane_threads,
+            tasks_per_worker=2)
+        self.dispatcher.start()
+
+    def tearDown(self):
+        self.dispatcher.stop()
+        self.scheduler.stop()
+
+    def test_lane(self):
+        self.assertEqual(self.dispatcher.lane('Host.getStats'),
+                         bindingjsonrpc.LANE_MONITORING)
+        self.assertEqual(self.dispatcher.lane('StoragePool.connect'),
+                         bindingjsonrpc.LANE_STORAGE)
+        self.assertEqual(self.dispatcher.lane('VM.create'),
+                         bindingjsonrpc.LANE_CONTROL)
+        self.assertEqual(self.dispatcher.lane('VM.foo'),
+                         bindingjsonrpc.LANE_CONTROL)
+
+    def test_monitoring_not_blocked_by_storage(self):
+        release = threading.Event()
+        done = threading.Event()
+        try:
+            for _ in range(2):
+                self.dispatcher.dispatch(lambda: release.wait(1),
+                                         'StoragePool.connect')
+            self.dispatcher.dispatch(done.set, 'Host.getStats')
+            done.wait(0.5)
+            self.assertTrue(done.is_set())
+        finally:
+            release.set()
+
+
+class SchemaLanesTests(TestCaseBase):
+
+    def test_schema_lanes(self):
+        lanes = bindingjsonrpc._method_lanes(vdsmapi.get_api())
+        self.assertEqual(lanes['Host.getAllVmStats'],
+                         bindingjsonrpc.LANE_MONITORING)
+        self.assertEqual(lanes['StoragePool.connect'],
+                         bindingjsonrpc.LANE_STORAGE)
+        self.assertEqual(lanes['VM.create'], bindingjsonrpc.LANE_CONTROL)
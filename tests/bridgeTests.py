@@ -18,12 +18,16 @@
 #
 # Refer to the README and COPYING files for full details of the license
 #
+from __future__ import print_function
 import imp
 import json
+import time
 
+from rpc import Bridge
 from rpc.Bridge import DynamicBridge
 from monkeypatch import MonkeyPatch
 from testlib import VdsmTestCase as TestCaseBase
+from testValidation import stresstest
 
 apiWhitelist = ('StorageDomain.Classes', 'StorageDomain.Types',
                 'Volume.Formats', 'Volume.Types', 'Volume.Roles',
@@ -65,11 +69,25 @@ class StorageDomain():
             return {'status': {'code': -1, 'message': 'Fail'}}
 
 
+class VM():
+    ctorArgs = ['vmID']
+
+    def __init__(self, UUID):
+        self._UUID = UUID
+
+    def getStats(self):
+        return {'status': {'code': 0, 'message': 'Done'},
+                'statsList': [{'vmId': self._UUID, 'status': 'Up',
+                               'elapsedTime': '1000', 'cpuUser': '0.5',
+                               'memUsage': '10'}]}
+
+
 def getFakeAPI():
     _newAPI = imp.new_module('API')
     _API = __import__('API', globals(), locals(), {}, -1)
     setattr(_newAPI, 'Global', Host)
     setattr(_newAPI, 'StorageDomain', StorageDomain)
+    setattr(_newAPI, 'VM', VM)
 
     # Apply the whitelist to our version of API
     for name in apiWhitelist:
@@ -87,18 +105,9 @@ def getFakeAPI():
     return _newAPI
 
 
-def _getApiInstance(self, className, argObj):
-    className = self._convertClassName(className)
-
-    apiObj = getattr(getFakeAPI(), className)
-
-    ctorArgs = self._getArgs(argObj, apiObj.ctorArgs, [])
-    return apiObj(*ctorArgs)
-
-
 class BridgeTests(TestCaseBase):
 
-    @MonkeyPatch(DynamicBridge, '_getApiInstance', _getApiInstance)
+    @MonkeyPatch(Bridge, 'API', getFakeAPI())
     def testMethodWithManyOptionalAttributes(self):
         bridge = DynamicBridge()
 
@@ -115,7 +124,7 @@ class BridgeTests(TestCaseBase):
         method = getattr(bridge, mangledMethod)
         self.assertEquals(method(**params), {'power': 'on'})
 
-    @MonkeyPatch(DynamicBridge, '_getApiInstance', _getApiInstance)
+    @MonkeyPatch(Bridge, 'API', getFakeAPI())
     def testMethodWithNoParams(self):
         bridge = DynamicBridge()
 
@@ -130,7 +139,7 @@ class BridgeTests(TestCaseBase):
         self.assertEquals(method(**params)['My caps'], 'My capabilites')
         bridge.unregister_server_address()
 
-    @MonkeyPatch(DynamicBridge, '_getApiInstance', _getApiInstance)
+    @MonkeyPatch(Bridge, 'API', getFakeAPI())
     def testDetach(self):
         bridge = DynamicBridge()
 
@@ -144,3 +153,23 @@ class BridgeTests(TestCaseBase):
         params = obj.get('params', [])
         method = getattr(bridge, mangledMethod)
         self.assertEqual(method(**params), None)
+
+    @MonkeyPatch(Bridge, 'API', imp.new_module('API'))
+    def testMissingApiClass(self):
+        bridge = DynamicBridge()
+        self.assertRaises(AttributeError, getattr, bridge,
+                          'StorageDomain_detach')
+
+    @stresstest
+    @MonkeyPatch(Bridge, 'API', getFakeAPI())
+    def testBenchmarkDispatch(self):
+        bridge = DynamicBridge()
+        params = {'vmID': '773adfc7-10d4-4e60-b700-3272ee1871f9'}
+        count = 100000
+        start = time.time()
+        for i in range(count):
+            bridge.VM_getStats(**params)
+        elapsed = time.time() - start
+
+        print()
+        print("VM.getStats: %.2f usec per call" % (elapsed / count * 1e6))
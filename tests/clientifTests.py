@@ -212,3 +212,31 @@ class getVMsTests(TestCaseBase):
                 self.assertEqual(len(vms), 2)
                 self.assertIn(testvm1.id, vms)
                 self.assertIn(testvm2.id, vms)
+
+
+class FakeStatsSnapshot(object):
+
+    def __init__(self):
+        self.invalidated = False
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+class NotifyTests(TestCaseBase):
+
+    def setUp(self):
+        self.cif = fake.ClientIF()
+        self.cif._vmStatsSnapshot = FakeStatsSnapshot()
+        # Without a jsonrpc binding, sending the event fails
+        self.cif.bindings = {}
+
+    def test_invalidate_vm_stats_before_sending(self):
+        self.assertRaises(KeyError, clientIF.clientIF.notify, self.cif,
+                          '|virt|VM_status|vmid', vmid={'status': 'Up'})
+        self.assertTrue(self.cif._vmStatsSnapshot.invalidated)
+
+    def test_other_events_keep_vm_stats(self):
+        self.assertRaises(KeyError, clientIF.clientIF.notify, self.cif,
+                          '|net|host_conn|no_id')
+        self.assertFalse(self.cif._vmStatsSnapshot.invalidated)
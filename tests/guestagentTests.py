@@ -22,8 +22,10 @@ import logging
 from collections import namedtuple
 from virt import guestagent
 import json
+import time
 
 from testlib import VdsmTestCase as TestCaseBase
+from testValidation import stresstest
 
 _MSG_TYPES = ['heartbeat', 'host-name', 'os-version',
               'network-interfaces', 'applications', 'disks-usage']
@@ -199,6 +201,109 @@ class TestGuestIFHandleData(TestCaseBase):
                     # the message should have been put into the guestInfo dict
                     self.assertEqual(self.fakeGuestAgent.guestInfo[k], v)
 
+    def testLineAcrossChunks(self):
+        msgStr = self.dataToMessage('host-name', {'name': 'vm.example.com'})
+        for chunk in self.messageChunks(msgStr, 5):
+            self.fakeGuestAgent._handleData(chunk)
+        self.assertEqual(self.fakeGuestAgent.guestInfo['guestName'],
+                         'vm.example.com')
+
+    def testStopped(self):
+        msgStr = self.dataToMessage('host-name', {'name': 'vm.example.com'})
+        self.fakeGuestAgent._stopped = True
+        self.fakeGuestAgent._handleData(msgStr)
+        self.assertNotIn('guestName', self.fakeGuestAgent.guestInfo)
+        # Lines received while stopped are handled after reconnecting
+        self.fakeGuestAgent._stopped = False
+        self.fakeGuestAgent._handleData('')
+        self.assertEqual(self.fakeGuestAgent.guestInfo['guestName'],
+                         'vm.example.com')
+
+    def testManyLinesInChunk(self):
+        data = (self.dataToMessage('host-name', {'name': 'first'}) +
+                self.dataToMessage('os-version', {'version': '4.2'}) +
+                self.dataToMessage('host-name', {'name': 'last'})[:10])
+        self.fakeGuestAgent._handleData(data)
+        self.assertEqual(self.fakeGuestAgent.guestInfo['guestName'],
+                         'first')
+        self.assertEqual(self.fakeGuestAgent.guestInfo['guestOs'], '4.2')
+
+
+class ParseLineTests(TestCaseBase):
+
+    def setUp(self):
+        self.agent = guestagent.GuestAgent(None, None, self.log,
+                                           lambda: None)
+
+    def test_ascii(self):
+        line = json.dumps({'__name__': 'host-name', 'name': 'example'})
+        self.assertEqual(self.agent._parseLine(line),
+                         ('host-name', {'name': u'example'}))
+
+    def test_escaped_restricted_char(self):
+        line = json.dumps({'__name__': 'host-name', 'name': u'a\x01b'})
+        self.assertEqual(self.agent._parseLine(line),
+                         ('host-name', {'name': u'a\ufffdb'}))
+
+    def test_non_ascii(self):
+        line = json.dumps({'__name__': 'host-name', 'name': u'\u010d\x86'},
+                          ensure_ascii=False).encode('utf8')
+        self.assertEqual(self.agent._parseLine(line),
+                         ('host-name', {'name': u'\u010d\ufffd'}))
+
+    def test_invalid_utf8(self):
+        line = '{"__name__": "host-name", "name": "a\xffb"}'
+        self.assertEqual(self.agent._parseLine(line),
+                         ('host-name', {'name': u'a\ufffdb'}))
+
+
+class HandleDataBenchmark(TestCaseBase):
+
+    MESSAGES = 20000
+
+    def setUp(self):
+        self.agent = guestagent.GuestAgent(None, None, self.log,
+                                           lambda: None)
+        self.agent._stopped = False
+        self.agent._clearReadBuffer()
+        self.messages = []
+        self.agent._handleMessage = self.handleMessage
+
+    def handleMessage(self, message, args):
+        self.messages.append(message)
+
+    @stresstest
+    def test_agent_traffic(self):
+        data = ''.join(agentTraffic(self.MESSAGES))
+        chunks = [data[i:i + 2 ** 16] for i in range(0, len(data), 2 ** 16)]
+
+        start = time.time()
+        for chunk in chunks:
+            self.agent._handleData(chunk)
+        elapsed = time.time() - start
+
+        self.assertEqual(len(self.messages), self.MESSAGES)
+        print("%d messages (%d bytes): %.1f usec per message" %
+              (self.MESSAGES, len(data),
+               elapsed / self.MESSAGES * 1000000))
+
+
+def agentTraffic(count):
+    """
+    Generate guest agent traffic similar to ovirt-guest-agent, mostly
+    heartbeats, with periodic applications and disks usage reports.
+    """
+    applications = {'applications': ['package-%d-1.0.%d.el7' % (i, i)
+                                     for i in range(300)]}
+    messages = (['heartbeat'] * 8 + ['disks-usage', 'applications'])
+    inputs = dict(zip(_MSG_TYPES, _INPUTS))
+    inputs['applications'] = applications
+    for i in range(count):
+        name = messages[i % len(messages)]
+        payload = dict(inputs[name])
+        payload['__name__'] = name
+        yield json.dumps(payload) + '\n'
+
 
 class DiskMappingTests(TestCaseBase):
 
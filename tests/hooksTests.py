@@ -24,8 +24,11 @@ import contextlib
 import tempfile
 import os
 import os.path
+import shutil
+import time
 from contextlib import contextmanager
 from testlib import VdsmTestCase as TestCaseBase
+from testValidation import stresstest
 from testlib import namedTemporaryDir
 
 import hooks
@@ -139,3 +142,80 @@ domXMLFile.close()
                                         params={'customProperty': ' rocks!'},
                                         vmconf=vmconf)
             self.assertEqual(result, "oVirt rocks more!")
+
+
+class ScriptsCacheTests(TestCaseBase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = hooks._ScriptsCache(self.path)
+        self.cache.start()
+
+    def tearDown(self):
+        self.cache.stop()
+        shutil.rmtree(self.path)
+
+    def test_empty_dir(self):
+        os.mkdir(os.path.join(self.path, 'before_get_stats'))
+        self.assertEqual(self.cache.get('before_get_stats'), [])
+
+    def test_missing_dir(self):
+        self.assertEqual(self.cache.get('before_get_stats'), [])
+
+    def test_script_added(self):
+        dirName = os.path.join(self.path, 'before_get_stats')
+        os.mkdir(dirName)
+        self.assertEqual(self.cache.get('before_get_stats'), [])
+        script = self.createScript(dirName)
+        self.waitForScripts('before_get_stats', [script])
+
+    def test_script_removed(self):
+        dirName = os.path.join(self.path, 'before_get_stats')
+        os.mkdir(dirName)
+        script = self.createScript(dirName)
+        self.assertEqual(self.cache.get('before_get_stats'), [script])
+        os.unlink(script)
+        self.waitForScripts('before_get_stats', [])
+
+    def test_script_not_executable(self):
+        dirName = os.path.join(self.path, 'before_get_stats')
+        os.mkdir(dirName)
+        script = self.createScript(dirName)
+        self.assertEqual(self.cache.get('before_get_stats'), [script])
+        os.chmod(script, 0o664)
+        self.waitForScripts('before_get_stats', [])
+
+    @stresstest
+    def test_benchmark_empty_dir(self):
+        os.mkdir(os.path.join(self.path, 'before_get_stats'))
+        count = 100000
+
+        start = time.time()
+        for i in range(count):
+            hooks._listScripts(os.path.join(self.path, 'before_get_stats'))
+        elapsed = time.time() - start
+        print("%d lookups: %.1f usec per lookup" %
+              (count, elapsed / count * 1000000))
+
+        start = time.time()
+        for i in range(count):
+            self.cache.get('before_get_stats')
+        elapsed = time.time() - start
+        print("%d cached lookups: %.1f usec per lookup" %
+              (count, elapsed / count * 1000000))
+
+    def createScript(self, dirName):
+        script = os.path.join(dirName, 'script.sh')
+        with open(script, 'w') as f:
+            f.write('#!/bin/sh\n')
+        os.chmod(script, 0o775)
+        return script
+
+    def waitForScripts(self, dir, expected, timeout=2):
+        deadline = time.time() + timeout
+        while True:
+            scripts = self.cache.get(dir)
+            if scripts == expected or time.time() > deadline:
+                break
+            time.sleep(0.01)
+        self.assertEqual(scripts, expected)
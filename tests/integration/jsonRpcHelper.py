@@ -36,6 +36,7 @@ from yajsonrpc.stomp import (
 from yajsonrpc import Notification
 from protocoldetector import MultiProtocolAcceptor
 from rpc.bindingjsonrpc import BindingJsonRpc
+from vdsm import schedule
 from vdsm import utils
 from m2chelper import DEAFAULT_SSL_CONTEXT
 
@@ -87,7 +88,11 @@ def constructAcceptor(log, ssl, jsonBridge,
         0,
         sslctx,
     )
-    json_binding = BindingJsonRpc(jsonBridge, defaultdict(list), 60)
+    scheduler = schedule.Scheduler(name="test.Scheduler",
+                                   clock=utils.monotonic_time)
+    scheduler.start()
+    json_binding = BindingJsonRpc(jsonBridge, defaultdict(list), 60,
+                                  scheduler)
     json_binding.start()
 
     cif = FakeClientIf(json_binding, dest)
@@ -113,6 +118,7 @@ def constructAcceptor(log, ssl, jsonBridge,
         acceptor.stop()
         json_binding.stop()
         xml_binding.stop()
+        scheduler.stop()
 
 
 @contextmanager
@@ -19,9 +19,16 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+from __future__ import print_function
+import threading
+import time
+
 from testlib import VdsmTestCase as TestCaseBase
+from testlib import start_thread
+from testValidation import stresstest
 
 import storage.lvm as lvm
+from storage import storage_exception as se
 
 
 class LvmTests(TestCaseBase):
@@ -37,3 +44,405 @@ class LvmTests(TestCaseBase):
                           "\\\\x22\\\\x28|\', \'r|.*|\' ]"
                           )
         self.assertEqual(expectedFilter, filter)
+
+
+class FakeCommand(object):
+
+    def __init__(self, rc=0, fail_batch=False):
+        self.rc = rc
+        self.fail_batch = fail_batch
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, key, lvs):
+        self.calls.append((key, tuple(lvs)))
+        self.started.set()
+        self.release.wait(2)
+        if self.fail_batch and len(lvs) > 1:
+            return 5, [], ["failed"]
+        return self.rc, ["out"], []
+
+
+class BatchRunnerTests(TestCaseBase):
+
+    def test_single(self):
+        run = FakeCommand()
+        runner = lvm.BatchRunner(run)
+        self.assertEqual(runner.run("key", ["lv1"]), (0, ["out"], []))
+        self.assertEqual(run.calls, [("key", ("lv1",))])
+
+    def test_batch_concurrent_requests(self):
+        run = FakeCommand()
+        runner = lvm.BatchRunner(run)
+        results = self.run_concurrently(runner, run, "key", ["lv2", "lv3"])
+        self.assertEqual(run.calls, [("key", ("lv1",)),
+                                     ("key", ("lv2", "lv3"))])
+        self.assertEqual(results, [(0, ["out"], []), (0, ["out"], [])])
+
+    def test_different_keys_not_batched(self):
+        run = FakeCommand()
+        runner = lvm.BatchRunner(run)
+        run.release.clear()
+        t = start_thread(runner.run, "key1", ["lv1"])
+        try:
+            run.started.wait(2)
+            self.assertEqual(runner._queues, {"key1": []})
+        finally:
+            run.release.set()
+            t.join()
+        runner.run("key2", ["lv2"])
+        self.assertEqual(run.calls, [("key1", ("lv1",)),
+                                     ("key2", ("lv2",))])
+        self.assertEqual(runner._queues, {})
+
+    def test_failed_batch_retried_separately(self):
+        run = FakeCommand(fail_batch=True)
+        runner = lvm.BatchRunner(run)
+        results = self.run_concurrently(runner, run, "key", ["lv2", "lv3"])
+        self.assertEqual(run.calls, [("key", ("lv1",)),
+                                     ("key", ("lv2", "lv3")),
+                                     ("key", ("lv2",)),
+                                     ("key", ("lv3",))])
+        self.assertEqual(results, [(0, ["out"], []), (0, ["out"], [])])
+
+    def test_error(self):
+        def run(key, lvs):
+            raise OSError("no lvm")
+        runner = lvm.BatchRunner(run)
+        self.assertRaises(OSError, runner.run, "key", ["lv1"])
+        self.assertEqual(runner._queues, {})
+
+    def run_concurrently(self, runner, run, key, lvs):
+        """
+        Run lvs while another command with key is running, and return the
+        results.
+        """
+        results = []
+        run.release.clear()
+        first = start_thread(runner.run, key, ["lv1"])
+        try:
+            run.started.wait(2)
+            threads = []
+            for i, lv in enumerate(lvs):
+                threads.append(start_thread(
+                    lambda lv=lv: results.append(runner.run(key, [lv]))))
+                # Wait until the request is queued
+                while len(runner._queues[key]) <= i:
+                    time.sleep(0.01)
+        finally:
+            run.release.set()
+        first.join()
+        for t in threads:
+            t.join()
+        return results
+
+
+class LvchangeTests(TestCaseBase):
+
+    def setUp(self):
+        self.cache = lvm.LVMCache()
+        self.cache._getVGDevs = lambda vgNames: ()
+        self.calls = []
+        self.cache.cmd = lambda cmd, devices: (self.calls.append(cmd) or
+                                               (0, [], []))
+
+    def test_batchable(self):
+        options = lvm.LVM_NOBACKUP + ("--available", "y")
+        self.cache.lvchange("vg", ["lv1", "lv2"], options)
+        self.assertEqual(self.calls,
+                         [("lvchange",) + options + ("vg/lv1", "vg/lv2")])
+        self.assertEqual(self.cache._lvchangeRunner._queues, {})
+
+    def test_not_batchable(self):
+        options = lvm.LVM_NOBACKUP + ("--permission", "rw")
+        self.cache._lvchangeRunner = None
+        self.cache.lvchange("vg", ["lv1"], options)
+        self.assertEqual(self.calls, [("lvchange",) + options + ("vg/lv1",)])
+
+
+class CommandStatsTests(TestCaseBase):
+
+    def test_info(self):
+        stats = lvm.CommandStats()
+        stats.add("lvs", 0.5, False)
+        stats.add("lvs", 1.5, True)
+        self.assertEqual(stats.info(), {"lvs": {"count": 2, "errors": 1,
+                                                "total": 2.0, "max": 1.5}})
+
+
+def make_lv(name, vg_name="vg", tags=()):
+    return lvm.makeLV("uuid-" + name, name, vg_name, "-wi-a-----", "1024",
+                      "0", "/dev/mapper/pv", ",".join(tags))
+
+
+class VGLvsTests(TestCaseBase):
+
+    def test_put(self):
+        vglvs = lvm.VGLvs()
+        lv = make_lv("lv1", tags=("IU_img1", "PU_parent"))
+        vglvs.put("lv1", lv)
+        self.assertEqual(vglvs.get("lv1"), lv)
+        self.assertEqual(vglvs.byTag("IU_img1"), [lv])
+        self.assertEqual(vglvs.byTag("PU_parent"), [lv])
+        self.assertFalse(vglvs.hasStubs())
+
+    def test_replace_updates_tags(self):
+        vglvs = lvm.VGLvs()
+        vglvs.put("lv1", make_lv("lv1", tags=("IU_img1",)))
+        lv = make_lv("lv1", tags=("IU_img2",))
+        vglvs.put("lv1", lv)
+        self.assertEqual(vglvs.byTag("IU_img1"), [])
+        self.assertEqual(vglvs.byTag("IU_img2"), [lv])
+
+    def test_stub(self):
+        vglvs = lvm.VGLvs()
+        vglvs.put("lv1", make_lv("lv1", tags=("IU_img1",)))
+        vglvs.put("lv1", lvm.Stub("lv1", True))
+        self.assertTrue(vglvs.hasStubs())
+        self.assertEqual(vglvs.byTag("IU_img1"), [])
+        vglvs.pop("lv1")
+        self.assertFalse(vglvs.hasStubs())
+        self.assertEqual(len(vglvs), 0)
+
+
+class FakeLvs(object):
+    """
+    Fake lvm command returning lvs output for lvs, selecting lvs by "vg"
+    or "vg/lv" arguments like lvs.
+    """
+
+    def __init__(self, lvs):
+        self.lvs = lvs
+        self.calls = []
+        self.rc = 0
+
+    def __call__(self, cmd, devices=()):
+        self.calls.append(tuple(cmd))
+        if self.rc != 0:
+            return self.rc, [], ["fake lvs failure"]
+        args = cmd[len(lvm.LVS_CMD):]
+        rc = 0
+        if args:
+            selected = []
+            for arg in args:
+                if "/" in arg:
+                    vg_name, name = arg.split("/")
+                    found = [lv for lv in self.lvs
+                             if lv.vg_name == vg_name and lv.name == name]
+                    if not found:
+                        rc = 5
+                    selected.extend(found)
+                else:
+                    selected.extend(lv for lv in self.lvs
+                                    if lv.vg_name == arg)
+        else:
+            selected = self.lvs
+        out = [lvm.SEPARATOR.join((lv.uuid, lv.name, lv.vg_name,
+                                   "".join(lv.attr), lv.size,
+                                   lv.seg_start_pe, lv.devices,
+                                   ",".join(lv.tags)))
+               for lv in selected]
+        return rc, out, []
+
+
+class LVMCacheLvsTests(TestCaseBase):
+
+    def setUp(self):
+        self.lvs = [make_lv("lv1", "vg1", ("IU_img1", "PU_none")),
+                    make_lv("lv2", "vg1", ("IU_img1", "PU_lv1")),
+                    make_lv("lv3", "vg1", ("IU_img2", "PU_none")),
+                    make_lv("lv1", "vg2", ("IU_img1", "PU_none"))]
+        self.cache = lvm.LVMCache()
+        self.cache._getVGDevs = lambda vgNames: ()
+        self.cache.cmd = FakeLvs(self.lvs)
+
+    def test_reload_all(self):
+        lvs = self.cache.getAllLvs()
+        self.assertEqual(sorted(lvs), sorted(self.lvs))
+        self.assertEqual(len(self.cache.cmd.calls), 1)
+        self.cache.getAllLvs()
+        self.assertEqual(len(self.cache.cmd.calls), 1)
+
+    def test_get_vg_lvs(self):
+        self.cache.getAllLvs()
+        lvs = self.cache.getLv("vg1")
+        self.assertEqual(sorted(lv.name for lv in lvs), ["lv1", "lv2", "lv3"])
+        self.assertEqual(len(self.cache.cmd.calls), 1)
+
+    def test_stub_reloads_only_its_vg(self):
+        self.cache.getAllLvs()
+        self.cache._invalidatelvs("vg1", "lv1")
+        self.cache.getLv("vg2")
+        self.assertEqual(len(self.cache.cmd.calls), 1)
+        self.cache.getLv("vg1")
+        self.assertEqual(len(self.cache.cmd.calls), 2)
+
+    def test_refresh_stub(self):
+        self.cache.getAllLvs()
+        self.cache._invalidatelvs("vg1", "lv1")
+        lv = self.cache.getLv("vg1", "lv1")
+        self.assertEqual(lv, self.lvs[0])
+        self.assertEqual(self.cache.cmd.calls[-1],
+                         lvm.LVS_CMD + ("vg1/lv1",))
+        self.assertEqual(self.cache.refreshStats(),
+                         {"vg_reloads": 0, "vg_reloads_avoided": 1})
+
+    def test_refresh_stubs_together(self):
+        self.cache.getAllLvs()
+        self.cache._invalidatelvs("vg1", ["lv1", "lv2"])
+        self.cache.getLv("vg1", "lv1")
+        self.assertEqual(sorted(self.cache.cmd.calls[-1][len(lvm.LVS_CMD):]),
+                         ["vg1/lv1", "vg1/lv2"])
+        self.cache.getLv("vg1", "lv2")
+        self.assertEqual(len(self.cache.cmd.calls), 2)
+
+    def test_refresh_vg_stubs(self):
+        self.cache.getAllLvs()
+        self.cache._invalidatelvs("vg1", "lv3")
+        lvs = self.cache.getLv("vg1")
+        self.assertEqual(sorted(lv.name for lv in lvs), ["lv1", "lv2", "lv3"])
+        self.assertEqual(self.cache.cmd.calls[-1],
+                         lvm.LVS_CMD + ("vg1/lv3",))
+
+    def test_refresh_many_stubs_reloads_vg(self):
+        self.cache.getAllLvs()
+        self.cache._refreshMaxLvs = 1
+        self.cache._invalidatelvs("vg1", ["lv1", "lv2"])
+        self.cache.getLv("vg1", "lv1")
+        self.assertEqual(self.cache.cmd.calls[-1], lvm.LVS_CMD + ("vg1",))
+        self.assertEqual(self.cache.refreshStats(),
+                         {"vg_reloads": 1, "vg_reloads_avoided": 0})
+
+    def test_refresh_unknown_lv_reloads_vg(self):
+        self.cache.getAllLvs()
+        self.cache.cmd.lvs.append(make_lv("lv4", "vg1"))
+        lv = self.cache.getLv("vg1", "lv4")
+        self.assertEqual(lv.name, "lv4")
+        self.assertEqual(self.cache.cmd.calls[-1], lvm.LVS_CMD + ("vg1",))
+
+    def test_refresh_removed_lv_reloads_vg(self):
+        self.cache.getAllLvs()
+        self.cache._invalidatelvs("vg1", "lv3")
+        del self.cache.cmd.lvs[2]
+        self.assertEqual(self.cache.getLv("vg1", "lv3"), None)
+        self.assertEqual(self.cache.cmd.calls[-2],
+                         lvm.LVS_CMD + ("vg1/lv3",))
+        self.assertEqual(self.cache.cmd.calls[-1], lvm.LVS_CMD + ("vg1",))
+        self.assertEqual(self.cache.refreshStats(),
+                         {"vg_reloads": 1, "vg_reloads_avoided": 0})
+
+    def test_lvs_by_tag(self):
+        self.cache.getAllLvs()
+        lvs = self.cache.getLvsByTag("vg1", "IU_img1")
+        self.assertEqual(sorted(lv.name for lv in lvs), ["lv1", "lv2"])
+        lvs = self.cache.getLvsByTag("vg1", "PU_lv1")
+        self.assertEqual([lv.name for lv in lvs], ["lv2"])
+        self.assertEqual(self.cache.getLvsByTag("vg1", "IU_img3"), [])
+
+    def test_stale_lv_removed(self):
+        self.cache.getAllLvs()
+        self.cache._invalidatelvs("vg1")
+        self.cache.cmd.lvs = self.lvs[:2]
+        lvs = self.cache.getLv("vg1")
+        self.assertEqual(sorted(lv.name for lv in lvs), ["lv1", "lv2"])
+        self.assertEqual(self.cache.getLvsByTag("vg1", "IU_img2"), [])
+
+    def test_remove_lvs(self):
+        self.cache.getAllLvs()
+        self.cache._removelvs("vg1", ["lv2"])
+        lvs = self.cache.getLvsByTag("vg1", "IU_img1")
+        self.assertEqual([lv.name for lv in lvs], ["lv1"])
+
+    def test_lvs_by_tag_unknown_vg(self):
+        self.cache.getAllLvs()
+        self.assertRaises(se.LogicalVolumeDoesNotExistError,
+                          self.cache.getLvsByTag, "vg3", "IU_img1")
+
+    def test_lvs_by_tag_lvs_failure(self):
+        # Volume.getChildren() must not report no children on failures
+        self.cache.getAllLvs()
+        self.cache._invalidatelvs("vg1")
+        self.cache.cmd.rc = 5
+        self.assertRaises(se.LogicalVolumeDoesNotExistError,
+                          self.cache.getLvsByTag, "vg1", "PU_lv1")
+
+    def test_lvs_by_tag_invalidated_after_refresh(self):
+        self.cache.getAllLvs()
+        freshLvs = self.cache._freshLvs
+
+        def freshLvsThenInvalidate(vgName):
+            lvs = freshLvs(vgName)
+            # An lvchange in the same vg, after the refresh
+            self.cache._invalidatelvs(vgName, "lv1")
+            return lvs
+
+        self.cache._freshLvs = freshLvsThenInvalidate
+        lvs = self.cache.getLvsByTag("vg1", "IU_img1")
+        self.assertEqual([lv.name for lv in lvs], ["lv2"])
+
+
+class SlowLvs(FakeLvs):
+
+    def __init__(self, lvs, delay):
+        super(SlowLvs, self).__init__(lvs)
+        self.delay = delay
+
+    def __call__(self, cmd, devices=()):
+        time.sleep(self.delay)
+        return super(SlowLvs, self).__call__(cmd, devices)
+
+
+class LVMCacheConcurrencyTests(TestCaseBase):
+
+    VGS = 20
+    LVS = 10
+
+    def setUp(self):
+        lvs = [make_lv("lv%d" % i, "vg%d" % vg)
+               for vg in range(self.VGS) for i in range(self.LVS)]
+        self.cache = lvm.LVMCache()
+        self.cache._getVGDevs = lambda vgNames: ()
+        self.cache.cmd = SlowLvs(lvs, 0.01)
+        self.cache.getAllLvs()
+
+    def test_concurrent_vgs(self):
+        errors = []
+
+        def worker(vg):
+            try:
+                for i in range(self.LVS):
+                    lv = "lv%d" % i
+                    self.cache._invalidatelvs(vg, lv)
+                    self.assertEqual(self.cache.getLv(vg, lv).name, lv)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [start_thread(worker, "vg%d" % vg)
+                   for vg in range(self.VGS)]
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    @stresstest
+    def test_benchmark_concurrent_vgs(self):
+        iterations = 20
+
+        def worker(vg):
+            for i in range(iterations):
+                lv = "lv%d" % (i % self.LVS)
+                self.cache._invalidatelvs(vg, lv)
+                self.cache.getLv(vg, lv)
+                self.cache.getLv(vg)
+
+        start = time.time()
+        threads = [start_thread(worker, "vg%d" % vg)
+                   for vg in range(self.VGS)]
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+
+        print()
+        print("%d vgs, %d refreshes per vg: %.3f seconds" %
+              (self.VGS, iterations, elapsed))
@@ -233,6 +233,75 @@ class VmDispatcherTests(TestCaseBase):
                     vm_id, vm_id)
 
 
+class DriveWatermarkMonitorTests(TestCaseBase):
+
+    def setUp(self):
+        self.cif = fake.ClientIF()
+        self.conn = _FakeBulkConnection()
+        for i in range(VM_NUM):
+            vm_id = _fake_vm_id(i)
+            self.cif.vmContainer[vm_id] = _FakeWatermarkVM(vm_id)
+
+    def monitor(self, exc=None, fallback_every=1):
+        return periodic.DriveWatermarkMonitor(
+            self.conn, self.cif.getVMs,
+            _FakeExecutor() if exc is None else exc, 0,
+            fallback_every=fallback_every)
+
+    def test_single_bulk_call(self):
+        self.monitor()()
+        self.assertEqual(len(self.conn.calls), 1)
+        self.assertEqual(sorted(self.conn.calls[0]),
+                         sorted(self.cif.getVMs().keys()))
+
+    def test_extend_only_needed(self):
+        vms = self.cif.getVMs()
+        vms[_fake_vm_id(1)].drives = ['vda']
+        vms[_fake_vm_id(3)].drives = ['vda', 'vdb']
+        self.monitor()()
+        for vm_id, vm_obj in vms.iteritems():
+            self.assertEqual(vm_obj.extended, [vm_obj.drives] if
+                             vm_obj.drives else [])
+
+    def test_skip_vms(self):
+        vms = self.cif.getVMs()
+        vms[_fake_vm_id(0)].ready = False
+        vms[_fake_vm_id(1)].chunked = False
+        vms[_fake_vm_id(2)].stats_enabled = False
+        skipped = self.monitor()()
+        self.assertEqual(skipped, [_fake_vm_id(0)])
+        self.assertEqual(sorted(self.conn.calls[0]),
+                         [_fake_vm_id(i) for i in range(3, VM_NUM)])
+
+    def test_no_vms(self):
+        for vm_obj in self.cif.getVMs().itervalues():
+            vm_obj.chunked = False
+        self.monitor()()
+        self.assertEqual(self.conn.calls, [])
+
+    def test_fallback(self):
+        vms = self.cif.getVMs()
+        for vm_obj in vms.itervalues():
+            vm_obj.needs_polling = False
+        vms[_fake_vm_id(0)].needs_polling = True
+        monitor = self.monitor(fallback_every=3)
+        for i in range(4):
+            monitor()
+        all_vms = sorted(vms.keys())
+        self.assertEqual([sorted(call) for call in self.conn.calls],
+                         [all_vms,
+                          [_fake_vm_id(0)],
+                          [_fake_vm_id(0)],
+                          all_vms])
+
+    def test_dispatch_fails(self):
+        vms = self.cif.getVMs()
+        for vm_obj in vms.itervalues():
+            vm_obj.drives = ['vda']
+        skipped = self.monitor(_FakeExecutor(fail=True))()
+        self.assertEqual(set(skipped), set(vms.keys()))
+
+
 def _fake_vm_id(i):
     return 'VM-%03i' % i
 
@@ -295,3 +364,52 @@ class _FakeVM(object):
     def __init__(self, vmId, vmName):
         self.id = vmId
         self.name = vmName
+
+
+class _FakeDomain(object):
+    def __init__(self, vm):
+        self.vm = vm
+        # Like virdomain.Notifying, wrapping the libvirt domain
+        self._dom = self
+
+    def UUIDString(self):
+        return self.vm.id
+
+
+class _FakeWatermarkVM(object):
+    def __init__(self, vm_id):
+        self.id = vm_id
+        self._dom = _FakeDomain(self)
+        self.ready = True
+        self.chunked = True
+        self.stats_enabled = True
+        self.needs_polling = True
+        self.drives = []
+        self.extended = []
+
+    def isDisksStatsCollectionEnabled(self):
+        return self.stats_enabled
+
+    def hasChunkedDrives(self):
+        return self.chunked
+
+    def isDomainReadyForCommands(self):
+        return self.ready
+
+    def needsWatermarkPolling(self):
+        return self.needs_polling
+
+    def getDrivesToExtend(self, stats):
+        return stats['drives']
+
+    def extendDrivesIfNeeded(self, drives=None):
+        self.extended.append(drives)
+
+
+class _FakeBulkConnection(object):
+    def __init__(self):
+        self.calls = []
+
+    def domainListGetStats(self, doms, stats, flags=0):
+        self.calls.append([dom.UUIDString() for dom in doms])
+        return [(dom, {'drives': dom.vm.drives}) for dom in doms]
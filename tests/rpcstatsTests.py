@@ -0,0 +1,85 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from vdsm import rpcstats
+
+from testlib import VdsmTestCase as TestCaseBase
+
+
+class HistogramTests(TestCaseBase):
+
+    def test_empty(self):
+        info = rpcstats.Histogram().info()
+        self.assertEqual(info['count'], 0)
+        self.assertEqual(info['avg'], 0.0)
+        self.assertEqual(info['p90'], 0.0)
+        self.assertEqual(info['buckets'], {})
+
+    def test_buckets(self):
+        histogram = rpcstats.Histogram(buckets=(1, 2, 5))
+        for value in (0.5, 1, 1.5, 3, 10):
+            histogram.add(value)
+        info = histogram.info()
+        self.assertEqual(info['count'], 5)
+        self.assertEqual(info['total'], 16.0)
+        self.assertEqual(info['max'], 10)
+        self.assertEqual(info['buckets'],
+                         {'1': 2, '2': 1, '5': 1, 'inf': 1})
+
+    def test_percentile(self):
+        histogram = rpcstats.Histogram(buckets=(1, 2, 5))
+        for value in [0.5] * 90 + [1.5] * 9 + [10]:
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(50), 1)
+        self.assertEqual(histogram.percentile(90), 1)
+        self.assertEqual(histogram.percentile(99), 2)
+        self.assertEqual(histogram.percentile(100), 10)
+
+
+class RpcStatsTests(TestCaseBase):
+
+    def test_add(self):
+        stats = rpcstats.RpcStats()
+        stats.add(rpcstats.JSONRPC, 'Host.getStats', rpcstats.QUEUE, 0.1)
+        stats.add(rpcstats.JSONRPC, 'Host.getStats', rpcstats.DISPATCH, 0.2)
+        stats.add(rpcstats.JSONRPC, 'Host.getStats', rpcstats.DISPATCH, 0.3)
+        stats.add_error(rpcstats.JSONRPC, 'Host.getStats')
+        stats.add(rpcstats.XMLRPC, 'getVdsStats', rpcstats.DISPATCH, 0.4)
+
+        info = stats.info()
+        method = info[rpcstats.JSONRPC]['Host.getStats']
+        self.assertEqual(method['calls'], 2)
+        self.assertEqual(method['errors'], 1)
+        self.assertEqual(sorted(method['latency']),
+                         [rpcstats.DISPATCH, rpcstats.QUEUE])
+        self.assertEqual(method['latency'][rpcstats.DISPATCH]['count'], 2)
+        self.assertEqual(info[rpcstats.XMLRPC]['getVdsStats']['calls'], 1)
+
+    def test_clock_backwards(self):
+        stats = rpcstats.RpcStats()
+        stats.add(rpcstats.JSONRPC, 'Host.getStats', rpcstats.DISPATCH, -1)
+        latency = stats.info()[rpcstats.JSONRPC]['Host.getStats']['latency']
+        self.assertEqual(latency[rpcstats.DISPATCH]['total'], 0.0)
+
+    def test_clear(self):
+        stats = rpcstats.RpcStats()
+        stats.add(rpcstats.JSONRPC, 'Host.getStats', rpcstats.DISPATCH, 0.1)
+        stats.clear()
+        self.assertEqual(stats.info(), {})
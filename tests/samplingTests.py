@@ -28,12 +28,13 @@ import threading
 import time
 
 from vdsm import ipwrapper
+from vdsm import utils
 from vdsm.password import ProtectedPassword
 import virt.sampling as sampling
 
 import caps
 
-from testValidation import brokentest, ValidateRunningAsRoot
+from testValidation import brokentest, stresstest, ValidateRunningAsRoot
 from testlib import permutations, expandPermutations
 from testlib import VdsmTestCase as TestCaseBase
 from monkeypatch import MonkeyPatchScope
@@ -472,6 +473,139 @@ class StatsCacheTests(TestCaseBase):
         self.assertEqual(self.cache.get('b'),
                          sampling.EMPTY_SAMPLE)
 
+    def test_metrics_empty_sample(self):
+        self.assertIsNone(self.cache.metrics('a', sampling.EMPTY_SAMPLE))
+
+    def test_metrics_computed_once_per_sample(self):
+        self._feed_cache((
+            ({'a': {'cpu.time': 1}}, 1),
+            ({'a': {'cpu.time': 2}}, 2)
+        ))
+        metrics = self.cache.metrics('a', self.cache.get('a'))
+        self.assertIs(self.cache.metrics('a', self.cache.get('a')), metrics)
+
+    def test_metrics_recomputed_after_put(self):
+        self._feed_cache((
+            ({'a': {'cpu.time': 1}}, 1),
+            ({'a': {'cpu.time': 2}}, 2)
+        ))
+        metrics = self.cache.metrics('a', self.cache.get('a'))
+        self._feed_cache((
+            ({'a': {'cpu.time': 3}}, 3),
+        ))
+        self.assertIsNot(self.cache.metrics('a', self.cache.get('a')),
+                         metrics)
+
+    def test_metrics_of_old_sample_not_cached(self):
+        self._feed_cache((
+            ({'a': {'cpu.time': 1}}, 1),
+            ({'a': {'cpu.time': 2}}, 2)
+        ))
+        old_sample = self.cache.get('a')
+        self._feed_cache((
+            ({'a': {'cpu.time': 3}}, 3),
+        ))
+        self.cache.metrics('a', old_sample)
+        self.assertNotIn('a', self.cache._metrics)
+
     def _feed_cache(self, samples):
         for sample in samples:
             self.cache.put(*sample)
+
+
+class StatsSnapshotTests(TestCaseBase):
+
+    def setUp(self):
+        self.clock = 0
+        self.cache = sampling.StatsCache(clock=self.fake_monotonic_time)
+        self.snapshot = sampling.StatsSnapshot(
+            self.cache, 5, clock=self.fake_monotonic_time)
+        self.vms = [FakeStatsVM('a'), FakeStatsVM('b')]
+
+    def fake_monotonic_time(self):
+        return self.clock
+
+    def test_reuse(self):
+        stats = self.snapshot.get(self.vms)
+        self.assertEqual(stats, [{'vmId': 'a'}, {'vmId': 'b'}])
+        self.assertIs(self.snapshot.get(self.vms), stats)
+        self.assertEqual([vm.calls for vm in self.vms], [1, 1])
+
+    def test_new_sample(self):
+        stats = self.snapshot.get(self.vms)
+        self.cache.put({'a': {}, 'b': {}}, self.clock)
+        self.assertIsNot(self.snapshot.get(self.vms), stats)
+
+    def test_invalidate(self):
+        stats = self.snapshot.get(self.vms)
+        self.snapshot.invalidate()
+        self.assertIsNot(self.snapshot.get(self.vms), stats)
+
+    def test_vms_changed(self):
+        self.snapshot.get(self.vms)
+        stats = self.snapshot.get(self.vms[:1])
+        self.assertEqual(stats, [{'vmId': 'a'}])
+
+    def test_expired(self):
+        stats = self.snapshot.get(self.vms)
+        self.clock = 4
+        self.assertIs(self.snapshot.get(self.vms), stats)
+        self.clock = 5
+        self.assertIsNot(self.snapshot.get(self.vms), stats)
+
+    def test_disabled(self):
+        snapshot = sampling.StatsSnapshot(self.cache, 0)
+        stats = snapshot.get(self.vms)
+        self.assertIsNot(snapshot.get(self.vms), stats)
+
+    @stresstest
+    def test_benchmark_concurrent_pollers(self):
+        vms = [FakeStatsVM(str(i), disks=4) for i in range(100)]
+        for pollers in (1, 4, 16):
+            for max_age in (0, 5):
+                snapshot = sampling.StatsSnapshot(self.cache, max_age)
+                calls = self._poll(snapshot, vms, pollers, 1.0)
+                print("%d pollers, max_age=%d: %.1f calls per second" %
+                      (pollers, max_age, calls))
+
+    def _poll(self, snapshot, vms, pollers, duration):
+        calls = [0] * pollers
+        deadline = time.time() + duration
+
+        def poll(n):
+            while time.time() < deadline:
+                snapshot.get(vms)
+                calls[n] += 1
+
+        def change_status():
+            # Simulate frequent VM status change events
+            while time.time() < deadline:
+                time.sleep(0.1)
+                snapshot.invalidate()
+
+        threads = [threading.Thread(target=poll, args=(n,))
+                   for n in range(pollers)]
+        threads.append(threading.Thread(target=change_status))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return sum(calls) / duration
+
+
+class FakeStatsVM(object):
+
+    def __init__(self, vmid, disks=0):
+        self.id = vmid
+        self.calls = 0
+        self._stats = {'vmId': vmid}
+        if disks:
+            # Similar in size to real VM stats
+            self._stats.update(('key%d' % i, str(i)) for i in range(40))
+            self._stats['disks'] = dict(
+                ('vd%d' % i, dict(('key%d' % j, str(j)) for j in range(20)))
+                for i in range(disks))
+
+    def getStats(self):
+        self.calls += 1
+        return utils.picklecopy(self._stats)
@@ -17,7 +17,14 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+from __future__ import print_function
+import os
+import time
+
+from monkeypatch import MonkeyPatchScope
 from testlib import VdsmTestCase as TestCaseBase
+from testlib import namedTemporaryDir
+from testValidation import stresstest
 from rpc import vdsmapi
 
 
@@ -92,3 +99,88 @@ class SchemaTest(TestCaseBase):
     def testTokenizeRaiseOnInvalidData(self):
         generator = vdsmapi.tokenize("{'a': invalid, 'b': 'c'}")
         self.assertRaises(ValueError, list, generator)
+
+
+class SchemaCacheTest(TestCaseBase):
+
+    def setUp(self):
+        self.saved_api_info = vdsmapi._api_info
+
+    def tearDown(self):
+        vdsmapi._api_info = self.saved_api_info
+
+    def load(self):
+        vdsmapi._api_info = None
+        return vdsmapi.get_api()
+
+    def testCreateCache(self):
+        with namedTemporaryDir() as tmpdir:
+            with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: tmpdir)]):
+                info = self.load()
+                cached = self.load()
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+        self.assertEqual(cached, info)
+        self.assertNotEqual(cached, {})
+
+    def testUseCache(self):
+        with namedTemporaryDir() as tmpdir:
+            with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: tmpdir)]):
+                self.load()
+                with MonkeyPatchScope([(vdsmapi, '_build_api_info',
+                                        lambda contents: self.fail())]):
+                    self.load()
+
+    def testInvalidCache(self):
+        with namedTemporaryDir() as tmpdir:
+            with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: tmpdir)]):
+                info = self.load()
+                path = os.path.join(tmpdir, os.listdir(tmpdir)[0])
+                with open(path, 'w') as f:
+                    f.write('invalid')
+                self.assertEqual(self.load(), info)
+
+    def testRemoveStaleCache(self):
+        with namedTemporaryDir() as tmpdir:
+            stale = os.path.join(tmpdir, 'vdsmapi-stale.pickle')
+            with open(stale, 'w') as f:
+                f.write('stale')
+            with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: tmpdir)]):
+                self.load()
+            self.assertFalse(os.path.exists(stale))
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+    def testMissingCacheDir(self):
+        with namedTemporaryDir() as tmpdir:
+            missing = os.path.join(tmpdir, 'missing')
+            with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: missing)]):
+                self.assertTrue(isinstance(self.load(), dict))
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    def testCachePathChangesWithContent(self):
+        with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: '/cache')]):
+            self.assertNotEqual(vdsmapi._cache_path(['a', 'b']),
+                                vdsmapi._cache_path(['a', 'c']))
+            self.assertEqual(vdsmapi._cache_path(['a', 'b']),
+                             vdsmapi._cache_path(['a', 'b']))
+
+    @stresstest
+    def testBenchmarkStartup(self):
+        count = 10
+        with namedTemporaryDir() as tmpdir:
+            missing = os.path.join(tmpdir, 'missing')
+            with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: missing)]):
+                start = time.time()
+                for i in range(count):
+                    self.load()
+                parse = (time.time() - start) / count
+
+            with MonkeyPatchScope([(vdsmapi, '_cache_dir', lambda: tmpdir)]):
+                self.load()
+                start = time.time()
+                for i in range(count):
+                    self.load()
+                cached = (time.time() - start) / count
+
+        print()
+        print("get_api: parse %.3f seconds, cached %.3f seconds" %
+              (parse, cached))
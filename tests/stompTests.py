@@ -17,16 +17,20 @@
 #
 # Refer to the README and COPYING files for full details of the license
 #
+from __future__ import print_function
 import threading
+import time
 from uuid import uuid4
 
 from testlib import VdsmTestCase as TestCaseBase, \
     expandPermutations, \
     permutations, \
     dummyTextGenerator
+from testValidation import stresstest
 
 from integration.jsonRpcHelper import constructAcceptor
 from integration.m2chelper import DEAFAULT_SSL_CONTEXT
+from yajsonrpc import ChunkedMessage, stomp
 from yajsonrpc.stompreactor import StandAloneRpcClient
 from vdsm.utils import running
 
@@ -89,3 +93,215 @@ class StompTests(TestCaseBase):
             client.callMethod("event", [], str(uuid4()))
             done.wait(timeout=CALL_TIMEOUT)
             self.assertTrue(done.is_set())
+
+
+def _encoded_frame(body, headers=None):
+    frame = stomp.Frame(stomp.Command.SEND,
+                        {'destination': 'jms.topic.vdsm_requests'},
+                        body)
+    if headers is not None:
+        frame.headers.update(headers)
+    return frame.encode()
+
+
+def _chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@expandPermutations
+class ParserTests(TestCaseBase):
+
+    @permutations([[1], [7], [4096], [1024 * 1024]])
+    def test_frames(self, chunk_size):
+        bodies = ['', 'a', 'x' * 10000, dummyTextGenerator(100000)]
+        data = ''.join(_encoded_frame(body) for body in bodies)
+        parser = stomp.Parser()
+        for chunk in _chunks(data, chunk_size):
+            parser.parse(chunk)
+
+        self.assertEqual(parser.pending, len(bodies))
+        for body in bodies:
+            frame = parser.popFrame()
+            self.assertEqual(frame.command, stomp.Command.SEND)
+            self.assertEqual(frame.headers['destination'],
+                             'jms.topic.vdsm_requests')
+            self.assertEqual(frame.body, body)
+        self.assertEqual(parser.popFrame(), None)
+
+    def test_body_without_content_length(self):
+        parser = stomp.Parser()
+        parser.parse('SEND\ndestination:a\n\nbody\0')
+        frame = parser.popFrame()
+        self.assertEqual(frame.body, 'body')
+
+    def test_heartbeats(self):
+        parser = stomp.Parser()
+        parser.parse('\n\r\n' + _encoded_frame('body') + '\n\n')
+        self.assertEqual(parser.pending, 1)
+        self.assertEqual(parser.popFrame().body, 'body')
+
+    def test_repeated_header(self):
+        parser = stomp.Parser()
+        parser.parse('SEND\na:1\na:2\n\n\0')
+        self.assertEqual(parser.popFrame().headers['a'], '1')
+
+    def test_missing_terminator(self):
+        parser = stomp.Parser()
+        self.assertRaises(RuntimeError, parser.parse,
+                          'SEND\ncontent-length:2\n\nabc\0')
+
+    def test_copy_once(self):
+        body = 'x' * 1000000
+        data = _encoded_frame(body)
+        parser = stomp.Parser()
+        for chunk in _chunks(data, 4096):
+            parser.parse(chunk)
+        self.assertEqual(parser.popFrame().body, body)
+        # Every byte is copied out of the buffer once, and buffer compaction
+        # never moves more than the data received in the last chunk.
+        self.assertTrue(parser.copied < len(data) + 4096)
+
+    def test_copied(self):
+        parser = stomp.Parser()
+        parser.parse('SEND\na:1\n\nbody\0')
+        # Command, header and body, without the terminators.
+        self.assertEqual(parser.copied, len('SEND') + len('a:1') + len('body'))
+
+
+class _FakeFrameHandler(object):
+
+    def __init__(self, frames):
+        self._outbox = list(frames)
+
+    @property
+    def has_outgoing_messages(self):
+        return len(self._outbox) > 0
+
+    def pop_message(self):
+        return self._outbox.pop(0)
+
+
+class _FakeSocketDispatcher(object):
+
+    def __init__(self, max_send=None):
+        self.sent = []
+        self._max_send = max_send
+
+    def send(self, data):
+        if self._max_send is not None:
+            data = data[:self._max_send]
+        self.sent.append(data)
+        return len(data)
+
+
+class AsyncDispatcherWriteTests(TestCaseBase):
+
+    def test_coalesce_frames(self):
+        frames = [stomp.Frame(stomp.Command.MESSAGE, {}, str(i))
+                  for i in range(10)]
+        handler = _FakeFrameHandler(frames)
+        async_dispatcher = stomp.AsyncDispatcher(None, handler)
+        dispatcher = _FakeSocketDispatcher()
+        async_dispatcher.handle_write(dispatcher)
+
+        self.assertFalse(handler.has_outgoing_messages)
+        self.assertEqual(dispatcher.sent,
+                         [''.join(f.encode() for f in frames)])
+        self.assertEqual(async_dispatcher.frames_sent, 10)
+        self.assertEqual(async_dispatcher.sends, 1)
+
+    def test_max_batch_size(self):
+        frames = [stomp.Frame(stomp.Command.MESSAGE, {}, 'x' * 100)
+                  for i in range(10)]
+        handler = _FakeFrameHandler(frames)
+        async_dispatcher = stomp.AsyncDispatcher(None, handler,
+                                                 maxBatchSize=200)
+        dispatcher = _FakeSocketDispatcher()
+        while async_dispatcher.writable(dispatcher):
+            async_dispatcher.handle_write(dispatcher)
+
+        self.assertEqual(len(dispatcher.sent), 5)
+        self.assertEqual(''.join(dispatcher.sent),
+                         ''.join(f.encode() for f in frames))
+
+    def test_partial_send(self):
+        frames = [stomp.Frame(stomp.Command.MESSAGE, {}, 'x' * 100)
+                  for i in range(3)]
+        handler = _FakeFrameHandler(frames)
+        async_dispatcher = stomp.AsyncDispatcher(None, handler)
+        dispatcher = _FakeSocketDispatcher(max_send=7)
+        while async_dispatcher.writable(dispatcher):
+            async_dispatcher.handle_write(dispatcher)
+
+        self.assertEqual(''.join(dispatcher.sent),
+                         ''.join(f.encode() for f in frames))
+        self.assertEqual(async_dispatcher.frames_sent, 3)
+
+    def test_chunked_body(self):
+        chunks = ['x' * 100, 'y' * 100, 'z' * 100]
+        frame = stomp.Frame(stomp.Command.MESSAGE, {}, chunks)
+        handler = _FakeFrameHandler([frame])
+        async_dispatcher = stomp.AsyncDispatcher(None, handler)
+        dispatcher = _FakeSocketDispatcher()
+        while async_dispatcher.writable(dispatcher):
+            async_dispatcher.handle_write(dispatcher)
+
+        expected = stomp.Frame(stomp.Command.MESSAGE, {}, ''.join(chunks))
+        self.assertEqual(''.join(dispatcher.sent), expected.encode())
+        self.assertEqual(dispatcher.sent[1], chunks[1])
+        self.assertEqual(async_dispatcher.sends, 3)
+
+    def test_on_sent(self):
+        sent = []
+        body = ChunkedMessage(['x' * 100], on_sent=lambda: sent.append(True))
+        frame = stomp.Frame(stomp.Command.MESSAGE, {}, body)
+        handler = _FakeFrameHandler([frame])
+        async_dispatcher = stomp.AsyncDispatcher(None, handler)
+        dispatcher = _FakeSocketDispatcher(max_send=7)
+        async_dispatcher.handle_write(dispatcher)
+        self.assertEqual(sent, [])
+
+        while async_dispatcher.writable(dispatcher):
+            async_dispatcher.handle_write(dispatcher)
+        self.assertEqual(sent, [True])
+
+
+class FrameTests(TestCaseBase):
+
+    def test_encode_chunks(self):
+        frame = stomp.Frame(stomp.Command.MESSAGE, {}, ['abc', 'def', 'gh'])
+        self.assertEqual(frame.encode_chunks(),
+                         ['MESSAGE\ncontent-length:8\n\nabc', 'def', 'gh\0'])
+
+    def test_encode_single_chunk(self):
+        frame = stomp.Frame(stomp.Command.MESSAGE, {}, ['abc'])
+        self.assertEqual(frame.encode_chunks(),
+                         ['MESSAGE\ncontent-length:3\n\nabc\0'])
+
+    def test_encode_chunked_like_body(self):
+        chunked = stomp.Frame(stomp.Command.MESSAGE, {}, ['abc', 'def'])
+        frame = stomp.Frame(stomp.Command.MESSAGE, {}, 'abcdef')
+        self.assertEqual(chunked.encode(), frame.encode())
+
+
+@expandPermutations
+class ParserBenchmarkTests(TestCaseBase):
+
+    @stresstest
+    @permutations([[1024, 10000], [64 * 1024, 1000], [4 * 1024 * 1024, 10]])
+    def test_parse(self, body_size, count):
+        data = _encoded_frame(dummyTextGenerator(body_size)) * count
+        parser = stomp.Parser()
+        start = time.time()
+        for chunk in _chunks(data, 4096):
+            parser.parse(chunk)
+            while parser.popFrame() is not None:
+                pass
+        elapsed = time.time() - start
+
+        print()
+        print("body size: %d frames: %d" % (body_size, count))
+        print("%.2f frames/s, %.2f MiB/s, %.2f bytes copied per frame"
+              % (count / elapsed, len(data) / elapsed / 1024 ** 2,
+                 parser.copied / float(count)))
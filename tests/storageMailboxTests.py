@@ -18,12 +18,17 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+from __future__ import print_function
+from functools import partial
 from uuid import uuid4
+import Queue
 import threading
 import os
 import shutil
+import time
 
 from testlib import VdsmTestCase as TestCaseBase
+from testValidation import stresstest
 
 import storage.storage_mailbox as sm
 from storage.sd import DOMAIN_META_DATA
@@ -31,17 +36,27 @@ from vdsm.utils import retry
 import tempfile
 
 
+MAX_HOSTS = 250
+
+
 class StoragePoolStub(object):
     def __init__(self):
         self.spUUID = str(uuid4())
         self.storage_repository = tempfile.mkdtemp(dir='/var/tmp')
-        self.__masterDir = os.path.join(self.storage_repository, self.spUUID,
-                                        "mastersd", DOMAIN_META_DATA)
+        self.masterDir = os.path.join(self.storage_repository, self.spUUID,
+                                      "mastersd", DOMAIN_META_DATA)
 
-        os.makedirs(self.__masterDir)
-        for fname in ["id", "inbox", "outbox"]:
-            with open(os.path.join(self.__masterDir, fname), "w") as f:
-                f.write("DATA")
+        os.makedirs(self.masterDir)
+        with open(os.path.join(self.masterDir, "id"), "w") as f:
+            f.write("DATA")
+        for fname in ["inbox", "outbox"]:
+            with open(os.path.join(self.masterDir, fname), "w") as f:
+                f.truncate(sm.MAILBOX_SIZE * MAX_HOSTS)
+        self.spmMailer = None
+        self.extended = Queue.Queue()
+
+    def extendVolume(self, sdUUID, volUUID, size):
+        self.extended.put((sdUUID, volUUID, size))
 
     def __del__(self):
         # rmtree removes the folder as well
@@ -56,3 +71,153 @@ class SPM_MailMonitorTests(TestCaseBase):
         mailer.run()
         t = lambda: self.assertEquals(threadCount, len(threading.enumerate()))
         retry(AssertionError, t, timeout=4, sleep=0.1)
+
+
+class PollIntervalTests(TestCaseBase):
+
+    def test_idle(self):
+        interval = sm._PollInterval(0.2, 2)
+        self.assertEqual(interval.next(), 2)
+        self.assertEqual(interval.next(), 2)
+
+    def test_backoff(self):
+        interval = sm._PollInterval(0.25, 2)
+        interval.reset()
+        self.assertEqual([interval.next() for i in range(5)],
+                         [0.25, 0.5, 1, 2, 2])
+
+    def test_minimum_larger_than_maximum(self):
+        interval = sm._PollInterval(2, 0.5)
+        interval.reset()
+        self.assertEqual(interval.next(), 0.5)
+
+
+class MailboxRoundTripTests(TestCaseBase):
+
+    HOST_ID = 7
+    INTERVAL = 0.05
+
+    def setUp(self):
+        self.start(self.INTERVAL)
+
+    def start(self, monitorInterval, minInterval=None):
+        self.pool = StoragePoolStub()
+        self.spm = sm.SPM_MailMonitor(self.pool, MAX_HOSTS,
+                                      monitorInterval=monitorInterval,
+                                      minInterval=minInterval)
+        self.pool.spmMailer = self.spm
+        self.spm.registerMessageType(sm.EXTEND_CODE, partial(
+            sm.SPM_Extend_Message.processRequest, self.pool))
+        self.queue = Queue.Queue()
+        # The SPM's inbox is the HSM outbox and vice versa
+        self.hsm = sm.HSM_MailMonitor(
+            os.path.join(self.pool.masterDir, "outbox"),
+            os.path.join(self.pool.masterDir, "inbox"),
+            self.HOST_ID, self.queue, monitorInterval,
+            minInterval=minInterval)
+
+    def tearDown(self):
+        self.stop()
+
+    def stop(self):
+        self.hsm.immStop()
+        self.hsm.join()
+        self.hsm.tp.joinAll(waitForTasks=False)
+        self.spm.stop()
+        retry_until(self.spm.isStopped)
+
+    def extend(self, size):
+        done = threading.Event()
+        volumeData = {'poolID': self.pool.spUUID,
+                      'domainID': str(uuid4()),
+                      'volumeID': str(uuid4())}
+        msg = sm.SPM_Extend_Message(volumeData, size,
+                                    lambda volumeData: done.set())
+        self.queue.put(msg)
+        done.wait(10)
+        self.assertTrue(done.is_set())
+        return volumeData
+
+    def extend_async(self, size):
+        volumeData = {'poolID': self.pool.spUUID,
+                      'domainID': str(uuid4()),
+                      'volumeID': str(uuid4())}
+        self.queue.put(sm.SPM_Extend_Message(volumeData, size))
+
+    def test_extend(self):
+        volumeData = self.extend(1024)
+        self.assertEqual(self.pool.extended.get(False),
+                         (volumeData['domainID'], volumeData['volumeID'],
+                          1024))
+
+    def test_latency_stats(self):
+        self.extend(1024)
+        self.extend(2048)
+        info = self.hsm.latencyStats()
+        self.assertEqual(info['count'], 2)
+        self.assertTrue(0 <= info['p50'] <= info['max'])
+
+    def test_unchanged_mailboxes_skipped(self):
+        # Check for mail only from the test thread
+        self.spm.stop()
+        retry_until(self.spm.isStopped)
+        self.assertFalse(self.spm._checkForMail())
+        self.extend_async(1024)
+        retry_until(self.spm._checkForMail)
+        self.assertFalse(self.spm._checkForMail())
+
+    def test_invalid_mailbox_changed_once(self):
+        self.spm.stop()
+        retry_until(self.spm.isStopped)
+        with open(os.path.join(self.pool.masterDir, "inbox"), "r+") as f:
+            f.seek(3 * sm.MAILBOX_SIZE)
+            f.write("1xtnd" + "bad checksum")
+        self.assertTrue(self.spm._checkForMail())
+        self.assertFalse(self.spm._checkForMail())
+
+    @stresstest
+    def test_benchmark_round_trip(self):
+        count = 20
+        start = time.time()
+        for i in range(count):
+            self.extend(1024 + i)
+        elapsed = time.time() - start
+
+        print()
+        print("extend round trip: %.3f seconds (monitor interval %.3f)" %
+              (elapsed / count, self.INTERVAL))
+
+    @stresstest
+    def test_benchmark_check_for_mail(self):
+        count = 100
+        start = time.time()
+        for i in range(count):
+            self.spm._checkForMail()
+        elapsed = time.time() - start
+
+        print()
+        print("SPM check for mail, %d hosts: %.3f msec" %
+              (MAX_HOSTS, elapsed / count * 1000))
+
+    @stresstest
+    def test_benchmark_adaptive_polling(self):
+        count = 10
+        print()
+        for minInterval in (1, 0.1):
+            self.stop()
+            self.start(1, minInterval=minInterval)
+            for i in range(count):
+                self.extend(1024 + i)
+            info = self.hsm.latencyStats()
+            print("extend latency, interval 1-%.1f: avg=%.3f p50=%.3f "
+                  "p90=%.3f max=%.3f" % (minInterval, info['avg'],
+                                         info['p50'], info['p90'],
+                                         info['max']))
+
+
+def retry_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise RuntimeError("Timeout waiting for %s" % predicate)
+        time.sleep(0.05)
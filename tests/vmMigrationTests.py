@@ -18,7 +18,12 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+from collections import namedtuple
+from contextlib import contextmanager
 from itertools import tee, izip, product
+import logging
+import threading
+import time
 
 from vdsm.config import config
 from virt import migration
@@ -27,6 +32,7 @@ from monkeypatch import MonkeyPatchScope
 from testlib import VdsmTestCase as TestCaseBase
 from testlib import permutations, expandPermutations
 from testlib import make_config
+from testValidation import stresstest
 import vmfakelib as fake
 
 
@@ -129,6 +135,389 @@ class TestVmMigrationDowntimeSequence(TestCaseBase):
 
 
 # stolen^Wborrowed from itertools recipes
+class MigrationSchedulerTests(TestCaseBase):
+
+    def test_fixed_bandwidth(self):
+        scheduler = migration.MigrationScheduler(2, 32)
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, None)
+        self.assertEqual(ticket.bandwidth, 32)
+
+    def test_max_migrations(self):
+        scheduler = migration.MigrationScheduler(1, 32)
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, None)
+        with admitting(scheduler, 1024) as waiting:
+            self.assertFalse(waiting.admitted.wait(0.1))
+            scheduler.release(ticket)
+            self.assertTrue(waiting.admitted.wait(1))
+
+    def test_cheapest_first(self):
+        scheduler = migration.MigrationScheduler(1, 32)
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, None)
+        with admitting(scheduler, 8192) as expensive:
+            expensive.queued.wait(1)
+            with admitting(scheduler, 2048) as cheap:
+                cheap.queued.wait(1)
+                scheduler.release(ticket)
+                self.assertTrue(cheap.admitted.wait(1))
+                self.assertFalse(expensive.admitted.wait(0.1))
+                scheduler.release(cheap.ticket)
+                self.assertTrue(expensive.admitted.wait(1))
+
+    def test_waiting_too_long_goes_first(self):
+        clock = FakeClock()
+        scheduler = migration.MigrationScheduler(1, 32, max_wait=60,
+                                                 clock=clock)
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, None)
+        with admitting(scheduler, 8192) as expensive:
+            clock.now = 30
+            with admitting(scheduler, 2048) as cheap:
+                clock.now = 61
+                scheduler.release(ticket)
+                self.assertTrue(expensive.admitted.wait(1))
+                self.assertFalse(cheap.admitted.wait(0.1))
+                scheduler.release(expensive.ticket)
+                self.assertTrue(cheap.admitted.wait(1))
+
+    def test_no_starvation(self):
+        # Cheap migrations keep arriving while evacuating the host
+        clock = FakeClock()
+        scheduler = migration.MigrationScheduler(1, 32, max_wait=60,
+                                                 clock=clock)
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, None)
+        with admitting(scheduler, 8192) as expensive:
+            for i in range(10):
+                clock.now += 10
+                cheap = start_admitting(scheduler, 1024)
+                scheduler.release(ticket)
+                if expensive.admitted.wait(0.1):
+                    break
+                self.assertTrue(cheap.admitted.wait(1))
+                ticket = cheap.ticket
+            self.assertTrue(expensive.admitted.is_set())
+            self.assertEqual(clock.now, 60)
+
+    def test_first_uses_total_bandwidth(self):
+        scheduler = migration.MigrationScheduler(4, 32, 1000)
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, None)
+        self.assertEqual(ticket.bandwidth, 1000)
+
+    def test_no_spare_bandwidth(self):
+        scheduler = migration.MigrationScheduler(4, 32, 1000)
+        scheduler.admit(FakeMigrationVM(), 1024, None)
+        with admitting(scheduler, 1024) as waiting:
+            self.assertFalse(waiting.admitted.wait(0.1))
+
+    def test_spare_bandwidth(self):
+        scheduler = migration.MigrationScheduler(4, 32, 1000)
+        speeds = []
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, speeds.append)
+        with admitting(scheduler, 1024) as waiting:
+            self.assertFalse(waiting.admitted.wait(0.1))
+            # Limited by something else, leaving spare bandwidth
+            scheduler.update(ticket, 300)
+            self.assertTrue(waiting.admitted.wait(1))
+        self.assertEqual(ticket.bandwidth, 375)
+        self.assertEqual(speeds, [375])
+        self.assertEqual(waiting.ticket.bandwidth, 625)
+
+    def test_release_redistributes(self):
+        scheduler = migration.MigrationScheduler(4, 32, 1000)
+        speeds = []
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, speeds.append)
+        scheduler.update(ticket, 100)
+        other = scheduler.admit(FakeMigrationVM(), 1024, None)
+        scheduler.update(ticket, 500)
+        self.assertEqual(ticket.bandwidth, 500)
+        scheduler.release(other)
+        self.assertEqual(ticket.bandwidth, 1000)
+        self.assertEqual(speeds, [125, 500, 1000])
+
+    def test_small_change_ignored(self):
+        scheduler = migration.MigrationScheduler(4, 32, 1000)
+        speeds = []
+        ticket = scheduler.admit(FakeMigrationVM(), 1024, speeds.append)
+        scheduler.update(ticket, 790)
+        self.assertEqual(ticket.bandwidth, 1000)
+        self.assertEqual(speeds, [])
+
+
+class ConvergencePolicyTests(TestCaseBase):
+
+    def test_initial_downtime(self):
+        policy = migration.ConvergencePolicy(1000, steps=10)
+        actions = policy.sample(0, 0, 4096 * MiB)
+        downtime = next(migration.exponential_downtime(1000, 10))
+        self.assertEqual(actions, [(migration.ACTION_DOWNTIME, downtime)])
+
+    def test_rates(self):
+        policy = migration.ConvergencePolicy(1000)
+        policy.sample(0, 0, 4096 * MiB)
+        policy.sample(1, 100 * MiB, 4016 * MiB)
+        self.assertEqual(policy.transfer_rate, 100 * MiB)
+        self.assertEqual(policy.dirty_rate, 20 * MiB)
+
+    def test_converging(self):
+        policy = migration.ConvergencePolicy(1000)
+        policy.sample(0, 0, 4096 * MiB)
+        self.assertEqual(policy.sample(1, 100 * MiB, 4016 * MiB), [])
+
+    def test_raise_downtime(self):
+        policy = migration.ConvergencePolicy(1000, steps=10)
+        policy.sample(0, 0, 100 * MiB)
+        # Dirty rate equal to transfer rate, needs 60 * 1.2 / 100 seconds
+        actions = policy.sample(1, 100 * MiB, 60 * MiB)
+        actions = policy.sample(2, 200 * MiB, 60 * MiB)
+        self.assertEqual(actions, [(migration.ACTION_DOWNTIME, 720)])
+        self.assertEqual(policy.sample(3, 300 * MiB, 60 * MiB), [])
+
+    def test_abort(self):
+        policy = migration.ConvergencePolicy(1000, steps=10,
+                                             abort_samples=2)
+        policy.sample(0, 0, 1024 * MiB)
+        actions = policy.sample(1, 100 * MiB, 1024 * MiB)
+        self.assertEqual(actions, [(migration.ACTION_DOWNTIME, 1000)])
+        actions = policy.sample(2, 200 * MiB, 1024 * MiB)
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(actions[0].action, migration.ACTION_ABORT)
+
+    def test_stalled_not_aborted(self):
+        policy = migration.ConvergencePolicy(1000, abort_samples=2)
+        policy.sample(0, 0, 1024 * MiB)
+        for i in range(1, 10):
+            self.assertEqual(policy.sample(i, 0, 1024 * MiB), [])
+
+    def test_stalled_then_progress(self):
+        policy = migration.ConvergencePolicy(1000)
+        policy.sample(0, 0, 4096 * MiB)
+        policy.sample(1, 0, 4096 * MiB)
+        self.assertEqual(policy.sample(2, 100 * MiB, 4016 * MiB), [])
+        self.assertEqual(policy.transfer_rate, 100 * MiB)
+
+    def test_converging_again(self):
+        policy = migration.ConvergencePolicy(1000, abort_samples=2)
+        policy.sample(0, 0, 1024 * MiB)
+        policy.sample(1, 100 * MiB, 1024 * MiB)
+        policy.sample(2, 200 * MiB, 824 * MiB)
+        policy.sample(3, 300 * MiB, 624 * MiB)
+        self.assertEqual(policy.sample(4, 400 * MiB, 424 * MiB), [])
+
+    def test_simulated_non_converging(self):
+        simulator = MigrationSimulator(4096, [(0, 110, 150, 4096)])
+        legacy = simulator.run(None)
+        policy = simulator.run(migration.ConvergencePolicy(500, 10))
+        self.assertEqual(legacy.result, 'aborted')
+        self.assertEqual(policy.result, 'aborted')
+        self.assertLess(policy.time, legacy.time)
+
+    def test_simulated_converging(self):
+        simulator = MigrationSimulator(4096, [(0, 110, 5, 4096)])
+        result = simulator.run(migration.ConvergencePolicy(500, 10))
+        self.assertEqual(result.result, 'done')
+        self.assertLessEqual(result.downtime, 500)
+
+    @stresstest
+    def test_benchmark_policies(self):
+        workloads = (
+            ('idle', [(0, 110, 5, 4096)]),
+            ('busy', [(0, 110, 80, 4096)]),
+            ('hot pages', [(0, 110, 200, 40)]),
+            ('burst', [(0, 110, 150, 4096), (60, 110, 20, 4096)]),
+            ('slow network', [(0, 110, 40, 4096), (30, 30, 40, 4096),
+                              (90, 110, 40, 4096)]),
+            ('heavy', [(0, 110, 150, 4096)]),
+        )
+        for name, trace in workloads:
+            simulator = MigrationSimulator(4096, trace)
+            for policy_name, policy in (
+                    ('legacy', None),
+                    ('convergence', migration.ConvergencePolicy(500, 10))):
+                result = simulator.run(policy)
+                print("%-12s %-11s %-7s time=%6.1fs downtime=%4dms" %
+                      (name, policy_name, result.result, result.time,
+                       result.downtime))
+
+
+class CreatePolicyTests(TestCaseBase):
+
+    def create_policy(self, policy, monitor_interval):
+        cfg = make_config([('vars', 'migration_policy', policy)])
+        source = FakeSourceThread()
+        with MonkeyPatchScope([
+            (migration, 'config', cfg),
+            (migration.MonitorThread, '_MIGRATION_MONITOR_INTERVAL',
+             monitor_interval),
+        ]):
+            return migration.SourceThread._createPolicy.im_func(source)
+
+    def test_legacy(self):
+        self.assertIsNone(self.create_policy(migration.POLICY_LEGACY, 10))
+
+    def test_convergence(self):
+        policy = self.create_policy(migration.POLICY_CONVERGENCE, 10)
+        self.assertIsInstance(policy, migration.ConvergencePolicy)
+
+    def test_convergence_monitor_disabled(self):
+        # Without monitor samples, fall back to the downtime thread
+        self.assertIsNone(
+            self.create_policy(migration.POLICY_CONVERGENCE, 0))
+
+    def test_unknown(self):
+        self.assertIsNone(self.create_policy('no-such-policy', 10))
+
+
+class FakeSourceThread(object):
+    log = logging.getLogger('fake.SourceThread')
+    _downtime = '500'
+
+
+MiB = 1024 * 1024
+
+SimulationResult = namedtuple('SimulationResult',
+                              ['result', 'time', 'downtime'])
+
+
+class MigrationSimulator(object):
+    """
+    Simulate the memory transfer of a migration, replaying a workload trace
+    of (start time, bandwidth MiB/s, dirty rate MiB/s, working set MiB)
+    entries. The working set is the memory the guest keeps dirtying.
+
+    The downtime of the migration depends on the policy, so the simulator
+    replays the transfer and dirty rates of a workload instead of recorded
+    jobInfo() samples. The policy is given the samples jobInfo() would
+    return every monitor interval, and the migration completes when the
+    remaining memory can be transferred within the downtime, like QEMU.
+
+    If policy is None, simulate the legacy DowntimeThread schedule. In both
+    cases, the migration is aborted when exceeding the maximum time per GiB,
+    like MonitorThread.
+    """
+
+    STEP = 0.1
+
+    def __init__(self, memory, trace, interval=10, max_downtime=500,
+                 steps=10, delay_per_gib=75, max_time_per_gib=64):
+        self._memory = memory
+        self._trace = trace
+        self._interval = interval
+        self._max_downtime = max_downtime
+        self._steps = steps
+        self._step_delay = (delay_per_gib * max(memory, 2048) / 1024.0 /
+                            steps)
+        self._max_time = max_time_per_gib * memory / 1024.0
+
+    def run(self, policy):
+        # Memory not transferred yet, and memory dirtied after it was
+        # transferred.
+        unsent = float(self._memory)
+        dirty = 0.0
+        processed = 0.0
+        legacy = migration.exponential_downtime(self._max_downtime,
+                                                self._steps)
+        downtime = None
+        next_step = 0.0
+        next_sample = 0.0
+        steps = int(round(self._max_time / self.STEP))
+        for i in range(steps):
+            now = i * self.STEP
+            if policy is None and now >= next_step:
+                downtime = next(legacy, downtime)
+                next_step += self._step_delay
+            remaining = unsent + dirty
+            if policy is not None and now >= next_sample:
+                for action in policy.sample(now, int(processed * MiB),
+                                            int(remaining * MiB)):
+                    if action.action == migration.ACTION_DOWNTIME:
+                        downtime = action.value
+                    elif action.action == migration.ACTION_ABORT:
+                        return SimulationResult('aborted', now, 0)
+                next_sample += self._interval
+
+            bandwidth, dirty_rate, working_set = self._rates(now)
+            needed = remaining * 1000 / bandwidth
+            if needed <= downtime:
+                return SimulationResult('done', now + needed / 1000,
+                                        needed)
+
+            transferred = bandwidth * self.STEP
+            processed += transferred
+            if unsent > 0:
+                unsent = max(0.0, unsent - transferred)
+            else:
+                dirty = max(0.0, dirty - transferred)
+            dirty = min(self._memory - unsent, working_set,
+                        dirty + dirty_rate * self.STEP)
+
+        return SimulationResult('aborted', self._max_time, 0)
+
+    def _rates(self, now):
+        for start, bandwidth, dirty_rate, working_set in reversed(
+                self._trace):
+            if now >= start:
+                return bandwidth, dirty_rate, working_set
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeMigrationVM(object):
+    log = logging.getLogger('fake.MigrationVM')
+
+
+class _Admitting(object):
+
+    def __init__(self, scheduler, cost):
+        self.scheduler = scheduler
+        self.cost = cost
+        self.vm = FakeMigrationVM()
+        self.thread = None
+        self.ticket = None
+        self.queued = threading.Event()
+        self.admitted = threading.Event()
+
+    def run(self):
+        self.ticket = self.scheduler.admit(self.vm, self.cost,
+                                           lambda bandwidth: None)
+        self.admitted.set()
+
+    def wait_until_queued(self):
+        while not self.admitted.is_set():
+            with self.scheduler._cond:
+                if any(t.vm is self.vm for t in self.scheduler._queue):
+                    break
+            time.sleep(0.005)
+        self.queued.set()
+
+
+def start_admitting(scheduler, cost):
+    waiting = _Admitting(scheduler, cost)
+    waiting.thread = threading.Thread(target=waiting.run)
+    waiting.thread.daemon = True
+    waiting.thread.start()
+    waiting.wait_until_queued()
+    return waiting
+
+
+@contextmanager
+def admitting(scheduler, cost):
+    waiting = start_admitting(scheduler, cost)
+    try:
+        yield waiting
+    finally:
+        # Let the thread finish if it is still waiting.
+        scheduler._max_migrations = float('inf')
+        scheduler._total_bandwidth = 0
+        with scheduler._cond:
+            scheduler._cond.notify_all()
+        waiting.thread.join()
+
+
 def pairwise(iterable):
     "s -> (s0,s1), (s1,s2), (s2, s3), ..."
     a, b = tee(iterable)
@@ -0,0 +1,360 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from vdsm.compat import pickle
+
+from virt import recovery
+
+from monkeypatch import MonkeyPatchScope
+from testValidation import stresstest
+from testlib import VdsmTestCase as TestCaseBase
+import vmfakelib as fake
+
+
+def vmState(vmid, devices=20):
+    """
+    Return a state similar to the state saved by Vm.saveState.
+    """
+    return {
+        'vmId': vmid,
+        'vmName': 'vm-' + vmid,
+        'status': 'Up',
+        'statusTime': '4295148740',
+        'startTime': 1454417213.5,
+        'memSize': 1024,
+        'smp': '2',
+        'pid': '12345',
+        'username': 'Unknown',
+        'guestIPs': '',
+        'guestFQDN': '',
+        'guestDiskMapping': {},
+        '_blockJobs': {},
+        'devices': [
+            {'type': 'disk', 'device': 'disk', 'iface': 'virtio',
+             'domainID': str(uuid.uuid4()), 'imageID': str(uuid.uuid4()),
+             'volumeID': str(uuid.uuid4()), 'poolID': str(uuid.uuid4()),
+             'format': 'cow', 'propagateErrors': 'off',
+             'truesize': '1073741824', 'apparentsize': '1073741824',
+             'address': {'bus': '0x00', 'domain': '0x0000',
+                         'function': '0x0', 'slot': '0x%02x' % i,
+                         'type': 'pci'},
+             'alias': 'virtio-disk%d' % i, 'deviceId': str(uuid.uuid4()),
+             'specParams': {}}
+            for i in range(devices)
+        ],
+    }
+
+
+class RecoveryStoreTests(TestCaseBase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = recovery.RecoveryStore(self.path)
+
+    def tearDown(self):
+        self.store.stop()
+        shutil.rmtree(self.path)
+
+    def restart(self):
+        self.store.stop()
+        self.store = recovery.RecoveryStore(self.path)
+
+    def test_save_load(self):
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_recovery_file_format(self):
+        # Older vdsm versions can recover from the full state.
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        with open(os.path.join(self.path, 'vm1.recovery')) as f:
+            self.assertEqual(pickle.load(f), state)
+
+    def test_journal(self):
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        full_state = os.stat(os.path.join(self.path, 'vm1.recovery'))
+        for i in range(5):
+            state = dict(state, status='Paused' if i % 2 else 'Up',
+                         statusTime=str(i))
+            self.store.save('vm1', state)
+        self.assertEqual(
+            os.stat(os.path.join(self.path, 'vm1.recovery')).st_ino,
+            full_state.st_ino)
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_journal_removed_key(self):
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        state = dict(state)
+        del state['pid']
+        self.store.save('vm1', state)
+        self.assertNotIn('pid', self.store.load('vm1'))
+
+    def test_compaction(self):
+        state = vmState('vm1', devices=2)
+        self.store.save('vm1', state)
+        for i in range(20):
+            state = vmState('vm1', devices=2)
+            self.store.save('vm1', state)
+        self.assertTrue(
+            os.path.getsize(os.path.join(self.path, 'vm1.journal')) <
+            os.path.getsize(os.path.join(self.path, 'vm1.recovery')))
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_restart_compacts(self):
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        self.store.save('vm1', dict(state, status='Paused'))
+        self.restart()
+        state = self.store.load('vm1')
+        self.assertEqual(state['status'], 'Paused')
+        self.store.save('vm1', state)
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_stale_journal(self):
+        # Killed after writing the full state, before starting a new journal
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        self.store.save('vm1', dict(state, status='Paused'))
+        journal = os.path.join(self.path, 'vm1.journal')
+        with open(journal) as f:
+            stale = f.read()
+        self.restart()
+        state = dict(state, status='Up', statusTime='1')
+        self.store.save('vm1', state)
+        with open(journal, 'w') as f:
+            f.write(stale)
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_truncated_journal(self):
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        self.store.save('vm1', dict(state, status='Paused'))
+        journal = os.path.join(self.path, 'vm1.journal')
+        size = os.path.getsize(journal)
+        self.store.save('vm1', dict(state, status='Up', statusTime='1'))
+        with open(journal, 'r+') as f:
+            f.truncate(size + 5)
+        self.assertEqual(self.store.load('vm1'),
+                         dict(state, status='Paused'))
+
+    def test_remove(self):
+        self.store.save('vm1', vmState('vm1'))
+        self.store.save('vm1', vmState('vm1'))
+        self.store.remove('vm1')
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_async_first_save_written(self):
+        # A running VM without a recovery file is destroyed on recovery.
+        self.store.start(flush_interval=60)
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_async_first_save_after_restart_written(self):
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        self.restart()
+        self.store.start(flush_interval=60)
+        state = dict(state, status='Paused')
+        self.store.save('vm1', state)
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_async_batches_saves(self):
+        self.store.start(flush_interval=60)
+        first = vmState('vm1')
+        self.store.save('vm1', first)
+        state = first
+        for i in range(5):
+            state = dict(state, statusTime=str(i))
+            self.store.save('vm1', state)
+        self.assertEqual(self.store.load('vm1'), first)
+        self.store.stop()
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_async_sync_save_written(self):
+        self.store.start(flush_interval=60)
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        self.store.save('vm1', dict(state, status='Paused'))
+        state = dict(state, volumeID='volume2')
+        self.store.save('vm1', state, sync=True)
+        self.assertEqual(self.store.load('vm1'), state)
+        # The queued state was replaced by the written state
+        self.store.stop()
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_async_flush(self):
+        self.store.start(flush_interval=0.05)
+        state = vmState('vm1')
+        self.store.save('vm1', state)
+        time.sleep(0.5)
+        self.assertEqual(self.store.load('vm1'), state)
+
+    def test_async_remove_pending(self):
+        self.store.start(flush_interval=60)
+        self.store.save('vm1', vmState('vm1'))
+        self.store.remove('vm1')
+        self.store.stop()
+        self.assertEqual(os.listdir(self.path), [])
+
+
+class LegacyStore(object):
+    """
+    Save the state like Vm.saveState used to do.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def save(self, vmid, state, sync=False):
+        with tempfile.NamedTemporaryFile(dir=self._path, delete=False) as f:
+            pickle.dump(state, f)
+        os.rename(f.name, os.path.join(self._path, vmid + '.recovery'))
+
+    def load(self, vmid):
+        with open(os.path.join(self._path, vmid + '.recovery')) as f:
+            return pickle.load(f)
+
+    def stop(self):
+        pass
+
+
+class RecoveryStoreBenchmark(TestCaseBase):
+
+    VMS = 500
+    SAVES = 10
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_saves(self, save, flush=lambda: None):
+        states = dict((vmid, vmState(vmid))
+                      for vmid in (str(uuid.uuid4())
+                                   for i in range(self.VMS)))
+        for vmid, state in states.iteritems():
+            save(vmid, state)
+        flush()
+        start = time.time()
+        for i in range(self.SAVES):
+            for vmid, state in states.iteritems():
+                state = states[vmid] = dict(state, statusTime=str(i))
+                save(vmid, state)
+        save_time = time.time() - start
+        start = time.time()
+        flush()
+        return states, save_time, time.time() - start
+
+    def report(self, name, save_time, flush_time, load_time):
+        print("%s: save %.1f usec, flush %.3f sec, recover %d vms %.3f sec"
+              % (name, save_time / (self.VMS * self.SAVES) * 1000000,
+                 flush_time, self.VMS, load_time))
+
+    @stresstest
+    def test_legacy(self):
+        store = LegacyStore(self.path)
+        states, save_time, flush_time = self.run_saves(store.save)
+        start = time.time()
+        for vmid in states:
+            store.load(vmid)
+        self.report("legacy", save_time, flush_time, time.time() - start)
+
+    @stresstest
+    def test_sync(self):
+        store = recovery.RecoveryStore(self.path)
+        states, save_time, flush_time = self.run_saves(store.save)
+        start = time.time()
+        for vmid, state in states.iteritems():
+            self.assertEqual(store.load(vmid), state)
+        self.report("sync", save_time, flush_time, time.time() - start)
+
+    @stresstest
+    def test_async(self):
+        store = recovery.RecoveryStore(self.path)
+        store.start(flush_interval=60)
+        try:
+            states, save_time, flush_time = self.run_saves(store.save,
+                                                           store.flush)
+        finally:
+            store.stop()
+        start = time.time()
+        for vmid, state in states.iteritems():
+            self.assertEqual(store.load(vmid), state)
+        self.report("async", save_time, flush_time, time.time() - start)
+
+
+class VmSaveStateBenchmark(TestCaseBase):
+    """
+    Measure the time to save the state of a vm, including building the
+    state, not only the time to save it in the store.
+    """
+
+    SAVES = 1000
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_saves(self, store, sync):
+        devices = vmState('vm1')['devices']
+        with fake.VM(devices=devices) as testvm, \
+                MonkeyPatchScope([(recovery, 'store', store)]):
+            testvm.saveState()
+            start = time.time()
+            for i in range(self.SAVES):
+                testvm.conf['pid'] = str(i)
+                testvm._saveStateInternal(sync)
+            save_time = time.time() - start
+            store.stop()
+            self.assertEqual(store.load(testvm.id)['pid'],
+                             str(self.SAVES - 1))
+        return save_time
+
+    def report(self, name, save_time):
+        print("%s: save %.1f usec" %
+              (name, save_time / self.SAVES * 1000000))
+
+    @stresstest
+    def test_legacy(self):
+        self.report("legacy", self.run_saves(LegacyStore(self.path), True))
+
+    @stresstest
+    def test_sync(self):
+        store = recovery.RecoveryStore(self.path)
+        self.report("sync", self.run_saves(store, True))
+
+    @stresstest
+    def test_async(self):
+        store = recovery.RecoveryStore(self.path)
+        store.start(flush_interval=60)
+        self.report("async", self.run_saves(store, False))
@@ -18,9 +18,11 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+import time
 import uuid
 
 from virt import vmstats
+from testValidation import stresstest
 from testlib import VdsmTestCase as TestCaseBase
 from testlib import permutations, expandPermutations
 
@@ -240,14 +242,10 @@ class NetworkStatsTests(VmStatsTestCase):
     def test_nic_have_all_keys(self):
         nic = FakeNic(name='vnet0', model='virtio',
                       mac_addr='00:1a:4a:16:01:51')
-        testvm = FakeVM(nics=(nic,))
 
-        stats = vmstats._nic_traffic(
-            testvm,
-            nic.name, nic.nicModel, nic.macAddr,
-            self.bulk_stats, 0,
-            self.bulk_stats, 0,
-            self.interval)
+        stats = vmstats._nic_stats(
+            nic.name, nic.nicModel, nic.macAddr, self.interval,
+            vmstats._nic_metrics(self.bulk_stats, 0, self.bulk_stats, 0))
 
         self.assertStatsHaveKeys(stats)
 
@@ -325,6 +323,76 @@ class DiskStatsTests(VmStatsTestCase):
         self.assertRepeatedStatsHaveKeys(drives, stats['disks'])
 
 
+class CpuStatsTests(VmStatsTestCase):
+
+    def test_partial_stats(self):
+        first = {'cpu.system': 0, 'cpu.user': 0}
+        last = {'cpu.system': 3 * 10 ** 9, 'cpu.user': 2 * 10 ** 9,
+                'cpu.time': 6 * 10 ** 9}
+        stats = {}
+        vmstats.cpu(stats, first, last, self.interval)
+        # cpu.time is missing in the first sample
+        self.assertEqual(stats['cpuUsage'], str(5 * 10 ** 9))
+        self.assertEqual(stats['cpuSys'],
+                         vmstats._usage_percentage(5 * 10 ** 9,
+                                                   self.interval))
+        self.assertEqual(stats['cpuUser'], 0.0)
+
+
+@expandPermutations
+class SampleMetricsTests(VmStatsTestCase):
+
+    def setUp(self):
+        VmStatsTestCase.setUp(self)
+        self.vm = FakeVM(
+            nics=(FakeNic(name='vnet0', model='virtio',
+                          mac_addr='00:1a:4a:16:01:51'),),
+            drives=(FakeDrive(name='hdc', size=700 * 1024 * 1024),
+                    FakeDrive(name='vda', size=1024 * 1024 * 1024)))
+
+    def test_missing_samples(self):
+        self.assertEqual(vmstats.sample_metrics(None, None, None),
+                         {'cpu': {}, 'net': {}, 'block': {}})
+
+    def test_hotplugged_devices(self):
+        first, last = self.samples
+        metrics = vmstats.sample_metrics(first, last, self.interval)
+        self.assertEqual(sorted(metrics['net']), ['vnet0'])
+        self.assertEqual(sorted(metrics['block']), ['hdc', 'vda'])
+
+    @permutations([[10], [0]])
+    def test_same_stats(self, interval):
+        first, last = self.samples
+        metrics = vmstats.sample_metrics(first, last, interval)
+        expected = vmstats.produce(self.vm, first, last, interval)
+        stats = vmstats.produce(self.vm, first, last, interval, metrics)
+        for nic_stats in expected.get('network', {}).values():
+            del nic_stats['sampleTime']
+        for nic_stats in stats.get('network', {}).values():
+            del nic_stats['sampleTime']
+        self.assertEqual(stats, expected)
+
+    @stresstest
+    def test_benchmark(self):
+        first, last = self.samples
+        count = 10000
+
+        start = time.time()
+        for i in range(count):
+            vmstats.produce(self.vm, first, last, self.interval)
+        elapsed = time.time() - start
+        print("%d produce calls: %.1f usec per call" %
+              (count, elapsed / count * 1000000))
+
+        metrics = vmstats.sample_metrics(first, last, self.interval)
+        start = time.time()
+        for i in range(count):
+            vmstats.produce(self.vm, first, last, self.interval, metrics)
+        elapsed = time.time() - start
+        print("%d produce calls with metrics: %.1f usec per call" %
+              (count, elapsed / count * 1000000))
+
+
 # helpers
 
 class FakeNic(object):
@@ -346,6 +414,8 @@ class FakeDrive(object):
         self.domainID = str(uuid.uuid4())
         self.poolID = str(uuid.uuid4())
         self.volumeID = str(uuid.uuid4())
+        self.specParams = {}
+        self.path = '/path/to/%s' % name
 
     def __contains__(self, item):
         # isVdsmImage support
@@ -358,9 +428,16 @@ class FakeVM(object):
         self.id = str(uuid.uuid4())
         self.nics = nics if nics is not None else []
         self.drives = drives if drives is not None else []
+        self.conf = {'memSize': '1024'}
 
     def getNicDevices(self):
         return self.nics
 
     def getDiskDevices(self):
         return self.drives
+
+    def getBalloonDevicesConf(self):
+        return []
+
+    def incomingMigrationPending(self):
+        return False
@@ -26,6 +26,7 @@ import re
 import threading
 import time
 import uuid
+from contextlib import contextmanager
 
 import libvirt
 
@@ -1034,10 +1035,9 @@ class TestVmStats(TestCaseBase):
         GBPS = 10 ** 9 / 8
         MAC = '52:54:00:59:F5:3F'
         pretime = utils.monotonic_time()
-        with fake.VM(_VM_PARAMS) as testvm:
-            res = vmstats._nic_traffic(
-                testvm,
-                name='vnettest', model='virtio', mac=MAC,
+        res = vmstats._nic_stats(
+            'vnettest', 'virtio', MAC, 15.0,
+            vmstats._nic_metrics(
                 start_sample={'net.0.rx.bytes': 2 ** 64 - 15 * GBPS,
                               'net.0.rx.pkts': 1,
                               'net.0.rx.errs': 2,
@@ -1055,8 +1055,7 @@ class TestVmStats(TestCaseBase):
                             'net.0.tx.pkts': 10,
                             'net.0.tx.errs': 11,
                             'net.0.tx.drop': 12},
-                end_index=0,
-                interval=15.0)
+                end_index=0))
         posttime = utils.monotonic_time()
         self.assertIn('sampleTime', res)
         self.assertTrue(pretime <= res['sampleTime'] <= posttime,
@@ -1408,6 +1407,177 @@ class FreezingUnexpectedErrorTests(TestCaseBase):
                                              message="fake error"))
 
 
+class DrivesToExtendTests(TestCaseBase):
+
+    GB = 1024 * constants.MEGAB
+
+    def setUp(self):
+        self.drives = [self.make_drive(0), self.make_drive(1)]
+
+    def make_drive(self, index):
+        drive = vmdevices.storage.Drive(
+            {}, self.log, index=index, device="disk", iface="virtio",
+            path="/dev/vg/lv%d" % index, type=hwclass.DISK, format="cow")
+        drive._blockDev = True
+        return drive
+
+    def stats(self, allocs):
+        stats = {'block.count': len(allocs)}
+        for i, alloc in enumerate(allocs):
+            stats['block.%d.name' % i] = self.drives[i].name
+            stats['block.%d.capacity' % i] = 10 * self.GB
+            stats['block.%d.allocation' % i] = alloc
+            stats['block.%d.physical' % i] = 2 * self.GB
+        return stats
+
+    def drives_to_extend(self, stats):
+        with fake.VM() as testvm:
+            testvm._devices[hwclass.DISK] = self.drives
+            return testvm.getDrivesToExtend(stats)
+
+    def test_below_watermark(self):
+        stats = self.stats([1 * self.GB, 1 * self.GB])
+        self.assertEqual(self.drives_to_extend(stats), [])
+
+    def test_above_watermark(self):
+        stats = self.stats([1 * self.GB, 1.9 * self.GB])
+        self.assertEqual(self.drives_to_extend(stats), [self.drives[1]])
+
+    def test_improbable_allocation(self):
+        stats = self.stats([4 * self.GB, 1 * self.GB])
+        self.assertEqual(self.drives_to_extend(stats), [self.drives[0]])
+
+    def test_maximum_size(self):
+        stats = self.stats([1 * self.GB, 1 * self.GB])
+        stats['block.0.capacity'] = 1.8 * self.GB
+        stats['block.0.allocation'] = 1.9 * self.GB
+        self.assertEqual(self.drives_to_extend(stats), [])
+
+    def test_missing_stats(self):
+        stats = self.stats([1 * self.GB])
+        self.assertEqual(self.drives_to_extend(stats), [self.drives[1]])
+
+    def test_not_chunked(self):
+        self.drives[1].format = "raw"
+        stats = self.stats([1 * self.GB])
+        self.assertEqual(self.drives_to_extend(stats), [])
+
+
+class ThresholdExtensionTests(TestCaseBase):
+
+    GB = 1024 * constants.MEGAB
+
+    def setUp(self):
+        self.drive = vmdevices.storage.Drive(
+            {}, self.log, index=0, device="disk", iface="virtio",
+            path="/dev/vg/lv", type=hwclass.DISK, format="cow",
+            domainID="domain", imageID="image", poolID="pool",
+            volumeID="volume", apparentsize=str(2 * self.GB))
+        self.drive._blockDev = True
+        self.irs = _FakeExtendIRS()
+
+    @contextmanager
+    def make_vm(self):
+        with fake.VM() as testvm:
+            testvm.cif.irs = self.irs
+            testvm._dom = fake.Domain(vmId=testvm.id)
+            testvm._dom.blockInfos[self.drive.path] = (
+                10 * self.GB, 1 * self.GB, 2 * self.GB)
+            testvm._devices[hwclass.DISK] = [self.drive]
+            testvm._extendTrigger = vm.ThresholdExtensionTrigger(
+                testvm, dispatch=lambda func, timeout: func())
+            yield testvm
+
+    def test_set_threshold(self):
+        with self.make_vm() as testvm:
+            self.assertTrue(testvm.needsWatermarkPolling())
+            testvm._setWriteWatermarks()
+            self.assertEqual(testvm._dom.thresholds,
+                             {'vda': 2 * self.GB -
+                              self.drive.watermarkLimit})
+            self.assertFalse(testvm.needsWatermarkPolling())
+
+    def test_improbable_extension(self):
+        with self.make_vm() as testvm:
+            testvm._dom.blockInfos[self.drive.path] = (
+                10 * self.GB, 4 * self.GB, 2 * self.GB)
+            paused = []
+            testvm.pause = lambda pauseCode: paused.append(pauseCode)
+            self.assertFalse(testvm.extendDrivesIfNeeded())
+            self.assertEqual(paused, ['EOTHER'])
+            self.assertEqual(self.irs.extensions, [])
+
+    def test_write_below_threshold(self):
+        with self.make_vm() as testvm:
+            testvm._setWriteWatermarks()
+            events = fake.BlockThresholdEventSource(testvm.cif, testvm._dom)
+            events.write('vda', self.drive.path, 1.2 * self.GB)
+            self.assertEqual(self.irs.extensions, [])
+            self.assertFalse(testvm.needsWatermarkPolling())
+
+    def test_write_above_threshold(self):
+        with self.make_vm() as testvm:
+            testvm._setWriteWatermarks()
+            events = fake.BlockThresholdEventSource(testvm.cif, testvm._dom)
+            events.write('vda', self.drive.path, 1.9 * self.GB)
+            self.assertEqual(self.irs.extensions,
+                             [('pool', 'volume', 3 * self.GB)])
+            # Polled until the drive is extended
+            self.assertTrue(testvm.needsWatermarkPolling())
+
+    def test_write_after_snapshot(self):
+        with self.make_vm() as testvm:
+            testvm._setWriteWatermarks()
+            testvm.cif.prepareVolumePath = lambda drive, vmId=None: \
+                "/dev/vg/snapshot"
+            testvm._dom.blockInfos["/dev/vg/snapshot"] = (
+                10 * self.GB, 0, 1 * self.GB)
+            self.irs.sizes["snapshot"] = 1 * self.GB
+            snapDrive = {'domainID': 'domain', 'imageID': 'image',
+                         'baseVolumeID': 'volume', 'volumeID': 'snapshot'}
+            testvm.conf['devices'] = [{'type': hwclass.DISK, 'name': 'vda'}]
+            with MonkeyPatchScope([(utils, 'isBlockDevice',
+                                    lambda path: True)]):
+                res = testvm.snapshot([snapDrive], None, frozen=True)
+            self.assertEqual(res['status']['code'], 0)
+            self.assertEqual(testvm._dom.thresholds,
+                             {'vda': 1 * self.GB -
+                              self.drive.watermarkLimit})
+            self.assertFalse(testvm.needsWatermarkPolling())
+            events = fake.BlockThresholdEventSource(testvm.cif, testvm._dom)
+            events.write('vda', "/dev/vg/snapshot", 0.9 * self.GB)
+            self.assertEqual(self.irs.extensions,
+                             [('pool', 'snapshot', 2 * self.GB)])
+
+    def test_unsupported(self):
+        with self.make_vm() as testvm:
+            testvm._dom = fake.Domain(virtError=libvirt.VIR_ERR_NO_SUPPORT)
+            testvm._setWriteWatermarks()
+            self.assertFalse(testvm._extendTrigger.events)
+            self.assertTrue(testvm.needsWatermarkPolling())
+
+    def test_polling_trigger(self):
+        with self.make_vm() as testvm:
+            testvm._extendTrigger = vm.PollingExtensionTrigger(testvm)
+            testvm._setWriteWatermarks()
+            self.assertEqual(testvm._dom.thresholds, {})
+            self.assertTrue(testvm.needsWatermarkPolling())
+
+
+class _FakeExtendIRS(object):
+
+    def __init__(self):
+        self.extensions = []
+        self.sizes = {}
+
+    def sendExtendMsg(self, poolID, volInfo, newSize, callback):
+        self.extensions.append((poolID, volInfo['volumeID'], newSize))
+
+    def getVolumeSize(self, domainID, poolID, imageID, volumeID):
+        size = self.sizes[volumeID]
+        return response.success(apparentsize=str(size), truesize=str(size))
+
+
 def _load_xml(name):
     test_path = os.path.realpath(__file__)
     data_path = os.path.join(os.path.split(test_path)[0], 'devices', 'data')
@@ -0,0 +1,203 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import logging
+import socket
+import threading
+import time
+
+from virt import vmchannels
+
+from testlib import VdsmTestCase as TestCaseBase
+from testValidation import stresstest
+
+TIMEOUT = 2.0
+
+
+class FakeChannel(object):
+    """
+    Channel of a fake guest, reconnecting on every create.
+    """
+
+    def __init__(self, name, connect=True, read_delay=0):
+        self.name = name
+        self.connect = connect
+        self.read_delay = read_delay
+        self.sock = None
+        self.guest = None
+        self.creates = 0
+        self.received = []
+        self.timeouts = 0
+        self.connected = threading.Event()
+        self.data = threading.Event()
+
+    def create(self, opaque):
+        self.close()
+        self.sock, self.guest = socket.socketpair()
+        self.sock.setblocking(0)
+        self.creates += 1
+        return self.sock.fileno()
+
+    def connected_cb(self, opaque):
+        if self.connect:
+            self.connected.set()
+        return self.connect
+
+    def read(self, opaque):
+        data = self.sock.recv(1024)
+        if not data:
+            return False
+        time.sleep(self.read_delay)
+        self.received.append(data)
+        self.data.set()
+        return True
+
+    def timeout(self, opaque):
+        self.timeouts += 1
+
+    def send(self, data):
+        self.data.clear()
+        self.guest.sendall(data)
+        self.data.wait(TIMEOUT)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.guest.close()
+
+    def register(self, listener):
+        listener.register(self.create, self.connected_cb, self.read,
+                          self.timeout, self.name)
+
+
+class ListenerTests(TestCaseBase):
+
+    def setUp(self):
+        self.channels = []
+
+    def tearDown(self):
+        for channel in self.channels:
+            channel.close()
+
+    def start_listener(self, shards=1, timeout=30):
+        listener = vmchannels.Listener(logging.getLogger('test'), shards)
+        listener.settimeout(timeout)
+        listener.start()
+        self.addCleanup(listener.stop)
+        return listener
+
+    def add_channel(self, listener, name, **kw):
+        channel = FakeChannel(name, **kw)
+        self.channels.append(channel)
+        channel.register(listener)
+        return channel
+
+    def test_read(self):
+        listener = self.start_listener()
+        channel = self.add_channel(listener, 'vm')
+        self.assertTrue(channel.connected.wait(TIMEOUT))
+        channel.send('message')
+        self.assertEqual(channel.received, ['message'])
+
+    def test_reconnect(self):
+        listener = self.start_listener()
+        channel = self.add_channel(listener, 'vm')
+        self.assertTrue(channel.connected.wait(TIMEOUT))
+        channel.connected.clear()
+        channel.guest.close()
+        self.assertTrue(channel.connected.wait(TIMEOUT))
+        self.assertEqual(channel.creates, 2)
+        channel.send('message')
+        self.assertEqual(channel.received, ['message'])
+
+    def test_unregister(self):
+        listener = self.start_listener()
+        channel = self.add_channel(listener, 'vm')
+        self.assertTrue(channel.connected.wait(TIMEOUT))
+        listener.unregister(channel.sock.fileno())
+        channel.guest.sendall('message')
+        self.assertFalse(channel.data.wait(0.2))
+
+    def test_unregister_unconnected(self):
+        listener = self.start_listener()
+        channel = self.add_channel(listener, 'vm', connect=False)
+        listener.unregister(channel.sock.fileno())
+        channel.connect = True
+        self.assertFalse(channel.connected.wait(1.5))
+
+    def test_timeout(self):
+        listener = self.start_listener(timeout=0.1)
+        channel = self.add_channel(listener, 'vm')
+        self.assertTrue(channel.connected.wait(TIMEOUT))
+        time.sleep(1.5)
+        self.assertTrue(channel.timeouts > 0)
+
+    def test_shards(self):
+        listener = self.start_listener(shards=4)
+        channels = [self.add_channel(listener, 'vm%d' % i)
+                    for i in range(16)]
+        for channel in channels:
+            self.assertTrue(channel.connected.wait(TIMEOUT))
+            channel.send('message')
+            self.assertEqual(channel.received, ['message'])
+        stats = listener.stats()
+        self.assertEqual(len(stats), 4)
+        self.assertEqual(sum(s['channels'] for s in stats), 16)
+
+    def test_slow_channel_other_shard(self):
+        listener = self.start_listener(shards=2)
+        shard = listener._shards[hash('slow') % 2]
+        fast_name = next(name for name in ('vm%d' % i for i in range(10))
+                         if listener._shards[hash(name) % 2] is not shard)
+        slow = self.add_channel(listener, 'slow', read_delay=1)
+        fast = self.add_channel(listener, fast_name)
+        self.assertTrue(slow.connected.wait(TIMEOUT))
+        self.assertTrue(fast.connected.wait(TIMEOUT))
+        slow.guest.sendall('message')
+        time.sleep(0.1)
+        start = time.time()
+        fast.send('message')
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(fast.received, ['message'])
+
+    @stresstest
+    def test_benchmark_reconnect_storm(self):
+        # Fast guests latency while other guests keep reconnecting
+        for shards in (1, 4):
+            listener = self.start_listener(shards=shards)
+            flapping = [self.add_channel(listener, 'flapping%d' % i)
+                        for i in range(50)]
+            fast = [self.add_channel(listener, 'fast%d' % i)
+                    for i in range(8)]
+            for channel in flapping + fast:
+                self.assertTrue(channel.connected.wait(TIMEOUT))
+            latency = []
+            for i in range(20):
+                for channel in flapping:
+                    channel.guest.close()
+                for channel in fast:
+                    start = time.time()
+                    channel.send('message')
+                    latency.append(time.time() - start)
+            latency.sort()
+            print("shards=%d p50=%.6f p99=%.6f max=%.6f" % (
+                shards, latency[len(latency) // 2],
+                latency[len(latency) * 99 // 100], latency[-1]))
+            listener.stop()
@@ -155,6 +155,8 @@ class ClientIF(clientIF.clientIF):
         self.channelListener = None
         self.vmContainerLock = threading.Lock()
         self.vmContainer = {}
+        self._vmStatsSnapshot = sampling.StatsSnapshot(sampling.stats_cache,
+                                                       0)
 
     def notify(self, event_id, **kwargs):
         pass
@@ -178,6 +180,8 @@ class Domain(object):
         self._vmId = vmId
         self._diskErrors = {}
         self._downtimes = []
+        self.blockInfos = {}
+        self.thresholds = {}
 
     @property
     def connected(self):
@@ -257,6 +261,20 @@ class Domain(object):
         self._failIfRequested()
         return 3  # thawed filesystems
 
+    def blockInfo(self, path, flags):
+        self._failIfRequested()
+        return self.blockInfos[path]
+
+    def setBlockThreshold(self, dev, threshold, flags=0):
+        self._failIfRequested()
+        self.thresholds[dev] = threshold
+
+    def snapshotCreateXML(self, xml, flags):
+        self._failIfRequested()
+        # The new top volumes have no block threshold
+        for disk in etree.fromstring(xml).findall('./disks/disk'):
+            self.thresholds.pop(disk.get('name'), None)
+
     def shutdownFlags(self, flags):
         pass
 
@@ -264,6 +282,33 @@ class Domain(object):
         pass
 
 
+class BlockThresholdEventSource(object):
+    """
+    Simulate guest writes to the drives of a fake Domain, delivering block
+    threshold events to cif like the libvirt event loop.
+    """
+
+    def __init__(self, cif, dom):
+        self._cif = cif
+        self._dom = dom
+
+    def write(self, dev, path, allocation):
+        """
+        Update the allocation of drive dev with the given path, and deliver
+        an event if the drive threshold was exceeded.
+        """
+        capacity, _, physical = self._dom.blockInfos[path]
+        self._dom.blockInfos[path] = (capacity, allocation, physical)
+        threshold = self._dom.thresholds.get(dev)
+        if threshold is None or allocation <= threshold:
+            return
+        # Thresholds are removed when the event is delivered
+        del self._dom.thresholds[dev]
+        self._cif.dispatchLibvirtEvents(
+            None, self._dom, dev, path, threshold, allocation - threshold,
+            libvirtconnection.VIR_DOMAIN_EVENT_ID_BLOCK_THRESHOLD)
+
+
 class GuestAgent(object):
     def __init__(self):
         self.guestDiskMapping = {}
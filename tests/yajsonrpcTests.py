@@ -0,0 +1,155 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from vdsm import rpcstats
+from vdsm.compat import json
+import yajsonrpc
+from yajsonrpc import (
+    ChunkedMessage,
+    JsonRpcInternalError,
+    JsonRpcRequest,
+    JsonRpcResponse,
+    JsonRpcServer,
+)
+
+from testlib import VdsmTestCase as TestCaseBase
+from testlib import expandPermutations, permutations
+
+
+class _FakeBridge(object):
+
+    def register_server_address(self, address):
+        pass
+
+    def unregister_server_address(self):
+        pass
+
+    def Host_ping(self):
+        return {'cpuLoad': 0.5}
+
+    def Host_fail(self):
+        raise RuntimeError("failed")
+
+
+class _FakeClient(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+        if message.on_sent is not None:
+            message.on_sent()
+
+
+@expandPermutations
+class ResponseEncodingTests(TestCaseBase):
+
+    @permutations([
+        [True],
+        [[]],
+        [[{'vmId': '1', 'status': 'Up'}, {'vmId': '2', 'status': 'Down'}]],
+        [{}],
+        [{'a': [1, 2], 'b': {'c': u'\u05d0'}, 1: None}],
+        [u'\u05d0'],
+    ])
+    def test_iterencode(self, result):
+        response = JsonRpcResponse(result, None, 'id')
+        encoded = ''.join(response.iterencode())
+        self.assertEqual(json.loads(encoded), json.loads(response.encode()))
+
+    def test_iterencode_error(self):
+        response = JsonRpcResponse(None, JsonRpcInternalError('oops'), 'id')
+        encoded = ''.join(response.iterencode())
+        self.assertEqual(json.loads(encoded), json.loads(response.encode()))
+
+    def test_iterencode_skip_keys(self):
+        response = JsonRpcResponse({object(): 1, 'a': 2}, None, 'id')
+        encoded = ''.join(response.iterencode())
+        self.assertEqual(json.loads(encoded)['result'], {'a': 2})
+
+    def test_chunks(self):
+        pieces = ['a'] * 10 + ['b' * 10] + ['c'] * 3
+        chunks = list(yajsonrpc._chunks(pieces, size=4))
+        self.assertEqual(chunks, ['aaaa', 'aaaa', 'aa', 'b' * 10, 'ccc'])
+
+
+class ServeRequestContextTests(TestCaseBase):
+
+    def test_single_response(self):
+        client = _FakeClient()
+        ctx = yajsonrpc._JsonRpcServeRequestContext(client, 'address')
+        ctx.setRequests([JsonRpcRequest('Host.getStats', {}, 'id')])
+        result = [{'vmId': str(i)} for i in range(10000)]
+        ctx.requestDone(JsonRpcResponse(result, None, 'id'))
+
+        message, = client.messages
+        self.assertIsInstance(message, ChunkedMessage)
+        self.assertTrue(len(message) > 1)
+        self.assertEqual(message.ids, ['id'])
+        self.assertEqual(json.loads(str(message))['result'], result)
+
+    def test_batch_response(self):
+        client = _FakeClient()
+        ctx = yajsonrpc._JsonRpcServeRequestContext(client, 'address')
+        ctx.setRequests([JsonRpcRequest('Host.getStats', {}, 1),
+                         JsonRpcRequest('Host.getStats', {}, 2)])
+        ctx.requestDone(JsonRpcResponse('a', None, 1))
+        ctx.requestDone(JsonRpcResponse('b', None, 2))
+
+        message, = client.messages
+        self.assertEqual(message.ids, [1, 2])
+        self.assertEqual([r['result'] for r in json.loads(str(message))],
+                         ['a', 'b'])
+
+
+class RpcStatsTests(TestCaseBase):
+
+    def setUp(self):
+        rpcstats.clear()
+        self.server = JsonRpcServer(_FakeBridge(), 3600,
+                                    lambda func, method: func())
+
+    def tearDown(self):
+        rpcstats.clear()
+
+    def test_success(self):
+        client = _FakeClient()
+        request = {'jsonrpc': '2.0', 'method': 'Host.ping',
+                   'params': {}, 'id': 1}
+        self.server._parseMessage(client, 'address', json.dumps(request))
+
+        self.assertEqual(json.loads(str(client.messages[0]))['result'],
+                         {'cpuLoad': 0.5})
+        stats = rpcstats.info()[rpcstats.JSONRPC]['Host.ping']
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(sorted(stats['latency']), sorted(rpcstats.PHASES))
+
+    def test_error(self):
+        client = _FakeClient()
+        request = {'jsonrpc': '2.0', 'method': 'Host.fail',
+                   'params': {}, 'id': 1}
+        self.server._parseMessage(client, 'address', json.dumps(request))
+
+        self.assertIn('error', json.loads(str(client.messages[0])))
+        stats = rpcstats.info()[rpcstats.JSONRPC]['Host.fail']
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['errors'], 1)
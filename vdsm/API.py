@@ -39,6 +39,7 @@ from clientIF import clientIF
 from vdsm import netinfo
 from vdsm import constants
 from vdsm import response
+from vdsm import rpcstats
 from vdsm import supervdsm
 import storage.misc
 import storage.clusterlock
@@ -1336,6 +1337,12 @@ class Global(APIBase):
         statsList = hooks.after_get_all_vm_stats(statsList)
         return {'status': doneCode, 'statsList': statsList}
 
+    def getRpcStats(self):
+        """
+        Report per-method statistics of the rpc servers.
+        """
+        return {'status': doneCode, 'info': rpcstats.info()}
+
     def hostdevListByCaps(self, caps=None):
         devices = hostdev.list_by_caps(caps)
         return {'status': doneCode, 'deviceList': devices}
@@ -28,13 +28,12 @@ from functools import partial
 from weakref import proxy
 from collections import defaultdict
 
-from yajsonrpc.betterAsyncore import Reactor
+from yajsonrpc.betterAsyncore import create_reactor
 from yajsonrpc.stompreactor import StompClient, StompRpcServer
 from yajsonrpc import Notification, JsonRpcBindingsError
 import alignmentScan
 from vdsm.config import config
 from momIF import MomClient
-from vdsm.compat import pickle
 from vdsm.define import doneCode, errCode
 import libvirt
 from vdsm import m2cutils
@@ -47,6 +46,7 @@ import blkid
 from protocoldetector import MultiProtocolAcceptor
 
 from virt import migration
+from virt import recovery
 from virt import sampling
 from virt import secret
 from virt import vm
@@ -71,7 +71,7 @@ class clientIF(object):
     _instance = None
     _instanceLock = threading.Lock()
 
-    def __init__(self, irs, log):
+    def __init__(self, irs, log, scheduler):
         """
         Initialize the (single) clientIF instance
 
@@ -79,6 +79,8 @@ class clientIF(object):
         :type irs: :class:`storage.dispatcher.Dispatcher`
         :param log: a log object to be used for this object's logging.
         :type log: :class:`logging.Logger`
+        :param scheduler: a scheduler used by the rpc request executors.
+        :type scheduler: :class:`vdsm.schedule.Scheduler`
         """
         self.vmContainerLock = threading.Lock()
         self._networkSemaphore = threading.Semaphore()
@@ -88,8 +90,10 @@ class clientIF(object):
             self._contEIOVmsCB = partial(clientIF.contEIOVms, proxy(self))
             self.irs.registerDomainStateChangeCallback(self._contEIOVmsCB)
         self.log = log
+        self._scheduler = scheduler
         self._recovery = True
-        self.channelListener = Listener(self.log)
+        self.channelListener = Listener(
+            self.log, config.getint('vars', 'vm_channels_listener_shards'))
         self._generationID = str(uuid.uuid4())
         self.mom = None
         self.bindings = {}
@@ -101,8 +105,13 @@ class clientIF(object):
             self.gluster = None
         try:
             self.vmContainer = {}
+            self._vmStatsSnapshot = sampling.StatsSnapshot(
+                sampling.stats_cache,
+                config.getint('vars', 'vm_stats_snapshot_max_age'))
             self._hostStats = sampling.HostStatsThread(log=log)
             self._hostStats.start()
+            recovery.store.start(
+                config.getint('vars', 'vm_recovery_flush_interval'))
             self.lastRemoteAccess = 0
             self._enabled = True
             self._netConfigDirty = False
@@ -148,12 +157,21 @@ class clientIF(object):
         event_id and a dictionary as event body. Before sending
         there is notify_time added on top level to the dictionary.
         """
+        if event_id.startswith('|virt|'):
+            # Before sending, so clients reacting to the event get new stats
+            self.invalidateVmStats()
         notification = Notification(
             event_id,
             self._send_notification,
         )
         notification.emit(**kwargs)
 
+    def invalidateVmStats(self):
+        """
+        Recompute the stats returned by getAllVmStats on the next call.
+        """
+        self._vmStatsSnapshot.invalidate()
+
     def _send_notification(self, message):
         self.bindings['jsonrpc'].reactor.server.send(message,
                                                      config.get('addresses',
@@ -182,19 +200,19 @@ class clientIF(object):
                         vmObj.cont()
 
     @classmethod
-    def getInstance(cls, irs=None, log=None):
+    def getInstance(cls, irs=None, log=None, scheduler=None):
         with cls._instanceLock:
             if cls._instance is None:
                 if log is None:
                     raise Exception("Logging facility is required to create "
                                     "the single clientIF instance")
                 else:
-                    cls._instance = clientIF(irs, log)
+                    cls._instance = clientIF(irs, log, scheduler)
         return cls._instance
 
     def _createAcceptor(self, host, port):
         sslctx = m2cutils.create_ssl_context()
-        self._reactor = Reactor()
+        self._reactor = create_reactor(config.get('rpc', 'reactor'))
 
         self._acceptor = MultiProtocolAcceptor(self._reactor, host,
                                                port, sslctx)
@@ -248,7 +266,8 @@ class clientIF(object):
                 bridge = Bridge.DynamicBridge()
                 json_binding = BindingJsonRpc(
                     bridge, self._subscriptions,
-                    config.getint('vars', 'connection_stats_timeout'))
+                    config.getint('vars', 'connection_stats_timeout'),
+                    self._scheduler)
                 self.bindings['jsonrpc'] = json_binding
                 stomp_detector = StompDetector(json_binding)
                 self._acceptor.add_detector(stomp_detector)
@@ -280,6 +299,7 @@ class clientIF(object):
             secret.clear()
             self.channelListener.stop()
             self._hostStats.stop()
+            recovery.store.stop()
             if self.irs:
                 return self.irs.prepareForShutdown()
             else:
@@ -437,7 +457,7 @@ class clientIF(object):
         return {'status': doneCode, 'vmList': vm.status()}
 
     def getAllVmStats(self):
-        return [v.getStats() for v in self.vmContainer.values()]
+        return self._vmStatsSnapshot.get(self.vmContainer.values())
 
     def createStompClient(self, client_socket):
         if 'jsonrpc' in self.bindings:
@@ -565,14 +585,13 @@ class clientIF(object):
 
     def _recoverVm(self, vmid):
         try:
-            recoveryFile = constants.P_VDSM_RUN + vmid + ".recovery"
-            params = pickle.load(file(recoveryFile))
+            params = recovery.store.load(vmid)
             now = time.time()
             pt = float(params.pop('startTime', now))
             params['elapsedTimeOffset'] = now - pt
             self.log.debug("Trying to recover " + params['vmId'])
             if not self.createVm(params, vmRecover=True)['status']['code']:
-                return recoveryFile
+                return True
         except:
             self.log.debug("Error recovering VM", exc_info=True)
         return None
@@ -582,7 +601,7 @@ class clientIF(object):
             try:
                 vmId, fileType = f.split(".", 1)
                 exts = ["guest.socket", "monitor.socket",
-                        "stdio.dump", "recovery"]
+                        "stdio.dump", "recovery", "journal"]
                 if fileType in exts and vmId not in self.vmContainer:
                     self.log.debug("removing old file " + f)
                     utils.rmFile(constants.P_VDSM_RUN + f)
@@ -625,6 +644,10 @@ class clientIF(object):
             elif eventid == libvirt.VIR_DOMAIN_EVENT_ID_WATCHDOG:
                 action, = args[:-1]
                 v.onWatchdogEvent(action)
+            elif (eventid ==
+                    libvirtconnection.VIR_DOMAIN_EVENT_ID_BLOCK_THRESHOLD):
+                dev, path, threshold, excess = args[:-1]
+                v.onBlockThreshold(dev, path, threshold, excess)
             else:
                 v.log.warning('unknown eventid %s args %s', eventid, args)
 
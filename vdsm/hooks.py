@@ -29,6 +29,7 @@ import os
 import os.path
 import sys
 import tempfile
+import threading
 
 from vdsm.constants import P_VDSM_HOOKS, P_VDSM
 
@@ -37,15 +38,101 @@ class HookError(Exception):
     pass
 
 
+class _ScriptsCache(object):
+    """
+    Cache the scripts of the hook directories under path, so looking up
+    hook directories without scripts costs nothing.
+
+    The cache is invalidated by inotify events on path, when scripts are
+    added, removed, renamed, or have their permissions modified.
+    """
+
+    def __init__(self, path):
+        import pyinotify
+        self._path = path
+        self._lock = threading.Lock()
+        self._scripts = {}
+        self._version = 0
+        self._wm = pyinotify.WatchManager()
+        self._notifier = pyinotify.ThreadedNotifier(
+            self._wm, default_proc_fun=self._invalidate)
+        self._notifier.name = 'hooks-watcher'
+        self._notifier.daemon = True
+        self._mask = (pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+                      pyinotify.IN_ATTRIB | pyinotify.IN_MOVED_FROM |
+                      pyinotify.IN_MOVED_TO | pyinotify.IN_Q_OVERFLOW)
+
+    def start(self):
+        try:
+            self._wm.add_watch(self._path, self._mask, rec=True,
+                               auto_add=True, quiet=False)
+        except Exception:
+            self._wm.close()
+            raise
+        self._notifier.start()
+
+    def stop(self):
+        self._notifier.stop()
+
+    def get(self, dir):
+        with self._lock:
+            scripts = self._scripts.get(dir)
+            version = self._version
+        if scripts is None:
+            scripts = _listScripts(os.path.join(self._path, dir))
+            with self._lock:
+                # Do not cache stale scripts if modified while listing.
+                if version == self._version:
+                    self._scripts[dir] = scripts
+        return list(scripts)
+
+    def _invalidate(self, event):
+        with self._lock:
+            self._version += 1
+            self._scripts.clear()
+
+
+_scriptsCache = None
+
+
+def start():
+    """
+    Start caching the scripts of the hook directories. Until started, the
+    scripts are looked up on each hook invocation.
+    """
+    global _scriptsCache
+    cache = _ScriptsCache(P_VDSM_HOOKS)
+    try:
+        cache.start()
+    except Exception:
+        logging.exception("Cannot watch %s, hooks scripts will not be "
+                          "cached", P_VDSM_HOOKS)
+    else:
+        _scriptsCache = cache
+
+
+def stop():
+    global _scriptsCache
+    cache = _scriptsCache
+    _scriptsCache = None
+    if cache is not None:
+        cache.stop()
+
+
+def _listScripts(path):
+    return [s for s in glob.glob(path + '/*')
+            if os.access(s, os.X_OK)]
+
+
 # dir path is relative to '/' for test purposes
 # otherwise path is relative to P_VDSM_HOOKS
 def _scriptsPerDir(dir):
     if (dir[0] == '/'):
-        path = dir
-    else:
-        path = P_VDSM_HOOKS + dir
-    return [s for s in glob.glob(path + '/*')
-            if os.access(s, os.X_OK)]
+        return _listScripts(dir)
+    cache = _scriptsCache
+    if cache is not None:
+        return cache.get(dir)
+    return _listScripts(P_VDSM_HOOKS + dir)
 
 _DOMXML_HOOK = 1
 _JSON_HOOK = 2
@@ -54,10 +54,40 @@ class InvalidCall(Exception):
                 (self.function, self.arguments, self.error))
 
 
+class _Command(object):
+    """
+    Dispatch information of a schema command, compiled when the bridge is
+    created so calls do not need to look up the schema and the API
+    classes.
+
+    argNames        the names of the command arguments in the schema,
+                    used to name positional arguments
+    ctorArgs        the names of the arguments passed to the API class
+                    constructor
+    methodArgs      (name, hasDefault, default) for each argument passed to
+                    the API method
+    argFixups       (index, typeName) for each method argument whose type
+                    needs fixups
+    retFixup        the return type if it needs fixups, otherwise None
+    """
+
+    __slots__ = ('name', 'className', 'methodName', 'apiClass', 'argNames',
+                 'ctorArgs', 'methodArgs', 'argFixups', 'retFixup', 'call',
+                 'ret', 'gluster')
+
+
 class DynamicBridge(object):
     def __init__(self):
         self.api = vdsmapi.get_api()
         self._threadLocal = threading.local()
+        self._fixupFields = self._compileFixups()
+        self._methods = {}
+        for className, commands in self.api['commands'].iteritems():
+            for methodName, sym in commands.iteritems():
+                command = self._compileCommand(className, methodName, sym)
+                if command is not None:
+                    self._methods[command.name] = partial(self._dynamicMethod,
+                                                          command)
 
     def register_server_address(self, server_address):
         self._threadLocal.server = server_address
@@ -82,21 +112,6 @@ class DynamicBridge(object):
 
         return result
 
-    def _getArgs(self, argobj, arglist, defaultArgs):
-        ret = ()
-        for arg in arglist:
-            if arg.startswith('*'):
-                name = self._symNameFilter(arg)
-                if name in argobj:
-                    ret = ret + (argobj[name],)
-                else:
-                    if len(defaultArgs) > 0:
-                        ret = ret + (defaultArgs[0],)
-                defaultArgs = defaultArgs[1:]
-            elif arg in argobj:
-                ret = ret + (argobj[arg],)
-        return ret
-
     def _getResult(self, response, member=None):
         if member is None:
             return None
@@ -106,12 +121,14 @@ class DynamicBridge(object):
             raise VdsmError(5, "Response is missing '%s' member" % member)
 
     def __getattr__(self, attr):
-        try:
-            className, methodName = attr.split('_')
-            self.api['commands'][className][methodName]
-        except (KeyError, ValueError):
-            raise AttributeError("Attribute not found '%s'" % attr)
-        return partial(self._dynamicMethod, className, methodName)
+        # Private attributes are never commands, and _methods may not be set
+        # yet.
+        if not attr.startswith('_'):
+            try:
+                return self._methods[attr]
+            except KeyError:
+                pass
+        raise AttributeError("Attribute not found '%s'" % attr)
 
     def _convertClassName(self, name):
         """
@@ -125,7 +142,7 @@ class DynamicBridge(object):
         except KeyError:
             return name
 
-    def _getMethodArgs(self, className, methodName, argObj):
+    def _compileCommand(self, className, methodName, sym):
         """
         An internal API call currently looks like:
 
@@ -136,52 +153,71 @@ class DynamicBridge(object):
         works.  Each API.py object defines its ctor_args so that we can query
         them from here.  For any given method, the method_args are obtained by
         chopping off the ctor_args from the beginning of argObj.
-        """
-        # Get the full argument list
-        sym = self.api['commands'][className][methodName]
-        allArgs = sym.get('data', {}).keys()
 
-        className = self._convertClassName(className)
-        # Get the list of ctor_args
-        if _glusterEnabled and className.startswith('Gluster'):
-            ctorArgs = getattr(gapi, className).ctorArgs
-            defaultArgs = self._getDefaultArgs(gapi, className, methodName)
+        Returns None if there is no API class for the command.
+        """
+        apiClassName = self._convertClassName(className)
+        if _glusterEnabled and apiClassName.startswith('Gluster'):
+            apiClass = getattr(gapi, apiClassName, None)
         else:
-            ctorArgs = getattr(API, className).ctorArgs
-            defaultArgs = self._getDefaultArgs(API, className, methodName)
+            apiClass = getattr(API, apiClassName, None)
+        if apiClass is None:
+            return None
 
-        # Determine the method arguments by subtraction
-        methodArgs = []
-        for arg in allArgs:
+        command = _Command()
+        command.name = '%s_%s' % (className, methodName)
+        command.className = className
+        command.methodName = methodName
+        command.apiClass = apiClass
+        command.gluster = _glusterEnabled and className.startswith('Gluster')
+
+        argDef = sym.get('data', {})
+        command.argNames = argDef.keys()
+        command.ctorArgs = apiClass.ctorArgs
+
+        # Determine the method arguments by subtraction. Optional arguments
+        # missing in the call use the defaults of the API method.
+        defaultArgs = self._getDefaultArgs(apiClass, methodName)
+        command.methodArgs = []
+        for arg in command.argNames:
             name = self._symNameFilter(arg)
+            if name in command.ctorArgs:
+                continue
+            if arg.startswith('*'):
+                if defaultArgs:
+                    command.methodArgs.append((name, True, defaultArgs[0]))
+                else:
+                    command.methodArgs.append((name, False, None))
+                defaultArgs = defaultArgs[1:]
+            else:
+                command.methodArgs.append((arg, False, None))
 
-            if name not in ctorArgs:
-                methodArgs.append(arg)
-
-        return self._getArgs(argObj, methodArgs, defaultArgs)
-
-    def _getDefaultArgs(self, api, className, methodName):
-        result = []
-        for class_name, class_obj in inspect.getmembers(api, inspect.isclass):
-            if class_name == className:
-                for method_name, method_obj in inspect.getmembers(
-                        class_obj, inspect.ismethod):
-                    if method_name == methodName:
-                        args = inspect.getargspec(method_obj).defaults
-                        if args:
-                            result = list(args)
-        return result
-
-    def _getApiInstance(self, className, argObj):
-        className = self._convertClassName(className)
+        command.argFixups = []
+        for i, argType in enumerate(argDef.values()):
+            if isinstance(argType, list):
+                # check type of first element
+                argType = argType[0]
+            if self._needsFixup(argType):
+                command.argFixups.append((i, argType))
 
-        if _glusterEnabled and className.startswith('Gluster'):
-            apiObj = getattr(gapi, className)
+        retType = sym.get('returns')
+        if retType is not None and self._needsFixup(retType):
+            command.retFixup = retType
         else:
-            apiObj = getattr(API, className)
+            command.retFixup = None
 
-        ctorArgs = self._getArgs(argObj, apiObj.ctorArgs, [])
-        return apiObj(*ctorArgs)
+        info = command_info.get(command.name, {})
+        command.call = info.get('call')
+        command.ret = info.get('ret')
+        return command
+
+    def _getDefaultArgs(self, apiClass, methodName):
+        method = getattr(apiClass, methodName, None)
+        if inspect.ismethod(method):
+            args = inspect.getargspec(method).defaults
+            if args:
+                return list(args)
+        return []
 
     def _symNameFilter(self, symName):
         """
@@ -192,16 +228,47 @@ class DynamicBridge(object):
             symName = symName[1:]
         return symName
 
+    def _compileFixups(self):
+        """
+        Return the schema types containing values that need fixups, mapping
+        each type to the (name, type) of its fields needing fixups.
+        Values of other types are not walked when fixing up arguments and
+        results.
+        """
+        apiTypes = self.api['types']
+        needed = set(name for name in typefixups if name in apiTypes)
+        changed = True
+        while changed:
+            changed = False
+            for name, symbol in apiTypes.iteritems():
+                if name in needed:
+                    continue
+                for fieldType in symbol.get('data', {}).values():
+                    if _itemType(fieldType) in needed:
+                        needed.add(name)
+                        changed = True
+                        break
+
+        fixupFields = {}
+        for name in needed:
+            fixupFields[name] = [
+                (self._symNameFilter(k), v)
+                for k, v in apiTypes[name].get('data', {}).items()
+                if _itemType(v) in needed]
+        return fixupFields
+
+    def _needsFixup(self, symTypeName):
+        return _itemType(symTypeName) in self._fixupFields
+
     # TODO: Add support for map types
-    def _typeFixup(self, symName, symTypeName, obj):
+    def _typeFixup(self, symTypeName, obj):
         isList = False
         if isinstance(symTypeName, list):
             symTypeName = symTypeName[0]
             isList = True
-        symName = self._symNameFilter(symName)
 
         try:
-            symbol = self.api['types'][symTypeName]
+            fields = self._fixupFields[symTypeName]
         except KeyError:
             return
 
@@ -210,33 +277,13 @@ class DynamicBridge(object):
         else:
             itemList = [obj]
 
+        fixup = typefixups.get(symTypeName)
         for item in itemList:
-            if symTypeName in typefixups:
-                typefixups[symTypeName](item)
-            for (k, v) in symbol.get('data', {}).items():
-                k = self._symNameFilter(k)
+            if fixup is not None:
+                fixup(item)
+            for k, v in fields:
                 if k in item:
-                    self._typeFixup(k, v, item[k])
-
-    def _fixupArgs(self, className, methodName, args):
-        argDef = self.api['commands'][className][methodName].get('data', {})
-        argInfo = zip(argDef.items(), args)
-        for typeInfo, val in argInfo:
-            argName, argType = typeInfo
-            if isinstance(argType, list):
-                # check type of first element
-                argType = argType[0]
-            if argType not in self.api['types']:
-                continue
-            if val is None:
-                continue
-            self._typeFixup(argName, argType, val)
-
-    def _fixupRet(self, className, methodName, result):
-        retType = self._getRetList(className, methodName)
-        if retType is not None:
-            self._typeFixup('return', retType, result)
-        return result
+                    self._typeFixup(v, item[k])
 
     def _getRetList(self, className, methodName):
         return self.api['commands'][className][methodName].get('returns')
@@ -253,20 +300,27 @@ class DynamicBridge(object):
         sym = self.api['commands'][className][methodName]
         return sym.get('data', {}).keys()
 
-    def _dynamicMethod(self, className, methodName, *args, **kwargs):
-        argobj = self._nameArgs(args, kwargs,
-                                self._getArgList(className, methodName))
-        api = self._getApiInstance(className, argobj)
-        methodArgs = self._getMethodArgs(className, methodName, argobj)
-        self._fixupArgs(className, methodName, methodArgs)
+    def _dynamicMethod(self, command, *args, **kwargs):
+        argobj = self._nameArgs(args, kwargs, command.argNames)
+        api = command.apiClass(*[argobj[name] for name in command.ctorArgs
+                                 if name in argobj])
+
+        methodArgs = []
+        for name, hasDefault, default in command.methodArgs:
+            if name in argobj:
+                methodArgs.append(argobj[name])
+            elif hasDefault:
+                methodArgs.append(default)
+
+        for i, argType in command.argFixups:
+            if i < len(methodArgs) and methodArgs[i] is not None:
+                self._typeFixup(argType, methodArgs[i])
 
         # Call the override function (if given).  Otherwise, just call directly
-        cmd = '%s_%s' % (className, methodName)
-        fn = command_info.get(cmd, {}).get('call')
-        if fn:
-            result = fn(api, argobj)
+        if command.call:
+            result = command.call(api, argobj)
         else:
-            fn = getattr(api, methodName)
+            fn = getattr(api, command.methodName)
             try:
                 if _glusterEnabled:
                     try:
@@ -283,18 +337,33 @@ class DynamicBridge(object):
             msg = result['status']['message']
             raise yajsonrpc.JsonRpcError(code, msg)
 
-        retfield = command_info.get(cmd, {}).get('ret')
+        retfield = command.ret
         if isinstance(retfield, types.FunctionType):
-            if cmd == 'Host_getCapabilities':
+            if command.name == 'Host_getCapabilities':
                 ret = retfield(self._threadLocal.server, result)
             else:
                 ret = retfield(result)
-        elif _glusterEnabled and className.startswith('Gluster'):
+        elif command.gluster:
             ret = dict([(key, value) for key, value in result.items()
                         if key is not 'status'])
         else:
             ret = self._getResult(result, retfield)
-        return self._fixupRet(className, methodName, ret)
+
+        if command.retFixup is not None:
+            self._typeFixup(command.retFixup, ret)
+        return ret
+
+
+def _itemType(symTypeName):
+    """
+    Return the type name of a schema type, or of the items of a list type.
+    Returns None for inline types.
+    """
+    if isinstance(symTypeName, list):
+        symTypeName = symTypeName[0]
+    if isinstance(symTypeName, basestring):
+        return symTypeName
+    return None
 
 
 def Host_fenceNode_Ret(ret):
@@ -414,6 +483,7 @@ command_info = {
     'Host_getConvertedVm': {'ret': 'ovf'},
     'Host_getHardwareInfo': {'ret': 'info'},
     'Host_getLVMVolumeGroups': {'ret': 'vglist'},
+    'Host_getRpcStats': {'ret': 'info'},
     'Host_getStats': {'ret': 'info'},
     'Host_getStorageDomains': {'ret': 'domlist'},
     'Host_getStorageRepoStats': {'ret': Host_getStorageRepoStats_Ret},
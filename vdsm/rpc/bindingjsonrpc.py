@@ -15,22 +15,211 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 import threading
 import logging
+from functools import partial
 
-from yajsonrpc import JsonRpcServer
+from vdsm import executor
+from vdsm.config import config
+from vdsm.utils import monotonic_time
+from yajsonrpc import JsonRpcServer, JsonRpcServerBusyError
 from yajsonrpc.stompreactor import StompReactor
 
+import vdsmapi
 
-def _simpleThreadFactory(func):
-    t = threading.Thread(target=func)
-    t.setDaemon(False)
-    t.start()
+
+# Lanes are assigned to verbs in the schema using the optional 'lane' key.
+# Verbs without a lane are served in the control lane.
+LANE_MONITORING = 'monitoring'
+LANE_CONTROL = 'control'
+LANE_STORAGE = 'storage'
+
+_LANE_THREADS = {
+    LANE_MONITORING: config.getint('rpc', 'monitoring_worker_threads'),
+    LANE_CONTROL: config.getint('rpc', 'worker_threads'),
+    LANE_STORAGE: config.getint('rpc', 'storage_worker_threads'),
+}
+_TASK_PER_WORKER = config.getint('rpc', 'tasks_per_worker')
+_TIMEOUT = config.getint('rpc', 'worker_timeout')
+
+
+def _parse_timeouts(value):
+    """
+    Parse "method:seconds" comma separated pairs into a dict. Malformed
+    pairs are logged and ignored.
+    """
+    timeouts = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            method, timeout = item.rsplit(':', 1)
+            timeouts[method.strip()] = int(timeout)
+        except ValueError:
+            logging.warning("Ignoring invalid worker timeout override: %r",
+                            item)
+    return timeouts
+
+
+def _method_lanes(api):
+    """
+    Map "Class.method" names to the lane declared in the schema.
+    """
+    lanes = {}
+    for className, commands in api['commands'].iteritems():
+        for methodName, command in commands.iteritems():
+            name = '%s.%s' % (className, methodName)
+            lanes[name] = command.get('lane', LANE_CONTROL)
+    return lanes
+
+
+class RequestExecutor(object):
+    """
+    Serves jsonrpc requests using a bounded pool of worker threads.
+
+    Requests are queued up to max_tasks; when the queue is full, the
+    request is rejected with JsonRpcServerBusyError. A worker blocked on
+    a request longer than the method timeout is replaced with a fresh one.
+    """
+
+    log = logging.getLogger('jsonrpc.RequestExecutor')
+
+    def __init__(self, scheduler, name="jsonrpc", workers=8, max_tasks=80,
+                 timeout=_TIMEOUT, method_timeouts=None, stats_timeout=3600):
+        self._name = name
+        self._executor = executor.Executor(name=name,
+                                           workers_count=workers,
+                                           max_tasks=max_tasks,
+                                           scheduler=scheduler)
+        self._timeout = timeout
+        if method_timeouts is None:
+            method_timeouts = _parse_timeouts(
+                config.get('rpc', 'worker_timeout_overrides'))
+        self._method_timeouts = method_timeouts
+        self._stats_timeout = stats_timeout
+        self._lock = threading.Lock()
+        self._next_report = monotonic_time() + stats_timeout
+        self._reset_stats()
+
+    def start(self):
+        self._executor.start()
+
+    def stop(self):
+        self._executor.stop(wait=False)
+
+    def timeout(self, method):
+        return self._method_timeouts.get(method, self._timeout)
+
+    def dispatch(self, func, method):
+        queued = monotonic_time()
+        try:
+            self._executor.dispatch(partial(self._run, func, queued),
+                                    self.timeout(method))
+        except executor.TooManyTasks:
+            with self._lock:
+                self._rejected += 1
+            raise JsonRpcServerBusyError(method)
+
+    def stats(self):
+        """
+        Return the counters collected since the last report.
+        """
+        with self._lock:
+            return {'served': self._served,
+                    'rejected': self._rejected,
+                    'queue_wait': self._queue_wait,
+                    'max_queue_wait': self._max_queue_wait,
+                    'execution': self._execution,
+                    'max_execution': self._max_execution}
+
+    def _run(self, func, queued):
+        started = monotonic_time()
+        try:
+            func()
+        finally:
+            self._account(started - queued, monotonic_time() - started)
+
+    def _account(self, wait, execution):
+        with self._lock:
+            self._served += 1
+            self._queue_wait += wait
+            self._max_queue_wait = max(self._max_queue_wait, wait)
+            self._execution += execution
+            self._max_execution = max(self._max_execution, execution)
+            if monotonic_time() < self._next_report:
+                return
+            self._next_report += self._stats_timeout
+            served = self._served
+            rejected = self._rejected
+            queue_wait = self._queue_wait
+            max_queue_wait = self._max_queue_wait
+            execution = self._execution
+            max_execution = self._max_execution
+            self._reset_stats()
+
+        self.log.info('%s: %s requests served, %s rejected during %s '
+                      'seconds; queue wait avg=%.3f max=%.3f, '
+                      'execution avg=%.3f max=%.3f',
+                      self._name, served, rejected, self._stats_timeout,
+                      queue_wait / served, max_queue_wait,
+                      execution / served, max_execution)
+
+    def _reset_stats(self):
+        self._served = 0
+        self._rejected = 0
+        self._queue_wait = 0.0
+        self._max_queue_wait = 0.0
+        self._execution = 0.0
+        self._max_execution = 0.0
+
+
+class LaneDispatcher(object):
+    """
+    Dispatches jsonrpc requests to per-lane RequestExecutors, so slow verbs
+    in one lane cannot starve the workers of another lane.
+    """
+
+    def __init__(self, scheduler, method_lanes, lane_threads=_LANE_THREADS,
+                 tasks_per_worker=_TASK_PER_WORKER, stats_timeout=3600):
+        self._method_lanes = method_lanes
+        self._executors = {}
+        for lane, workers in lane_threads.iteritems():
+            self._executors[lane] = RequestExecutor(
+                scheduler,
+                name="jsonrpc.%s" % lane,
+                workers=workers,
+                max_tasks=workers * tasks_per_worker,
+                stats_timeout=stats_timeout)
+
+    def start(self):
+        for lane_executor in self._executors.itervalues():
+            lane_executor.start()
+
+    def stop(self):
+        for lane_executor in self._executors.itervalues():
+            lane_executor.stop()
+
+    def lane(self, method):
+        lane = self._method_lanes.get(method, LANE_CONTROL)
+        if lane not in self._executors:
+            lane = LANE_CONTROL
+        return lane
+
+    def dispatch(self, func, method):
+        self._executors[self.lane(method)].dispatch(func, method)
+
+    def stats(self):
+        return dict((lane, lane_executor.stats())
+                    for lane, lane_executor in self._executors.iteritems())
 
 
 class BindingJsonRpc(object):
     log = logging.getLogger('BindingJsonRpc')
 
-    def __init__(self, bridge, subs, timeout):
-        self._server = JsonRpcServer(bridge, timeout, _simpleThreadFactory)
+    def __init__(self, bridge, subs, timeout, scheduler):
+        self._executor = LaneDispatcher(
+            scheduler, _method_lanes(vdsmapi.get_api()),
+            stats_timeout=timeout)
+        self._server = JsonRpcServer(bridge, timeout, self._executor.dispatch)
         self._reactor = StompReactor(subs)
         self.startReactor()
 
@@ -45,6 +234,8 @@ class BindingJsonRpc(object):
         return self._reactor
 
     def start(self):
+        self._executor.start()
+
         t = threading.Thread(target=self._server.serve_requests,
                              name='JsonRpcServer')
         t.setDaemon(True)
@@ -60,3 +251,4 @@ class BindingJsonRpc(object):
     def stop(self):
         self._server.stop()
         self._reactor.stop()
+        self._executor.stop()
@@ -24,12 +24,14 @@ import httplib
 import logging
 import libvirt
 import threading
+import time
 import re
 import sys
 
 from vdsm.password import (ProtectedPassword,
                            protect_passwords,
                            unprotect_passwords)
+from vdsm import rpcstats
 from vdsm import utils
 from vdsm import xmlrpc
 from vdsm.define import doneCode, errCode
@@ -542,6 +544,10 @@ class BindingXMLRPC(object):
         api = API.Global()
         return api.getAllVmStats()
 
+    def getRpcStats(self):
+        api = API.Global()
+        return api.getRpcStats()
+
     def hostdevListByCaps(self, caps=None):
         api = API.Global()
         return api.hostdevListByCaps(caps)
@@ -1071,6 +1077,7 @@ class BindingXMLRPC(object):
                 (self.getHardwareInfo, 'getVdsHardwareInfo'),
                 (self.diskGetAlignment, 'getDiskAlignment'),
                 (self.getStats, 'getVdsStats'),
+                (self.getRpcStats, 'getRpcStats'),
                 (self.vmGetStats, 'getVmStats'),
                 (self.getAllVmStats, 'getAllVmStats'),
                 (self.hostdevListByCaps, 'hostdevListByCaps'),
@@ -1257,22 +1264,32 @@ def wrapApiMethod(f):
             f.__self__.log.log(logLevel, logStr)
 
             if f.__self__.cif.ready:
-                res = f(*args, **kwargs)
+                start = time.time()
+                try:
+                    res = f(*args, **kwargs)
+                finally:
+                    rpcstats.add(rpcstats.XMLRPC, f.__name__,
+                                 rpcstats.DISPATCH, time.time() - start)
             else:
                 res = errCode['recovery']
+            if _isError(res):
+                rpcstats.add_error(rpcstats.XMLRPC, f.__name__)
             f.__self__.cif.log.log(logLevel, 'return %s with %s',
                                    f.__name__, res)
             return res
         except libvirt.libvirtError as e:
+            rpcstats.add_error(rpcstats.XMLRPC, f.__name__)
             f.__self__.cif.log.error("libvirt error", exc_info=True)
             if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
                 return errCode['noVM']
             else:
                 return errCode['unexpected']
         except VdsmException as e:
+            rpcstats.add_error(rpcstats.XMLRPC, f.__name__)
             f.__self__.cif.log.error("vdsm exception occured", exc_info=True)
             return e.response()
         except:
+            rpcstats.add_error(rpcstats.XMLRPC, f.__name__)
             f.__self__.cif.log.error("unexpected error", exc_info=True)
             return errCode['unexpected']
     wrapper.__name__ = f.__name__
@@ -1280,6 +1297,13 @@ def wrapApiMethod(f):
     return wrapper
 
 
+def _isError(res):
+    try:
+        return res['status']['code'] != 0
+    except (TypeError, KeyError):
+        return False
+
+
 class XmlDetector():
     log = logging.getLogger("XmlDetector")
     NAME = "xml"
@@ -24,7 +24,11 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+import errno
+import hashlib
+import logging
 import os
+import tempfile
 
 try:
     from collections import OrderedDict
@@ -32,6 +36,18 @@ try:
 except ImportError:
     from ordereddict import OrderedDict
 
+try:
+    import cPickle as pickle
+    pickle  # make pyflakes happy
+except ImportError:
+    import pickle
+
+# Bump when the structure returned by get_api() changes, invalidating
+# existing cache files.
+_CACHE_FORMAT = 1
+
+_log = logging.getLogger("vdsmapi")
+
 
 def tokenize(data):
     while len(data):
@@ -178,6 +194,7 @@ def _load_api_info(schema):
      }
      'data': <an optional ordered dictionary of parameters in name/type pairs>
      'returns': <the type of the return value, if any>
+     'lane': <an optional jsonrpc executor lane serving this command>
     }
 
     unions: A dictionary that describes valid casts between related types.
@@ -185,22 +202,45 @@ def _load_api_info(schema):
     to which the source type may be cast.
     """
     global _api_info
-    gluster_schema = None
 
-    info_key = schema
     if schema is None:
-        schema = find_schema()
-        gluster_schema = find_schema(schema_name='vdsmapi-gluster',
-                                     raiseOnError=False)
+        info = _load_installed_api_info()
+    else:
+        with open(schema) as f:
+            info = _build_api_info([f.read()])
+
+    _api_info = {schema: info}
 
-    with open(schema) as f:
-        symbols = parse_schema(f)
 
+def _load_installed_api_info():
+    """
+    Load the installed schema, using the compiled cache when available.
+    """
+    schemas = [find_schema()]
     # If gluster schema file present inside gluster directory then read and
     # parse, append to symbols
+    gluster_schema = find_schema(schema_name='vdsmapi-gluster',
+                                 raiseOnError=False)
     if gluster_schema:
-        with open(gluster_schema) as f:
-            symbols += parse_schema(f)
+        schemas.append(gluster_schema)
+
+    contents = []
+    for path in schemas:
+        with open(path) as f:
+            contents.append(f.read())
+
+    path = _cache_path(contents)
+    info = _read_cache(path)
+    if info is None:
+        info = _build_api_info(contents)
+        _write_cache(path, info)
+    return info
+
+
+def _build_api_info(contents):
+    symbols = []
+    for data in contents:
+        symbols += parse_schema(data.splitlines(True))
 
     info = {'types': {}, 'enums': {}, 'aliases': {}, 'maps': {},
             'commands': {}, 'unions': {}}
@@ -236,13 +276,87 @@ def _load_api_info(schema):
             add_relation(info['unions'], u, t['type'])
             add_relation(info['unions'], t['type'], u)
 
-    _api_info = {info_key: info}
+    return info
+
+
+def _cache_dir():
+    from vdsm import constants
+    return os.path.join(constants.P_VDSM_LIB, 'schema')
+
+
+def _cache_path(contents):
+    """
+    Return the path of the cache file for the schema files contents.
+    Modifying any of the schema files or the cache format results in a
+    different path, so stale cache files are never used.
+    """
+    digest = hashlib.sha1(str(_CACHE_FORMAT))
+    for data in contents:
+        digest.update(data)
+    return os.path.join(_cache_dir(), 'vdsmapi-%s.pickle' % digest.hexdigest())
+
+
+def _read_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            _log.warning("Cannot read schema cache %s: %s", path, e)
+    except Exception:
+        _log.warning("Ignoring invalid schema cache %s", path, exc_info=True)
+    return None
+
+
+def _write_cache(path, info):
+    """
+    Write the cache atomically, so concurrent readers never see a partial
+    file. The cache is an optimization; failing to write it, for example
+    when running as unprivileged user, is not an error.
+    """
+    dirname = os.path.dirname(path)
+    try:
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.vdsmapi-')
+    except OSError as e:
+        if e.errno not in (errno.ENOENT, errno.EACCES, errno.EROFS):
+            _log.warning("Cannot create schema cache in %s: %s", dirname, e)
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(info, f, pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except EnvironmentError as e:
+        _log.warning("Cannot write schema cache %s: %s", path, e)
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return
+    _remove_stale_caches(path)
+
+
+def _remove_stale_caches(path):
+    """
+    Remove cache files of previous schema versions.
+    """
+    dirname = os.path.dirname(path)
+    for name in os.listdir(dirname):
+        stale = os.path.join(dirname, name)
+        if (name.startswith('vdsmapi-') and name.endswith('.pickle') and
+                stale != path):
+            try:
+                os.unlink(stale)
+            except OSError as e:
+                _log.warning("Cannot remove stale schema cache %s: %s",
+                             stale, e)
 
 
 def get_api(schema=None):
     """
     Get organized information about the vdsm API.  If schema is specified,
-    read from a specific file.  Otherwise try to find the schema automatically.
+    read from a specific file.  Otherwise try to find the schema automatically,
+    and use the compiled schema cache when possible.
     """
     if _api_info is None or schema not in _api_info:
         _load_api_info(schema)
@@ -34,10 +34,12 @@ import logging
 from collections import namedtuple
 import pprint as pp
 import threading
+from contextlib import contextmanager
 from itertools import chain
 from subprocess import list2cmdline
 
 from vdsm import constants
+from vdsm import utils
 import misc
 import multipath
 import storage_exception as se
@@ -95,6 +97,17 @@ re_pvName = re.compile(PV_PREFIX + '[^\s\"]+', re.MULTILINE)
 # operations lock
 LVM_OP_INVALIDATE = "lvm invalidate operation"
 LVM_OP_RELOAD = "lvm reload operation"
+# Operations on the lvs of a single vg
+LVM_OP_VG = "lvm vg operation"
+
+# lvchange options that can be run on several lvs as a single command. These
+# operations are idempotent, so if a batch fails, each request can be
+# retried separately.
+BATCH_LVCHANGE_OPTIONS = frozenset([
+    LVM_NOBACKUP + ("--available", "y"),
+    LVM_NOBACKUP + ("--available", "n"),
+    ("--refresh",),
+])
 
 PVS_CMD = ("pvs",) + LVM_FLAGS + ("-o", PV_FIELDS)
 VGS_CMD = ("vgs",) + LVM_FLAGS + ("-o", VG_FIELDS)
@@ -234,6 +247,219 @@ def makeLV(*args):
     return LV(*args)
 
 
+class _BatchRequest(object):
+
+    __slots__ = ("lvs", "batch", "result", "error", "done")
+
+    def __init__(self, lvs):
+        self.lvs = lvs
+        # Set when this request should run a batch for other requests
+        self.batch = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchRunner(object):
+    """
+    Runs lvm commands that differ only in the lvs they operate on as a
+    single command.
+
+    A request submitted when no command with the same key is running runs
+    immediately. Requests submitted while such command is running are
+    queued, and when the running command finishes, the first queued request
+    runs all of them as one command.
+
+    If a batch of several requests fails, each request is run again
+    separately, so a failure in one lv does not fail other requests.
+    """
+
+    def __init__(self, run):
+        """
+        run(key, lvs) runs the command for key on the lvs list, returning
+        (rc, out, err).
+        """
+        self._run = run
+        self._lock = threading.Lock()
+        self._queues = {}
+
+    def run(self, key, lvs):
+        req = _BatchRequest(tuple(lvs))
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                self._queues[key] = []
+                batch = [req]
+            else:
+                queue.append(req)
+                batch = None
+
+        if batch is None:
+            req.done.wait()
+            if req.batch is None:
+                # Completed by another request
+                if req.error is not None:
+                    raise req.error
+                return req.result
+            batch = req.batch
+
+        try:
+            self._runBatch(key, batch)
+        finally:
+            self._handoff(key)
+            for other in batch:
+                if other is not req:
+                    other.done.set()
+
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _runBatch(self, key, batch):
+        if len(batch) == 1:
+            self._runRequest(key, batch[0])
+            return
+
+        lvs = []
+        for req in batch:
+            lvs.extend(lv for lv in req.lvs if lv not in lvs)
+        log.debug("Running %d requests as one command: key=%s lvs=%s",
+                  len(batch), key, lvs)
+        try:
+            result = self._run(key, lvs)
+        except Exception as e:
+            result = None
+            log.warning("Batched command failed: key=%s error=%s", key, e)
+        if result is not None and result[0] == 0:
+            for req in batch:
+                req.result = result
+        else:
+            for req in batch:
+                self._runRequest(key, req)
+
+    def _runRequest(self, key, req):
+        try:
+            req.result = self._run(key, req.lvs)
+        except Exception as e:
+            req.error = e
+
+    def _handoff(self, key):
+        with self._lock:
+            queue = self._queues[key]
+            if queue:
+                self._queues[key] = []
+                queue[0].batch = queue
+                queue[0].done.set()
+            else:
+                del self._queues[key]
+
+
+class CommandStats(object):
+    """
+    Thread safe per-command latency statistics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, name, elapsed, failed):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {"count": 0, "errors": 0,
+                                             "total": 0.0, "max": 0.0}
+            stats["count"] += 1
+            if failed:
+                stats["errors"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+
+    def info(self):
+        with self._lock:
+            return dict((name, dict(stats))
+                        for name, stats in self._stats.iteritems())
+
+
+class VGLvs(object):
+    """
+    The LVs of a single VG, indexed by name and by tag.
+
+    Stubs are tracked separately, so checking if the VG has stale LVs does
+    not scan all the LVs, and finding the LVs with a tag is O(result).
+
+    Thread safe; reloads of the same VG may run concurrently (see
+    LVMCache._lvsOperation).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lvs = {}
+        self._stubs = set()
+        self._tags = {}
+        # True until all the LVs of the VG were loaded
+        self.stale = True
+
+    def __len__(self):
+        return len(self._lvs)
+
+    def __contains__(self, lvName):
+        return lvName in self._lvs
+
+    def get(self, lvName):
+        return self._lvs.get(lvName)
+
+    def names(self):
+        with self._lock:
+            return self._lvs.keys()
+
+    def lvs(self):
+        with self._lock:
+            return self._lvs.values()
+
+    def put(self, lvName, lv):
+        with self._lock:
+            self._pop(lvName)
+            self._lvs[lvName] = lv
+            if isinstance(lv, Stub):
+                self._stubs.add(lvName)
+            else:
+                for tag in lv.tags:
+                    self._tags.setdefault(tag, set()).add(lvName)
+
+    def pop(self, lvName):
+        with self._lock:
+            return self._pop(lvName)
+
+    def _pop(self, lvName):
+        lv = self._lvs.pop(lvName, None)
+        if lv is None:
+            return None
+        if isinstance(lv, Stub):
+            self._stubs.discard(lvName)
+        else:
+            for tag in lv.tags:
+                names = self._tags.get(tag)
+                if names is not None:
+                    names.discard(lvName)
+                    if not names:
+                        del self._tags[tag]
+        return lv
+
+    def hasStubs(self):
+        with self._lock:
+            return len(self._stubs) > 0
+
+    def stubs(self):
+        with self._lock:
+            return list(self._stubs)
+
+    def byTag(self, tag):
+        with self._lock:
+            lvs = [self._lvs.get(name) for name in self._tags.get(tag, ())]
+        return [lv for lv in lvs if lv is not None and tag in lv.tags]
+
+
 class LVMCache(object):
     """
     Keep all the LVM information.
@@ -279,16 +505,25 @@ class LVMCache(object):
         self._extraCfg = None
         self._filterLock = threading.Lock()
         self._oplock = misc.OperationMutex()
+        # Lvs are locked per vg, see _lvsOperation()
+        self._lvsLock = misc.OperationMutex()
+        self._vgMutexesLock = threading.Lock()
+        self._vgMutexes = {}
         self._stalepv = True
         self._stalevg = True
         self._stalelv = True
         self._pvs = {}
         self._vgs = {}
         self._lvs = {}
+        self._lvchangeRunner = BatchRunner(self._runLvchange)
+        self._stats = CommandStats()
+        self._refreshMaxLvs = config.getint("irs", "lvm_refresh_max_lvs")
+        self._refreshLock = threading.Lock()
+        self._refreshCounters = {"vg_reloads": 0, "vg_reloads_avoided": 0}
 
     def cmd(self, cmd, devices=tuple()):
         finalCmd = self._addExtraCfg(cmd, devices)
-        rc, out, err = misc.execCmd(finalCmd, sudo=True)
+        rc, out, err = self._execCmd(finalCmd)
         if rc != 0:
             # Filter might be stale
             self.invalidateFilter()
@@ -298,15 +533,50 @@ class LVMCache(object):
             # the devlist is sorted there is no fear
             # of two identical filters looking differently
             if newCmd != finalCmd:
-                return misc.execCmd(newCmd, sudo=True)
+                return self._execCmd(newCmd)
 
         return rc, out, err
 
+    def _execCmd(self, cmd):
+        start = utils.monotonic_time()
+        rc, out, err = misc.execCmd(cmd, sudo=True)
+        elapsed = utils.monotonic_time() - start
+        # cmd is [lvm, command, "--config", conf, ...]
+        self._stats.add(cmd[1], elapsed, rc != 0)
+        log.debug("lvm %s completed in %.3f seconds (rc=%s)",
+                  cmd[1], elapsed, rc)
+        return rc, out, err
+
+    def lvchange(self, vgName, lvNames, options):
+        """
+        Run lvchange with options on lvNames in vgName.
+
+        Concurrent calls with the same vgName and options are run as a
+        single lvchange command if options are in BATCH_LVCHANGE_OPTIONS.
+        """
+        key = (vgName, tuple(options))
+        if key[1] in BATCH_LVCHANGE_OPTIONS:
+            return self._lvchangeRunner.run(key, lvNames)
+        return self._runLvchange(key, lvNames)
+
+    def _runLvchange(self, key, lvNames):
+        vgName, options = key
+        cmd = ("lvchange",) + options
+        cmd += tuple("%s/%s" % (vgName, lv) for lv in lvNames)
+        return self.cmd(cmd, self._getVGDevs((vgName, )))
+
+    def stats(self):
+        """
+        Return per-command statistics: count, errors, and total and max
+        latency in seconds.
+        """
+        return self._stats.info()
+
     def __str__(self):
         return ("PVS:\n%s\n\nVGS:\n%s\n\nLVS:\n%s" %
                 (pp.pformat(self._pvs),
                  pp.pformat(self._vgs),
-                 pp.pformat(self._lvs)))
+                 pp.pformat(self._allLvs())))
 
     def bootstrap(self):
         self._reloadpvs()
@@ -425,17 +695,20 @@ class LVMCache(object):
         else:
             cmd.append(vgName)
 
-        with self._oplock.acquireContext(LVM_OP_RELOAD):
+        with self._lvsOperation(vgName, LVM_OP_RELOAD):
             rc, out, err = self.cmd(cmd, self._getVGDevs((vgName, )))
 
+            vglvs = self._vglvs(vgName)
+
             if rc != 0:
                 log.warning("lvm lvs failed: %s %s %s", str(rc), str(out),
                             str(err))
-                lvNames = lvNames if lvNames else self._lvs.keys()
+                lvNames = lvNames if lvNames else vglvs.names()
                 for l in lvNames:
-                    if isinstance(self._lvs.get(l), Stub):
-                        self._lvs[l] = Unreadable(self._lvs[l].name, True)
-                return dict(self._lvs)
+                    lv = vglvs.get(l)
+                    if isinstance(lv, Stub):
+                        vglvs.put(l, Unreadable(lv.name, True))
+                return dict(((vgName, lv.name), lv) for lv in vglvs.lvs())
 
             updatedLVs = {}
             for line in out:
@@ -443,22 +716,22 @@ class LVMCache(object):
                 lv = makeLV(*fields)
                 # For LV we are only interested in its first extent
                 if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
+                    self._vglvs(lv.vg_name).put(lv.name, lv)
                     updatedLVs[(lv.vg_name, lv.name)] = lv
 
             # Determine if there are stale LVs
             if lvNames:
-                staleLVs = (lvName for lvName in lvNames
-                            if (vgName, lvName) not in updatedLVs.iterkeys())
+                staleLVs = [lvName for lvName in lvNames
+                            if (vgName, lvName) not in updatedLVs]
             else:
                 # All the LVs in the VG
-                staleLVs = (lvName for v, lvName in self._lvs.keys()
-                            if (v == vgName) and
-                            ((vgName, lvName) not in updatedLVs.iterkeys()))
+                staleLVs = [lvName for lvName in vglvs.names()
+                            if (vgName, lvName) not in updatedLVs]
+                vglvs.stale = False
 
             for lvName in staleLVs:
                 log.warning("Removing stale lv: %s/%s", vgName, lvName)
-                self._lvs.pop((vgName, lvName), None)
+                vglvs.pop(lvName)
 
             log.debug("lvs reloaded")
 
@@ -469,24 +742,75 @@ class LVMCache(object):
         Used only during bootstrap.
         """
         cmd = list(LVS_CMD)
-        rc, out, err = self.cmd(cmd)
-        if rc == 0:
-            updatedLVs = set()
-            for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                lv = makeLV(*fields)
-                # For LV we are only interested in its first extent
-                if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
-                    updatedLVs.add((lv.vg_name, lv.name))
+        with self._lvsLock.acquireContext(LVM_OP_RELOAD):
+            rc, out, err = self.cmd(cmd)
+            if rc == 0:
+                updatedLVs = set()
+                for line in out:
+                    fields = [field.strip() for field in line.split(SEPARATOR)]
+                    lv = makeLV(*fields)
+                    # For LV we are only interested in its first extent
+                    if lv.seg_start_pe == "0":
+                        self._vglvs(lv.vg_name).put(lv.name, lv)
+                        updatedLVs.add((lv.vg_name, lv.name))
+
+                # Remove stales
+                for vgName, vglvs in self._lvs.items():
+                    for lvName in vglvs.names():
+                        if (vgName, lvName) not in updatedLVs:
+                            vglvs.pop(lvName)
+                            log.error("Removing stale lv: %s/%s", vgName,
+                                      lvName)
+                    if len(vglvs) == 0:
+                        del self._lvs[vgName]
+                    else:
+                        vglvs.stale = False
+                self._stalelv = False
+        return self._allLvs()
+
+    @contextmanager
+    def _lvsOperation(self, vgName, operation):
+        """
+        Run an operation on the lvs of vgName.
 
-            # Remove stales
-            for vgName, lvName in self._lvs.keys():
-                if (vgName, lvName) not in updatedLVs:
-                    self._lvs.pop((vgName, lvName), None)
-                    log.error("Removing stale lv: %s/%s", vgName, lvName)
-            self._stalelv = False
-        return dict(self._lvs)
+        Reloading the lvs of a vg excludes invalidating them, but operations
+        on different vgs run concurrently. Operations on the lvs of all vgs
+        exclude operations on a single vg.
+        """
+        with self._lvsLock.acquireContext(LVM_OP_VG):
+            with self._vgMutex(vgName).acquireContext(operation):
+                yield
+
+    def _vgMutex(self, vgName):
+        with self._vgMutexesLock:
+            mutex = self._vgMutexes.get(vgName)
+            if mutex is None:
+                mutex = self._vgMutexes[vgName] = misc.OperationMutex()
+            return mutex
+
+    def _vglvs(self, vgName):
+        """
+        Return the LVs of vgName, creating an empty stale entry for an
+        unknown VG.
+        """
+        vglvs = self._lvs.get(vgName)
+        if vglvs is None:
+            vglvs = self._lvs.setdefault(vgName, VGLvs())
+        return vglvs
+
+    def _allLvs(self):
+        lvs = {}
+        for vgName, vglvs in self._lvs.items():
+            for lv in vglvs.lvs():
+                lvs[(vgName, lv.name)] = lv
+        return lvs
+
+    def _removelvs(self, vgName, lvNames):
+        with self._lvsOperation(vgName, LVM_OP_INVALIDATE):
+            vglvs = self._lvs.get(vgName)
+            if vglvs is not None:
+                for lvName in _normalizeargs(lvNames):
+                    vglvs.pop(lvName)
 
     def _invalidatepvs(self, pvNames):
         with self._oplock.acquireContext(LVM_OP_INVALIDATE):
@@ -511,22 +835,24 @@ class LVMCache(object):
             self._vgs.clear()
 
     def _invalidatelvs(self, vgName, lvNames=None):
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
+        with self._lvsOperation(vgName, LVM_OP_INVALIDATE):
             lvNames = _normalizeargs(lvNames)
             # Invalidate LVs in a specific VG
             if lvNames:
                 # Invalidate a specific LVs
+                vglvs = self._vglvs(vgName)
                 for lvName in lvNames:
-                    self._lvs[(vgName, lvName)] = Stub(lvName, True)
+                    vglvs.put(lvName, Stub(lvName, True))
             else:
                 # Invalidate all the LVs in a given VG
-                for lv in self._lvs.values():
-                    if not isinstance(lv, Stub):
-                        if lv.vg_name == vgName:
-                            self._lvs[(vgName, lv.name)] = Stub(lv.name, True)
+                vglvs = self._lvs.get(vgName)
+                if vglvs is not None:
+                    for lv in vglvs.lvs():
+                        if not isinstance(lv, Stub):
+                            vglvs.put(lv.name, Stub(lv.name, True))
 
     def _invalidateAllLvs(self):
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
+        with self._lvsLock.acquireContext(LVM_OP_INVALIDATE):
             self._stalelv = True
             self._lvs.clear()
 
@@ -588,10 +914,6 @@ class LVMCache(object):
         return vgs.values()
 
     def getLv(self, vgName, lvName=None):
-        # Checking self._stalelv here is suboptimal, because
-        # unnecessary reloads
-        # are done.
-
         # Return vgName/lvName info
         # If both 'vgName' and 'lvName' are None then return everything
         # If only 'lvName' is None then return all the LVs in the given VG
@@ -599,10 +921,10 @@ class LVMCache(object):
         # (we can consider returning all the LVs with a given name)
         if lvName:
             # vgName, lvName
-            lv = self._lvs.get((vgName, lvName))
+            vglvs = self._lvs.get(vgName)
+            lv = vglvs.get(lvName) if vglvs is not None else None
             if not lv or isinstance(lv, Stub):
-                # while we here reload all the LVs in the VG
-                lvs = self._reloadlvs(vgName)
+                lvs = self._refreshlvs(vgName, lvName)
                 lv = lvs.get((vgName, lvName))
                 if not lv:
                     log.warning("lv: %s not found in lvs vg: %s response",
@@ -610,29 +932,92 @@ class LVMCache(object):
             res = lv
         else:
             # vgName, None
-            # If there any stale LVs reload the whole VG, since it would
-            # cost us around same efforts anyhow and these stale LVs can
-            # be in the vg.
-            # Will be better when the pvs dict will be part of the vg.
-            # Fix me: should not be more stubs
-            if self._stalelv or any(isinstance(lv, Stub)
-                                    for lv in self._lvs.values()):
-                lvs = self._reloadlvs(vgName)
-            else:
-                lvs = dict(self._lvs)
-            # lvs = self._reloadlvs()
-            lvs = [lv for lv in lvs.values()
+            lvs = self._freshLvs(vgName)
+            res = [lv for lv in lvs
                    if not isinstance(lv, Stub) and (lv.vg_name == vgName)]
-            res = lvs
         return res
 
+    def getLvsByTag(self, vgName, tag):
+        """
+        Return the LVs in vgName having tag.
+
+        Raises se.LogicalVolumeDoesNotExistError if the refresh could not
+        read any LV of vgName, like getLV(), so callers cannot mistake a
+        failure for a VG without such LVs. LVs invalidated after the
+        refresh are skipped.
+        """
+        lvs = self._freshLvs(vgName)
+        if not any(not isinstance(lv, Stub) for lv in lvs):
+            raise se.LogicalVolumeDoesNotExistError(
+                "%s/%s" % (vgName, None))
+        vglvs = self._lvs.get(vgName)
+        if vglvs is None:
+            # The cache was flushed after the refresh
+            return [lv for lv in lvs
+                    if not isinstance(lv, Stub) and tag in lv.tags]
+        return vglvs.byTag(tag)
+
+    def _freshLvs(self, vgName):
+        """
+        Return the LVs of vgName, reloading the stale LVs.
+        """
+        vglvs = self._lvs.get(vgName)
+        if vglvs is None or vglvs.stale or vglvs.hasStubs():
+            return self._refreshlvs(vgName).values()
+        return vglvs.lvs()
+
+    def _refreshlvs(self, vgName, lvName=None):
+        """
+        Reload the stale LVs of vgName, or lvName if specified, and return
+        the LVs of vgName.
+
+        If lvName is a stub, or if all the LVs of the VG were loaded, and
+        there are few stubs in the VG, reload only the stubs using a single
+        lvs command. Otherwise reload the entire VG, since the VG may have
+        unknown LVs, and reloading many LVs costs about the same.
+        """
+        vglvs = self._lvs.get(vgName)
+        if vglvs is not None:
+            stubs = vglvs.stubs()
+            if lvName is not None:
+                targeted = lvName in stubs
+            else:
+                targeted = not vglvs.stale
+            if targeted and len(stubs) <= self._refreshMaxLvs:
+                updatedLVs = self._reloadlvs(vgName, stubs)
+                vglvs = self._vglvs(vgName)
+                if not any(isinstance(vglvs.get(name), Stub)
+                           for name in stubs):
+                    self._countRefresh("vg_reloads_avoided")
+                    lvs = dict(((vgName, lv.name), lv)
+                               for lv in vglvs.lvs())
+                    lvs.update(updatedLVs)
+                    return lvs
+                log.debug("Reloading stale lvs failed, reloading vg %s",
+                          vgName)
+
+        self._countRefresh("vg_reloads")
+        return self._reloadlvs(vgName)
+
+    def _countRefresh(self, name):
+        with self._refreshLock:
+            self._refreshCounters[name] += 1
+
+    def refreshStats(self):
+        """
+        Return the number of VG reloads done to refresh stale LVs, and the
+        number of VG reloads avoided by reloading only the stale LVs.
+        """
+        with self._refreshLock:
+            return dict(self._refreshCounters)
+
     def getAllLvs(self):
         # None, None
-        if self._stalelv or any(isinstance(lv, Stub)
-                                for lv in self._lvs.values()):
+        if self._stalelv or any(vglvs.stale or vglvs.hasStubs()
+                                for vglvs in self._lvs.values()):
             lvs = self._reloadAllLvs()
         else:
-            lvs = dict(self._lvs)
+            lvs = self._allLvs()
         return lvs.values()
 
 _lvminfo = LVMCache()
@@ -686,6 +1071,14 @@ def invalidateCache():
     _lvminfo.invalidateCache()
 
 
+def commandStats():
+    return _lvminfo.stats()
+
+
+def refreshStats():
+    return _lvminfo.refreshStats()
+
+
 def _fqpvname(pv):
     if pv and not pv.startswith(PV_PREFIX):
         pv = os.path.join(PV_PREFIX, pv)
@@ -800,18 +1193,15 @@ def changelv(vg, lvs, attrs):
     lvs = _normalizeargs(lvs)
     # If it fails or not we (may be) change the lv,
     # so we invalidate cache to reload these volumes on first occasion
-    lvnames = tuple("%s/%s" % (vg, lv) for lv in lvs)
-    cmd = ["lvchange"]
-    cmd.extend(LVM_NOBACKUP)
+    options = list(LVM_NOBACKUP)
     if isinstance(attrs[0], str):
         # ("--attribute", "value")
-        cmd.extend(attrs)
+        options.extend(attrs)
     else:
         # (("--aa", "v1"), ("--ab", "v2"))
         for attr in attrs:
-            cmd.extend(attr)
-    cmd.extend(lvnames)
-    rc, out, err = _lvminfo.cmd(tuple(cmd), _lvminfo._getVGDevs((vg, )))
+            options.extend(attr)
+    rc, out, err = _lvminfo.lvchange(vg, lvs, options)
     _lvminfo._invalidatelvs(vg, lvs)
     if rc != 0 and len(out) < 1:
         raise se.StorageException("%d %s %s\n%s/%s" % (rc, out, err, vg, lvs))
@@ -1135,7 +1525,7 @@ def removeLVs(vgName, lvNames):
     if rc == 0:
         for lvName in lvNames:
             # Remove the LV from the cache
-            _lvminfo._lvs.pop((vgName, lvName), None)
+            _lvminfo._removelvs(vgName, lvName)
             # If lvremove succeeded it affected VG as well
             _lvminfo._invalidatevgs(vgName)
     else:
@@ -1206,17 +1596,17 @@ def renameLV(vg, oldlv, newlv):
     if rc != 0:
         raise se.LogicalVolumeRenameError("%s %s %s" % (vg, oldlv, newlv))
 
-    _lvminfo._lvs.pop((vg, oldlv), None)
+    _lvminfo._removelvs(vg, oldlv)
     _lvminfo._reloadlvs(vg, newlv)
 
 
 def refreshLVs(vgName, lvNames):
     # If  the  logical  volumes  are active, reload their metadata.
-    cmd = ['lvchange', '--refresh']
-    cmd.extend("%s/%s" % (vgName, lv) for lv in lvNames)
-    rc, out, err = _lvminfo.cmd(cmd, _lvminfo._getVGDevs((vgName, )))
+    rc, out, err = _lvminfo.lvchange(vgName, lvNames, ('--refresh',))
     _lvminfo._invalidatelvs(vgName, lvNames)
     if rc != 0:
+        cmd = ['lvchange', '--refresh']
+        cmd.extend("%s/%s" % (vgName, lv) for lv in lvNames)
         raise se.LogicalVolumeRefreshError("%s failed" % list2cmdline(cmd))
 
 
@@ -1346,7 +1736,7 @@ def setrwLV(vg, lv, rw=True):
 
 
 def lvsByTag(vgName, tag):
-    return [lv for lv in getLV(vgName) if tag in lv.tags]
+    return _lvminfo.getLvsByTag(vgName, tag)
 
 
 def invalidateFilter():
@@ -19,12 +19,13 @@
 #
 
 import os
+import io
 import errno
+import mmap
 import time
 import threading
 import Queue
 import struct
-import signal
 import logging
 
 import uuid
@@ -34,8 +35,8 @@ import misc
 import task
 from threadPool import ThreadPool
 from storage_exception import InvalidParameterException
-from vdsm import constants
 from vdsm import utils
+from vdsm.rpcstats import Histogram
 
 __author__ = "ayalb"
 __date__ = "$Mar 9, 2009 5:25:07 PM$"
@@ -59,6 +60,9 @@ SLOTS_PER_MAILBOX = int(MAILBOX_SIZE / MESSAGE_SIZE)
 # etc)
 MESSAGES_PER_MAILBOX = SLOTS_PER_MAILBOX - 1
 
+# Log extend latency percentiles every this number of replies
+LATENCY_REPORT_COUNT = 100
+
 _zeroCheck = misc.checksum(EMPTYMAILBOX, CHECKSUM_BYTES)
 # Assumes CHECKSUM_BYTES equals 4!!!
 pZeroChecksum = struct.pack('<l', _zeroCheck)
@@ -79,9 +83,70 @@ def runTask(args):
     ctask.prepare(cmd, *args)
 
 
-def _mboxExecCmd(*args, **kwargs):
-    kwargs['deathSignal'] = signal.SIGKILL
-    return misc.execCmd(*args, **kwargs)
+def _alignedBuffer(size):
+    """
+    Return a zeroed, page aligned buffer suitable for direct I/O.
+    """
+    return mmap.mmap(-1, size)
+
+
+def _resizeBuffer(buf, size):
+    """
+    Return a new aligned buffer of size bytes with the contents of buf,
+    truncated or padded with zeros.
+    """
+    newbuf = _alignedBuffer(size)
+    length = min(len(buf), size)
+    newbuf[:length] = buf[:length]
+    buf.close()
+    return newbuf
+
+
+def _directRead(path, buf, offset=0):
+    """
+    Read len(buf) bytes from path at offset into aligned buffer buf, using
+    direct I/O. Return the number of bytes read, which may be smaller at end
+    of file.
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    with io.FileIO(fd, "r") as f:
+        f.seek(offset)
+        return f.readinto(buf)
+
+
+def _directWrite(path, buf, start, size, offset):
+    """
+    Write size bytes from aligned buffer buf at start to path at offset,
+    using direct I/O. start, size and offset must be multiple of
+    BLOCK_SIZE.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_DIRECT)
+    with io.FileIO(fd, "w") as f:
+        f.seek(offset)
+        written = f.write(buffer(buf, start, size))
+        if written != size:
+            raise IOError(errno.EIO, "Partial write to %s: %d of %d bytes" %
+                          (path, written, size))
+
+
+class _PollInterval(object):
+    """
+    Interval between mailbox checks, starting at minimum when there is
+    activity, and doubled on each idle check up to maximum.
+    """
+
+    def __init__(self, minimum, maximum):
+        self._minimum = min(minimum, maximum)
+        self._maximum = maximum
+        self._current = maximum
+
+    def reset(self):
+        self._current = self._minimum
+
+    def next(self):
+        interval = self._current
+        self._current = min(self._current * 2, self._maximum)
+        return interval
 
 
 class SPM_Extend_Message:
@@ -106,6 +171,7 @@ class SPM_Extend_Message:
         self.volumeData = volumeData
         self.newSize = str(dec2hex(newSize))
         self.callback = callbackFunction
+        self.created = utils.monotonic_time()
 
         # Message structure is rigid (order must be kept and is relied upon):
         # Version (1 byte), OpCode (4 bytes), Domain UUID (16 bytes), Volume
@@ -231,7 +297,8 @@ class HSM_Mailbox:
 class HSM_MailMonitor(threading.Thread):
     log = logging.getLogger('Storage.MailBox.HsmMailMonitor')
 
-    def __init__(self, inbox, outbox, hostID, queue, monitorInterval):
+    def __init__(self, inbox, outbox, hostID, queue, monitorInterval,
+                 minInterval=None):
         # Save arguments
         tpSize = config.getint('irs', 'thread_pool_size') / 2
         waitTimeout = 3
@@ -242,27 +309,22 @@ class HSM_MailMonitor(threading.Thread):
         self._queue = queue
         self._activeMessages = {}
         self._monitorInterval = monitorInterval
+        if minInterval is None:
+            minInterval = config.getfloat('irs', 'mailbox_min_interval')
+        self._interval = _PollInterval(minInterval, monitorInterval)
+        self._latency = Histogram()
+        self._latencyLock = threading.Lock()
         self._hostID = int(hostID)
         self._used_slots_array = [0] * MESSAGES_PER_MAILBOX
-        self._outgoingMail = EMPTYMAILBOX
+        # Updated in place and written using direct I/O
+        self._outgoingMail = _alignedBuffer(MAILBOX_SIZE)
         self._incomingMail = EMPTYMAILBOX
+        self._inBuffer = _alignedBuffer(MAILBOX_SIZE)
         # TODO: add support for multiple paths (multiple mailboxes)
         self._spmStorageDir = config.get('irs', 'repository')
-        self._inCmd = [constants.EXT_DD,
-                       'if=' + str(inbox),
-                       'iflag=direct,fullblock',
-                       'bs=' + str(BLOCK_SIZE),
-                       'count=' + str(BLOCKS_PER_MAILBOX),
-                       'skip=' + str(self._hostID * BLOCKS_PER_MAILBOX)
-                       ]
-        self._outCmd = [constants.EXT_DD,
-                        'of=' + str(outbox),
-                        'iflag=fullblock',
-                        'oflag=direct',
-                        'conv=notrunc',
-                        'bs=' + str(BLOCK_SIZE),
-                        'seek=' + str(self._hostID * BLOCKS_PER_MAILBOX)
-                        ]
+        self._inbox = inbox
+        self._outbox = outbox
+        self._mailboxOffset = self._hostID * MAILBOX_SIZE
         self._init = False
         self._initMailbox()  # Read initial mailbox state
         self._msgCounter = 0
@@ -272,16 +334,23 @@ class HSM_MailMonitor(threading.Thread):
         self.name = "mailbox.HSMMonitor"
         self.start()
 
+    def _readMailbox(self):
+        size = _directRead(self._inbox, self._inBuffer, self._mailboxOffset)
+        if size != MAILBOX_SIZE:
+            raise RuntimeError("Could not read mailbox - len %s != %s" %
+                               (size, MAILBOX_SIZE))
+        return self._inBuffer[:]
+
     def _initMailbox(self):
         # Sync initial incoming mail state with storage view
-        (rc, out, err) = _mboxExecCmd(self._inCmd, raw=True)
-        if rc == 0:
-            self._incomingMail = out
-            self._init = True
-        else:
+        try:
+            self._incomingMail = self._readMailbox()
+        except (EnvironmentError, RuntimeError) as e:
             self.log.warning("HSM_MailboxMonitor - Could not initialize "
                              "mailbox, will not accept requests until init "
-                             "succeeds")
+                             "succeeds: %s", e)
+        else:
+            self._init = True
 
     def immStop(self):
         self._stop = True
@@ -289,9 +358,29 @@ class HSM_MailMonitor(threading.Thread):
     def immFlush(self):
         self._flush = True
 
+    def latencyStats(self):
+        with self._latencyLock:
+            return self._latency.info()
+
+    def _addLatency(self, msg):
+        latency = max(utils.monotonic_time() - msg.created, 0.0)
+        with self._latencyLock:
+            self._latency.add(latency)
+            if self._latency.count % LATENCY_REPORT_COUNT:
+                return
+            info = self._latency.info()
+        self.log.info("HSM_MailMonitor - extend latency: count=%d "
+                      "avg=%.3f p50=%.3f p90=%.3f p99=%.3f max=%.3f",
+                      info['count'], info['avg'], info['p50'], info['p90'],
+                      info['p99'], info['max'])
+
     def _handleResponses(self, newMsgs):
         rc = False
 
+        # Nothing to do if the mailbox was not modified since last read
+        if newMsgs == self._incomingMail:
+            return rc
+
         for i in range(0, MESSAGES_PER_MAILBOX):
             # Skip checking non used slots
             if self._used_slots_array[i] == 0:
@@ -305,13 +394,9 @@ class HSM_MailMonitor(threading.Thread):
             if newMsgs[start] in ['\0', '0']:
                 continue
 
-            for j in range(start, start + MESSAGE_SIZE):
-                if newMsgs[j] != self._incomingMail[j]:
-                    break
-
-            # If search exhausted then message hasn't changed since last read
-            # and can be skipped
-            if j == (start + MESSAGE_SIZE - 1):
+            # Skip messages which haven't changed since last read
+            if newMsgs[start:start + MESSAGE_SIZE] == \
+                    self._incomingMail[start:start + MESSAGE_SIZE]:
                 continue
 
             #
@@ -327,15 +412,14 @@ class HSM_MailMonitor(threading.Thread):
                 del self._activeMessages[i]
                 self._used_slots_array[i] = 0
                 self._msgCounter -= 1
-                self._outgoingMail = self._outgoingMail[0:start] + \
-                    MESSAGE_SIZE * "\0" + self._outgoingMail[start +
-                                                             MESSAGE_SIZE:]
+                self._outgoingMail[start:start + MESSAGE_SIZE] = \
+                    MESSAGE_SIZE * "\0"
                 continue
 
             msg = self._activeMessages[i]
             self._activeMessages[i] = CLEAN_MESSAGE
-            self._outgoingMail = self._outgoingMail[0:start] + \
-                CLEAN_MESSAGE + self._outgoingMail[start + MESSAGE_SIZE:]
+            self._outgoingMail[start:start + MESSAGE_SIZE] = CLEAN_MESSAGE
+            self._addLatency(msg)
 
             try:
                 self.log.debug("HSM_MailboxMonitor(%s/%s) - Checking reply: "
@@ -370,27 +454,24 @@ class HSM_MailMonitor(threading.Thread):
 
     def _checkForMail(self):
         # self.log.debug("HSM_MailMonitor - checking for mail")
-        # self.log.debug("Running command: " + str(self._inCmd))
-        (rc, in_mail, err) = misc.execCmd(self._inCmd, raw=True)
-        if rc:
-            raise RuntimeError("_handleResponses.Could not read mailbox - rc "
-                               "%s" % rc)
-        if (len(in_mail) != MAILBOX_SIZE):
-            raise RuntimeError("_handleResponses.Could not read mailbox - len "
-                               "%s != %s" % (len(in_mail), MAILBOX_SIZE))
+        in_mail = self._readMailbox()
         # self.log.debug("Parsing inbox content: %s", in_mail)
         return self._handleResponses(in_mail)
 
     def _sendMail(self):
-        self.log.info("HSM_MailMonitor sending mail to SPM - " +
-                      str(self._outCmd))
+        self.log.info("HSM_MailMonitor sending mail to SPM - %s offset %d",
+                      self._outbox, self._mailboxOffset)
         chk = misc.checksum(
             self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES],
             CHECKSUM_BYTES)
         pChk = struct.pack('<l', chk)  # Assumes CHECKSUM_BYTES equals 4!!!
-        self._outgoingMail = \
-            self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES] + pChk
-        _mboxExecCmd(self._outCmd, data=self._outgoingMail)
+        self._outgoingMail[MAILBOX_SIZE - CHECKSUM_BYTES:] = pChk
+        try:
+            _directWrite(self._outbox, self._outgoingMail, 0, MAILBOX_SIZE,
+                         self._mailboxOffset)
+        except EnvironmentError:
+            self.log.error("HSM_MailMonitor - Could not send mail to SPM",
+                           exc_info=True)
 
     def _handleMessage(self, message):
         # TODO: add support for multiple mailboxes
@@ -418,8 +499,7 @@ class HSM_MailMonitor(threading.Thread):
         self._activeMessages[freeSlot] = message
         start = freeSlot * MESSAGE_SIZE
         end = start + MESSAGE_SIZE
-        self._outgoingMail = self._outgoingMail[0:start] + message.payload + \
-            self._outgoingMail[end:]
+        self._outgoingMail[start:end] = message.payload
         self.log.debug("HSM_MailMonitor - start: %s, end: %s, len: %s, "
                        "message(%s/%s): %s" %
                        (start, end, len(self._outgoingMail), self._msgCounter,
@@ -493,16 +573,18 @@ class HSM_MailMonitor(threading.Thread):
 
                     if sendMail:
                         self._sendMail()
+                        # Poll fast while waiting for the SPM replies
+                        self._interval.reset()
 
                     # If there are active messages waiting for SPM reply, wait
-                    # a few seconds before performing another IO op
+                    # before performing another IO op
                     if self._activeMessages and not self._stop:
                         # If recurring failures then sleep for one minute
                         # before retrying
                         if (failures > 9):
                             time.sleep(60)
                         else:
-                            time.sleep(self._monitorInterval)
+                            time.sleep(self._interval.next())
 
                 except:
                     self.log.error("HSM_MailboxMonitor - Incoming mail"
@@ -511,7 +593,7 @@ class HSM_MailMonitor(threading.Thread):
         finally:
             self.log.info("HSM_MailboxMonitor - Incoming mail monitoring "
                           "thread stopped, clearing outgoing mail")
-            self._outgoingMail = EMPTYMAILBOX
+            self._outgoingMail[:] = EMPTYMAILBOX
             self._sendMail()  # Clear outgoing mailbox
 
 
@@ -525,7 +607,7 @@ class SPM_MailMonitor:
     def unregisterMessageType(self, messageType):
         del self._messageTypes[messageType]
 
-    def __init__(self, pool, maxHostID, monitorInterval=2):
+    def __init__(self, pool, maxHostID, monitorInterval=2, minInterval=None):
         self._messageTypes = {}
         # Save arguments
         self._stop = False
@@ -555,31 +637,29 @@ class SPM_MailMonitor:
         self._numHosts = int(maxHostID)
         self._outMailLen = MAILBOX_SIZE * self._numHosts
         self._monitorInterval = monitorInterval
+        if minInterval is None:
+            minInterval = config.getfloat('irs', 'mailbox_min_interval')
+        self._interval = _PollInterval(minInterval, monitorInterval)
+        # Set when writing outgoing mail failed, to retry on next check
+        self._sendPending = False
         # TODO: add support for multiple paths (multiple mailboxes)
-        self._outgoingMail = self._outMailLen * "\0"
-        self._incomingMail = self._outgoingMail
-        self._inCmd = ['dd',
-                       'if=' + str(self._inbox),
-                       'iflag=direct,fullblock',
-                       'count=1'
-                       ]
-        self._outCmd = ['dd',
-                        'of=' + str(self._outbox),
-                        'oflag=direct',
-                        'iflag=fullblock',
-                        'conv=notrunc',
-                        'count=1'
-                        ]
+        # Updated in place and written using direct I/O
+        self._outgoingMail = _alignedBuffer(self._outMailLen)
+        self._incomingMail = self._outMailLen * "\0"
+        # The mail as read, before cleaning invalid mailboxes
+        self._readMail = self._incomingMail
+        self._inBuffer = _alignedBuffer(self._outMailLen)
         self._outLock = threading.Lock()
         self._inLock = threading.Lock()
         # Clear outgoing mail
-        self.log.debug("SPM_MailMonitor - clearing outgoing mail, command is: "
-                       "%s", self._outCmd)
-        cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-        (rc, out, err) = _mboxExecCmd(cmd, data=self._outgoingMail)
-        if rc:
-            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail, "
-                             "dd failed")
+        self.log.debug("SPM_MailMonitor - clearing outgoing mail %s",
+                       self._outbox)
+        try:
+            _directWrite(self._outbox, self._outgoingMail, 0,
+                         self._outMailLen, 0)
+        except EnvironmentError as e:
+            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail: "
+                             "%s", e)
 
         t = threading.Thread(target=self.run)
         t.daemon = True
@@ -599,17 +679,14 @@ class SPM_MailMonitor:
     def setMaxHostID(self, newMaxId):
         with self._inLock:
             with self._outLock:
-                diff = newMaxId - self._numHosts
-                if diff > 0:
-                    delta = MAILBOX_SIZE * diff * "\0"
-                    self._outgoingMail += delta
-                    self._incomingMail += delta
-                elif diff < 0:
-                    delta = MAILBOX_SIZE * diff
-                    self._outgoingMail = self._outgoingMail[:-delta]
-                    self._incomingMail = self._incomingMail[:-delta]
+                size = MAILBOX_SIZE * newMaxId
+                self._outgoingMail = _resizeBuffer(self._outgoingMail, size)
+                self._inBuffer = _resizeBuffer(self._inBuffer, size)
+                self._incomingMail = self._incomingMail[:size].ljust(size,
+                                                                     "\0")
+                self._readMail = self._readMail[:size].ljust(size, "\0")
                 self._numHosts = newMaxId
-                self._outMailLen = MAILBOX_SIZE * self._numHosts
+                self._outMailLen = size
 
     def _validateMailbox(self, mailbox, mailboxIndex):
         chkStart = MAILBOX_SIZE - CHECKSUM_BYTES
@@ -625,15 +702,31 @@ class SPM_MailMonitor:
         return True
 
     def _handleRequests(self, newMail):
-
+        """
+        Handle new requests in newMail, and return a tuple (send, changed),
+        where send is True if outgoing mail should be sent, and changed is
+        True if any mailbox was modified since last read.
+        """
         send = False
+        changed = False
+        readMail = newMail
 
         # run through all messages and check if new messages have arrived
         # (since last read)
         for host in range(0, self._numHosts):
             # Check mailbox checksum
             mailboxStart = host * MAILBOX_SIZE
+            mailboxEnd = mailboxStart + MAILBOX_SIZE
+
+            # Skip mailboxes which haven't changed since last read; comparing
+            # the entire mailbox is much cheaper than parsing it. Invalid
+            # mailboxes are cleaned in newMail, so compare with the mail as
+            # read.
+            if readMail[mailboxStart:mailboxEnd] == \
+                    self._readMail[mailboxStart:mailboxEnd]:
+                continue
 
+            changed = True
             isMailboxValidated = False
 
             for i in range(0, MESSAGES_PER_MAILBOX):
@@ -652,11 +745,10 @@ class SPM_MailMonitor:
                 # mailbox
                 if not isMailboxValidated:
                     if not self._validateMailbox(
-                            newMail[mailboxStart:mailboxStart + MAILBOX_SIZE],
-                            host):
+                            newMail[mailboxStart:mailboxEnd], host):
                         # Cleaning invalid mbx in newMail
                         newMail = newMail[:mailboxStart] + EMPTYMAILBOX + \
-                            newMail[mailboxStart + MAILBOX_SIZE:]
+                            newMail[mailboxEnd:]
                         break
                     self.log.debug("SPM_MailMonitor: Mailbox %s validated, "
                                    "checking mail", host)
@@ -669,25 +761,18 @@ class SPM_MailMonitor:
                     # take the lock
                     self._outLock.acquire()
                     try:
-                        self._outgoingMail = \
-                            self._outgoingMail[0:msgOffset] + CLEAN_MESSAGE + \
-                            self._outgoingMail[msgOffset + MESSAGE_SIZE:
-                                               self._outMailLen]
+                        self._outgoingMail[msgOffset:
+                                           msgOffset + MESSAGE_SIZE] = \
+                            CLEAN_MESSAGE
                     finally:
                         self._outLock.release()
                     send = True
                     continue
 
-                # Message isn't empty, check if its new
-                isMessageNew = False
-                for j in range(msgStart, msgStart + MESSAGE_SIZE):
-                    if newMail[j] != self._incomingMail[j]:
-                        isMessageNew = True
-                        break
-
-                # If search exhausted, i.e. message hasn't changed since last
-                # read, it can be skipped
-                if not isMessageNew:
+                # Message isn't empty, skip it if it hasn't changed since
+                # last read
+                if newMsg == self._incomingMail[msgStart:
+                                                msgStart + MESSAGE_SIZE]:
                     continue
 
                 # We only get here if there is a novel request
@@ -721,41 +806,49 @@ class SPM_MailMonitor:
                                    exc_info=True)
 
         self._incomingMail = newMail
-        return send
+        self._readMail = readMail
+        return send, changed
 
     def _checkForMail(self):
+        """
+        Check for new requests, and return True if any mailbox was modified
+        since last check.
+        """
         # Lock is acquired in order to make sure that neither _numHosts nor
         # incomingMail are changed during checkForMail
         self._inLock.acquire()
         try:
             # self.log.debug("SPM_MailMonitor -_checking for mail")
-            cmd = self._inCmd + ['bs=' + str(self._outMailLen)]
-            # self.log.debug("SPM_MailMonitor - reading incoming mail, "
-            #               "command: " + str(cmd))
-            (rc, in_mail, err) = misc.execCmd(cmd, raw=True)
-            if rc:
+            try:
+                size = _directRead(self._inbox, self._inBuffer)
+            except EnvironmentError as e:
                 raise IOError(errno.EIO, "_handleRequests._checkForMail - "
-                              "Could not read mailbox: %s" % self._inbox)
-
-            if (len(in_mail) != (self._outMailLen)):
-                self.log.error('SPM_MailMonitor: _checkForMail - dd succeeded '
-                               'but read %d bytes instead of %d, cannot check '
-                               'mail.  Read mail contains: %s', len(in_mail),
-                               self._outMailLen, repr(in_mail[:80]))
+                              "Could not read mailbox: %s: %s" %
+                              (self._inbox, e))
+
+            if size != self._outMailLen:
+                self.log.error('SPM_MailMonitor: _checkForMail - read %d '
+                               'bytes instead of %d, cannot check mail.  '
+                               'Read mail contains: %s', size,
+                               self._outMailLen, repr(self._inBuffer[:80]))
                 raise RuntimeError("_handleRequests._checkForMail - Could not "
                                    "read mailbox")
+            in_mail = self._inBuffer[:]
             # self.log.debug("Parsing inbox content: %s", in_mail)
-            if self._handleRequests(in_mail):
+            send, changed = self._handleRequests(in_mail)
+            if send or self._sendPending:
                 self._outLock.acquire()
                 try:
-                    cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-                    (rc, out, err) = _mboxExecCmd(cmd,
-                                                  data=self._outgoingMail)
-                    if rc:
-                        self.log.warning("SPM_MailMonitor couldn't write "
-                                         "outgoing mail, dd failed")
+                    _directWrite(self._outbox, self._outgoingMail, 0,
+                                 self._outMailLen, 0)
+                    self._sendPending = False
+                except EnvironmentError as e:
+                    self.log.warning("SPM_MailMonitor couldn't write "
+                                     "outgoing mail: %s", e)
+                    self._sendPending = True
                 finally:
                     self._outLock.release()
+            return changed
         finally:
             self._inLock.release()
 
@@ -765,20 +858,15 @@ class SPM_MailMonitor:
         self._outLock.acquire()
         try:
             msgOffset = msgID * MESSAGE_SIZE
-            self._outgoingMail = \
-                self._outgoingMail[0:msgOffset] + msg.payload + \
-                self._outgoingMail[msgOffset + MESSAGE_SIZE:self._outMailLen]
+            self._outgoingMail[msgOffset:msgOffset + MESSAGE_SIZE] = \
+                msg.payload
             mailboxOffset = (msgID / SLOTS_PER_MAILBOX) * MAILBOX_SIZE
-            mailbox = self._outgoingMail[mailboxOffset:
-                                         mailboxOffset + MAILBOX_SIZE]
-            cmd = self._outCmd + ['bs=' + str(MAILBOX_SIZE),
-                                  'seek=' + str(mailboxOffset / MAILBOX_SIZE)]
-            # self.log.debug("Running command: %s, for message id: %s",
-            #               str(cmd), str(msgID))
-            (rc, out, err) = _mboxExecCmd(cmd, data=mailbox)
-            if rc:
+            try:
+                _directWrite(self._outbox, self._outgoingMail, mailboxOffset,
+                             MAILBOX_SIZE, mailboxOffset)
+            except EnvironmentError as e:
                 self.log.error("SPM_MailMonitor: sendReply - couldn't send "
-                               "reply, dd failed")
+                               "reply: %s", e)
         finally:
             self._outLock.release()
 
@@ -788,10 +876,12 @@ class SPM_MailMonitor:
         try:
             while not self._stop:
                 try:
-                    self._checkForMail()
+                    # Poll fast while hosts are sending requests
+                    if self._checkForMail():
+                        self._interval.reset()
                 except:
                     self.log.error("Error checking for mail", exc_info=True)
-                time.sleep(self._monitorInterval)
+                time.sleep(self._interval.next())
         finally:
             self._stopped = True
             self.tp.joinAll(waitForTasks=False)
@@ -24,6 +24,7 @@ import time
 import socket
 import errno
 import json
+import re
 import unicodedata
 
 from vdsm import supervdsm
@@ -75,6 +76,11 @@ def _filterXmlChars(u):
     return chars.tounicode()
 
 
+# Bytes that may decode to characters not permitted in XML: anything but
+# printable ASCII, and JSON \u escapes.
+_UNSAFE_BYTES = re.compile(r'[^\t\n\r\x20-\x7e]|\\u')
+
+
 def _filterObject(obj):
     """
     Apply _filterXmlChars on every string in the json response object
@@ -423,8 +429,9 @@ class GuestAgent(object):
             self.guestStatus = None
 
     def _clearReadBuffer(self):
-        self._buffer = []
-        self._bufferSize = 0
+        self._buffer = bytearray()
+        # Data before this offset was already searched for line ends.
+        self._scanned = 0
 
     def _processMessage(self, line):
         try:
@@ -435,10 +442,17 @@ class GuestAgent(object):
             self.log.error("%s: %s" % (err, repr(line)))
 
     def _handleData(self, data):
-        while (not self._stopped) and '\n' in data:
-            line, data = data.split('\n', 1)
-            line = ''.join(self._buffer) + line
-            self._clearReadBuffer()
+        buf = self._buffer
+        buf.extend(data)
+        start = 0
+        pos = self._scanned
+        end = -1
+        while not self._stopped:
+            end = buf.find('\n', pos)
+            if end == -1:
+                break
+            line = str(buf[start:end])
+            start = pos = end + 1
             if self._messageState is MessageState.TOO_BIG:
                 self._messageState = MessageState.NORMAL
                 self.log.warning("Not processing current message because it "
@@ -446,13 +460,18 @@ class GuestAgent(object):
             else:
                 self._processMessage(line)
 
-        self._buffer.append(data)
-        self._bufferSize += len(data)
+        # Remove the processed lines once per read, instead of once per line.
+        del buf[:start]
+        if end == -1 and not self._stopped:
+            self._scanned = len(buf)
+        else:
+            # Stopped before scanning the entire buffer
+            self._scanned = 0
 
-        if self._bufferSize >= self.MAX_MESSAGE_SIZE:
+        if len(buf) >= self.MAX_MESSAGE_SIZE:
             self.log.warning("Discarding buffer with size: %d because the "
                              "message reached maximum size of %d bytes before "
-                             "message end was reached.", self._bufferSize,
+                             "message end was reached.", len(buf),
                              self.MAX_MESSAGE_SIZE)
             self._messageState = MessageState.TOO_BIG
             self._clearReadBuffer()
@@ -477,15 +496,20 @@ class GuestAgent(object):
         return result
 
     def _parseLine(self, line):
-        # Deal with any bad UTF8 encoding from the (untrusted) guest,
-        # by replacing them with the Unicode replacement character
-        uniline = line.decode('utf8', 'replace')
-        args = json.loads(uniline)
-        # Filter out any characters in the untrusted guest response
-        # that aren't permitted in XML.  This must be done _after_ the
-        # JSON decoding, since otherwise JSON's \u escape decoding
-        # could be used to generate the bad characters
-        args = _filterObject(args)
+        if _UNSAFE_BYTES.search(line) is None:
+            # Printable ASCII without \u escapes cannot contain characters
+            # that aren't permitted in XML, no need to filter.
+            args = json.loads(line)
+        else:
+            # Deal with any bad UTF8 encoding from the (untrusted) guest,
+            # by replacing them with the Unicode replacement character
+            uniline = line.decode('utf8', 'replace')
+            args = json.loads(uniline)
+            # Filter out any characters in the untrusted guest response
+            # that aren't permitted in XML.  This must be done _after_ the
+            # JSON decoding, since otherwise JSON's \u escape decoding
+            # could be used to generate the bad characters
+            args = _filterObject(args)
         name = args['__name__']
         del args['__name__']
         return (name, args)
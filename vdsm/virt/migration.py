@@ -18,6 +18,7 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+from collections import namedtuple
 import threading
 import time
 import libvirt
@@ -48,6 +49,14 @@ MODE_FILE = 'file'
 METHOD_ONLINE = 'online'
 
 
+POLICY_LEGACY = 'legacy'
+POLICY_CONVERGENCE = 'convergence'
+
+
+ACTION_DOWNTIME = 'downtime'
+ACTION_ABORT = 'abort'
+
+
 VIR_MIGRATE_PARAM_URI = 'migrate_uri'
 VIR_MIGRATE_PARAM_BANDWIDTH = 'bandwidth'
 VIR_MIGRATE_PARAM_GRAPHICS_URI = 'graphics_uri'
@@ -59,18 +68,201 @@ class MigrationDestinationSetupError(RuntimeError):
     """
 
 
+class MigrationScheduler(object):
+    """
+    Schedule the outgoing migrations of the host.
+
+    Migrations wait in a queue ordered by their estimated transfer cost, so
+    cheap migrations are not stuck behind expensive ones when evacuating a
+    host. Migrations waiting more than max_wait seconds go first, in
+    arrival order, so expensive migrations are not starved by cheaper
+    migrations arriving while they wait. At most max_migrations migrations
+    run concurrently.
+
+    If total_bandwidth (MiB/s) is 0, every migration is limited to
+    max_bandwidth, and admitted if there are less than max_migrations
+    running migrations.
+
+    Otherwise the throughput of the running migrations is measured by their
+    monitor threads. Another migration is admitted while the running
+    migrations use less than their share of total_bandwidth, and the
+    bandwidth is redistributed among the running migrations: migrations
+    limited by something else (e.g. the destination host) keep what they
+    use, and the rest is shared equally by the others.
+    """
+
+    # A migration using less than this part of its bandwidth is considered
+    # limited by something else.
+    _LIMITED = 0.9
+
+    # Headroom given to migrations limited by something else. Must be larger
+    # than 1 / _LIMITED, so they are still considered limited with the new
+    # bandwidth.
+    _HEADROOM = 1.25
+
+    # Changes smaller than this part of the current bandwidth are not
+    # applied, avoiding useless libvirt calls.
+    _MIN_CHANGE = 0.1
+
+    def __init__(self, max_migrations, max_bandwidth, total_bandwidth=0,
+                 max_wait=600, clock=utils.monotonic_time):
+        self._max_migrations = max_migrations
+        self._max_bandwidth = max_bandwidth
+        self._total_bandwidth = total_bandwidth
+        self._max_wait = max_wait
+        self._clock = clock
+        self._cond = threading.Condition(threading.Lock())
+        self._queue = []
+        self._running = []
+        self._seq = 0
+
+    def admit(self, vm, cost, set_bandwidth):
+        """
+        Wait until the migration of vm can run, and return a ticket to use
+        for reporting its throughput and releasing it.
+
+        set_bandwidth(bandwidth) is called to modify the bandwidth of the
+        migration after it was admitted.
+        """
+        with self._cond:
+            self._seq += 1
+            ticket = _MigrationTicket(vm, cost, self._seq, set_bandwidth,
+                                      self._clock())
+            self._queue.append(ticket)
+            while True:
+                if self._can_admit():
+                    if self._next() is ticket:
+                        break
+                    # The next migration may have gone to sleep before it
+                    # waited max_wait seconds; wake it up.
+                    self._cond.notify_all()
+                self._cond.wait()
+            self._queue.remove(ticket)
+            self._running.append(ticket)
+            changes = self._rebalance()
+            # Let the next migration check if it can run too.
+            self._cond.notify_all()
+        self._apply(changes, ticket)
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            self._running.remove(ticket)
+            changes = self._rebalance()
+            self._cond.notify_all()
+        self._apply(changes)
+
+    def update(self, ticket, throughput):
+        """
+        Report the measured throughput (MiB/s) of a running migration.
+        """
+        with self._cond:
+            if ticket not in self._running:
+                return
+            ticket.throughput = throughput
+            changes = self._rebalance()
+            self._cond.notify_all()
+        self._apply(changes)
+
+    def _next(self):
+        now = self._clock()
+
+        def order(ticket):
+            if now - ticket.queued >= self._max_wait:
+                return (0, ticket.seq)
+            return (1, ticket.cost, ticket.seq)
+
+        return min(self._queue, key=order)
+
+    def _can_admit(self):
+        running = len(self._running)
+        if running >= self._max_migrations:
+            return False
+        if self._total_bandwidth <= 0 or running == 0:
+            return True
+        # Admit if the new migration would get its share of the bandwidth.
+        # Migrations not measured yet are assumed to use all their
+        # bandwidth.
+        used = sum(t.bandwidth if t.throughput is None else t.throughput
+                   for t in self._running)
+        return self._total_bandwidth - used >= (
+            self._total_bandwidth / float(running + 1))
+
+    def _rebalance(self):
+        """
+        Compute the bandwidth of the running migrations, returning the
+        changed tickets.
+        """
+        if self._total_bandwidth <= 0:
+            changed = []
+            for ticket in self._running:
+                if ticket.bandwidth is None:
+                    ticket.bandwidth = self._max_bandwidth
+                    changed.append(ticket)
+            return changed
+
+        def demand(ticket):
+            if (ticket.throughput is not None and ticket.bandwidth and
+                    ticket.throughput < ticket.bandwidth * self._LIMITED):
+                return ticket.throughput * self._HEADROOM
+            return float('inf')
+
+        changed = []
+        remaining = float(self._total_bandwidth)
+        tickets = sorted(self._running, key=demand)
+        for i, ticket in enumerate(tickets):
+            share = remaining / (len(tickets) - i)
+            bandwidth = max(1, int(min(demand(ticket), share)))
+            remaining -= bandwidth
+            if (ticket.bandwidth is None or
+                    abs(bandwidth - ticket.bandwidth) >
+                    ticket.bandwidth * self._MIN_CHANGE):
+                ticket.bandwidth = bandwidth
+                changed.append(ticket)
+        return changed
+
+    def _apply(self, changes, admitted=None):
+        for ticket in changes:
+            # The admitted migration uses its bandwidth when it starts.
+            if ticket is admitted:
+                continue
+            try:
+                ticket.set_bandwidth(ticket.bandwidth)
+            except Exception:
+                ticket.vm.log.exception(
+                    "Cannot set migration bandwidth to %s MiB/s",
+                    ticket.bandwidth)
+
+
+class _MigrationTicket(object):
+
+    def __init__(self, vm, cost, seq, set_bandwidth, queued):
+        self.vm = vm
+        self.cost = cost
+        self.seq = seq
+        self.set_bandwidth = set_bandwidth
+        self.queued = queued
+        self.bandwidth = None
+        self.throughput = None
+
+
 class SourceThread(threading.Thread):
     """
     A thread that takes care of migration on the source vdsm.
     """
-    _ongoingMigrations = threading.BoundedSemaphore(1)
+    _scheduler = MigrationScheduler(
+        1, config.getint('vars', 'migration_max_bandwidth'),
+        max_wait=config.getint('vars', 'migration_max_queue_time'))
 
     @classmethod
     def setMaxOutgoingMigrations(cls, n):
-        """Set the initial value of the _ongoingMigrations semaphore.
+        """Set the maximum number of concurrent outgoing migrations.
 
         must not be called after any vm has been run."""
-        cls._ongoingMigrations = threading.BoundedSemaphore(n)
+        cls._scheduler = MigrationScheduler(
+            n, config.getint('vars', 'migration_max_bandwidth'),
+            config.getint('vars', 'migration_total_bandwidth'),
+            config.getint('vars', 'migration_max_queue_time'))
 
     def __init__(self, vm, dst='', dstparams='',
                  mode=MODE_REMOTE, method=METHOD_ONLINE,
@@ -104,6 +296,7 @@ class SourceThread(threading.Thread):
         self._preparingMigrationEvt = True
         self._migrationCanceledEvt = False
         self._monitorThread = None
+        self._ticket = None
 
     @property
     def hibernating(self):
@@ -278,12 +471,15 @@ class SourceThread(threading.Thread):
             self._setupVdsConnection()
             self._setupRemoteMachineParams()
             self._prepareGuest()
-            SourceThread._ongoingMigrations.acquire()
+            self._ticket = SourceThread._scheduler.admit(
+                self._vm, self._cost(), self._setMaxSpeed)
             try:
                 if self._migrationCanceledEvt:
                     self._raiseAbortError()
-                self.log.debug("migration semaphore acquired after %d seconds",
-                               time.time() - startTime)
+                self.log.debug("migration admitted after %d seconds with "
+                               "bandwidth %s MiB/s",
+                               time.time() - startTime,
+                               self._ticket.bandwidth)
                 self._vm.conf['_migrationParams'] = {
                     'dst': self._dst,
                     'mode': self._mode,
@@ -301,7 +497,7 @@ class SourceThread(threading.Thread):
             finally:
                 if '_migrationParams' in self._vm.conf:
                     del self._vm.conf['_migrationParams']
-                SourceThread._ongoingMigrations.release()
+                SourceThread._scheduler.release(self._ticket)
         except MigrationDestinationSetupError as e:
             self._recover(str(e))
             # we know what happened, no need to dump hollow stack trace
@@ -309,6 +505,35 @@ class SourceThread(threading.Thread):
             self._recover(str(e))
             self.log.exception("Failed to migrate")
 
+    def _cost(self):
+        # The dirty rate of the guest is not known before the migration
+        # starts, so estimate the transfer cost using the memory size.
+        return int(self._vm.conf.get('memSize', 0))
+
+    def _setMaxSpeed(self, bandwidth):
+        if not self._preparingMigrationEvt:
+            self.log.debug('setting migration bandwidth to %d MiB/s',
+                           bandwidth)
+            self._vm._dom.migrateSetMaxSpeed(bandwidth, 0)
+
+    def _reportThroughput(self, throughput):
+        SourceThread._scheduler.update(self._ticket, throughput)
+
+    def _createPolicy(self):
+        name = config.get('vars', 'migration_policy')
+        if name == POLICY_CONVERGENCE:
+            if MonitorThread._MIGRATION_MONITOR_INTERVAL > 0:
+                return ConvergencePolicy(
+                    int(self._downtime),
+                    config.getint('vars', 'migration_downtime_steps'))
+            # The policy is driven by the monitor samples.
+            self.log.warning('migration monitor is disabled, using %r '
+                             'migration policy', POLICY_LEGACY)
+        elif name != POLICY_LEGACY:
+            self.log.warning('unknown migration policy %r, using %r',
+                             name, POLICY_LEGACY)
+        return None
+
     def _startUnderlyingMigration(self, startTime):
         if self.hibernating:
             hooks.before_vm_hibernate(self._vm._dom.XMLDesc(0), self._vm.conf)
@@ -353,14 +578,19 @@ class SourceThread(threading.Thread):
             self._vm.log.info('starting migration to %s '
                               'with miguri %s', duri, muri)
 
-            downtimeThread = DowntimeThread(
-                self._vm,
-                int(self._downtime),
-                config.getint('vars', 'migration_downtime_steps'))
-            self._monitorThread = MonitorThread(self._vm, startTime)
-            with utils.running(downtimeThread):
-                with utils.running(self._monitorThread):
-                    # we need to support python 2.6, so two nested with-s.
+            policy = self._createPolicy()
+            self._monitorThread = MonitorThread(
+                self._vm, startTime, onThroughput=self._reportThroughput,
+                policy=policy)
+            with utils.running(self._monitorThread):
+                if policy is None:
+                    downtimeThread = DowntimeThread(
+                        self._vm,
+                        int(self._downtime),
+                        config.getint('vars', 'migration_downtime_steps'))
+                    with utils.running(downtimeThread):
+                        self._perform_migration(duri, muri)
+                else:
                     self._perform_migration(duri, muri)
 
             self.log.info("migration took %d seconds to complete",
@@ -371,7 +601,6 @@ class SourceThread(threading.Thread):
             SPICE_MIGRATION_HANDOVER_TIME = 120
             self._vm._reviveTicket(SPICE_MIGRATION_HANDOVER_TIME)
 
-        maxBandwidth = config.getint('vars', 'migration_max_bandwidth')
         # FIXME: there still a race here with libvirt,
         # if we call stop() and libvirt migrateToURI3 didn't start
         # we may return migration stop but it will start at libvirt
@@ -380,7 +609,7 @@ class SourceThread(threading.Thread):
         if not self._migrationCanceledEvt:
             # TODO: use libvirt constants when bz#1222795 is fixed
             params = {VIR_MIGRATE_PARAM_URI: str(muri),
-                      VIR_MIGRATE_PARAM_BANDWIDTH: maxBandwidth}
+                      VIR_MIGRATE_PARAM_BANDWIDTH: self._ticket.bandwidth}
             if self._consoleAddress:
                 if self._vm.hasSpice:
                     graphics = 'spice'
@@ -423,6 +652,131 @@ def exponential_downtime(downtime, steps):
         yield int(offset + base ** i)
 
 
+PolicyAction = namedtuple('PolicyAction', ['action', 'value'])
+
+
+class ConvergencePolicy(object):
+    """
+    Drive a migration using its predicted convergence.
+
+    The policy estimates the transfer rate and the dirty rate of the guest
+    memory from successive jobInfo() samples. While the migration converges
+    (the guest dirties memory slower than it is transferred), the downtime
+    is left alone. When it does not converge, the downtime is raised to the
+    downtime needed for transferring the remaining data, up to
+    max_downtime. If even max_downtime is not enough for abort_samples
+    successive samples, the migration is aborted early instead of running
+    until the migration timeouts. Samples without progress are ignored;
+    stalled migrations are aborted by the progress timeout.
+
+    sample() returns a list of PolicyAction to perform:
+
+        PolicyAction(ACTION_DOWNTIME, milliseconds)
+        PolicyAction(ACTION_ABORT, reason)
+    """
+
+    # Weight of the last sample in the estimated rates.
+    _ALPHA = 0.5
+
+    # Converging if the dirty rate is lower than this part of the transfer
+    # rate; when the rates are close, convergence takes too long.
+    _CONVERGING = 0.8
+
+    # Downtime added to the needed downtime, as the rates are estimates.
+    _MARGIN = 1.2
+
+    def __init__(self, max_downtime, steps=1, abort_samples=6):
+        self._max_downtime = max_downtime
+        self._abort_samples = abort_samples
+        if steps > 1:
+            self._downtime = next(exponential_downtime(max_downtime, steps))
+        else:
+            self._downtime = max_downtime
+        self._last = None
+        self._transfer_rate = None
+        self._dirty_rate = None
+        self._stalled = 0
+
+    @property
+    def downtime(self):
+        return self._downtime
+
+    @property
+    def transfer_rate(self):
+        """
+        Estimated transfer rate in bytes per second.
+        """
+        return self._transfer_rate
+
+    @property
+    def dirty_rate(self):
+        """
+        Estimated dirty rate in bytes per second.
+        """
+        return self._dirty_rate
+
+    def sample(self, timestamp, processed, remaining):
+        """
+        Add a sample of the migration job, with the processed and
+        remaining data in bytes, and return the actions to perform.
+        """
+        last = self._last
+        self._last = (timestamp, processed, remaining)
+
+        if last is None:
+            return [PolicyAction(ACTION_DOWNTIME, self._downtime)]
+
+        elapsed = timestamp - last[0]
+        if elapsed <= 0:
+            return []
+
+        # Nothing was transferred, the rates cannot be measured. Stalled
+        # migrations are aborted by the monitor progress timeout.
+        if processed <= last[1]:
+            return []
+
+        transfer_rate = (processed - last[1]) / float(elapsed)
+        # remaining = last remaining - transferred + dirtied
+        dirty_rate = max(0.0, transfer_rate + (remaining - last[2]) /
+                         float(elapsed))
+        self._transfer_rate = self._average(self._transfer_rate,
+                                            transfer_rate)
+        self._dirty_rate = self._average(self._dirty_rate, dirty_rate)
+
+        if self._dirty_rate < self._transfer_rate * self._CONVERGING:
+            self._stalled = 0
+            return []
+
+        needed = int(remaining * 1000 * self._MARGIN / self._transfer_rate)
+        if needed <= self._max_downtime:
+            self._stalled = 0
+            if needed > self._downtime:
+                self._downtime = needed
+                return [PolicyAction(ACTION_DOWNTIME, needed)]
+            return []
+
+        actions = []
+        if self._downtime < self._max_downtime:
+            self._downtime = self._max_downtime
+            actions.append(PolicyAction(ACTION_DOWNTIME, self._downtime))
+
+        self._stalled += 1
+        if self._stalled >= self._abort_samples:
+            actions.append(PolicyAction(
+                ACTION_ABORT,
+                'migration cannot converge: dirty rate %d MiB/s, transfer '
+                'rate %d MiB/s, needed downtime %d ms, maximum downtime %d '
+                'ms' % (self._dirty_rate / Mbytes,
+                        self._transfer_rate / Mbytes,
+                        needed, self._max_downtime)))
+        return actions
+
+    def _average(self, average, value):
+        if average is None:
+            return value
+        return average * (1 - self._ALPHA) + value * self._ALPHA
+
+
 class DowntimeThread(threading.Thread):
     def __init__(self, vm, downtime, steps):
         super(DowntimeThread, self).__init__()
@@ -471,11 +825,13 @@ class MonitorThread(threading.Thread):
     _MIGRATION_MONITOR_INTERVAL = config.getint(
         'vars', 'migration_monitor_interval')  # seconds
 
-    def __init__(self, vm, startTime):
+    def __init__(self, vm, startTime, onThroughput=None, policy=None):
         super(MonitorThread, self).__init__()
         self._stop = threading.Event()
         self._vm = vm
         self._startTime = startTime
+        self._onThroughput = onThroughput
+        self._policy = policy
         self.daemon = True
         self.progress = 0
 
@@ -506,6 +862,7 @@ class MonitorThread(threading.Thread):
         lastProgressTime = time.time()
         lowmark = None
         progress_timeout = config.getint('vars', 'migration_progress_timeout')
+        lastProcessed = None
 
         while not self._stop.isSet():
             self._stop.wait(self._MIGRATION_MONITOR_INTERVAL)
@@ -535,6 +892,10 @@ class MonitorThread(threading.Thread):
                     'Aborting.' % (now - lastProgressTime))
                 abort = True
 
+            if (not abort and self._policy is not None and
+                    jobType != libvirt.VIR_DOMAIN_JOB_NONE):
+                abort = self._apply_policy(now, dataProcessed, dataRemaining)
+
             if abort:
                 self._vm._dom.abortJob()
                 self.stop()
@@ -550,10 +911,34 @@ class MonitorThread(threading.Thread):
             if jobType != libvirt.VIR_DOMAIN_JOB_NONE:
                 self.progress = update_progress(dataRemaining, dataTotal)
 
+                if self._onThroughput is not None:
+                    if lastProcessed is not None and now > lastProcessed[1]:
+                        throughput = (
+                            float(dataProcessed - lastProcessed[0]) /
+                            Mbytes / (now - lastProcessed[1]))
+                        self._onThroughput(max(throughput, 0))
+                    lastProcessed = (dataProcessed, now)
+
                 self._vm.log.info('Migration Progress: %s seconds elapsed,'
                                   ' %s%% of data processed' %
                                   (timeElapsed / 1000, self.progress))
 
+    def _apply_policy(self, now, dataProcessed, dataRemaining):
+        """
+        Perform the actions of the policy, returning True if the migration
+        should be aborted.
+        """
+        for action in self._policy.sample(now, dataProcessed, dataRemaining):
+            if action.action == ACTION_DOWNTIME:
+                self._vm.log.debug('setting migration downtime to %d',
+                                   action.value)
+                self._vm._dom.migrateSetMaxDowntime(action.value, 0)
+            elif action.action == ACTION_ABORT:
+                self._vm.log.warn('%s. The migration will be aborted.',
+                                  action.value)
+                return True
+        return False
+
     def stop(self):
         self._vm.log.debug('stopping migration monitor thread')
         self._stop.set()
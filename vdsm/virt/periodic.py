@@ -25,8 +25,11 @@ code to perform periodic maintenance and bookkeeping of the VMs.
 import logging
 import threading
 
+import libvirt
+
 from vdsm import executor
 from vdsm import libvirtconnection
+from vdsm import rpcstats
 from vdsm.config import config
 
 from . import sampling
@@ -65,6 +68,10 @@ def start(cif, scheduler):
             cif.getVMs, _executor, func, _timeout_from(period))
         return Operation(disp, period, scheduler)
 
+    watermark_interval = config.getint('vars', 'vm_watermark_interval')
+    watermark_fallback_interval = config.getint(
+        'vars', 'vm_watermark_fallback_interval')
+
     _operations = [
         # needs dispatching becuse updating the volume stats needs the
         # access the storage, thus can block.
@@ -93,15 +100,28 @@ def start(cif, scheduler):
             config.getint('vars', 'vm_sample_interval'),
             scheduler),
 
-        # we do this only until we get high water mark notifications
-        # from qemu. Access storage and/or qemu monitor, so can block,
-        # thus we need dispatching.
-        per_vm_operation(
-            DriveWatermarkMonitor,
-            config.getint('vars', 'vm_watermark_interval'))
+        # Fallback for drives not using block threshold events.
+        # Watermarks of all vms are sampled using bulk stats, extending
+        # drives access storage and/or qemu monitor, so can block, thus we
+        # need dispatching.
+        Operation(
+            DriveWatermarkMonitor(
+                libvirtconnection.get(cif),
+                cif.getVMs,
+                _executor,
+                _timeout_from(watermark_interval),
+                fallback_every=max(watermark_fallback_interval //
+                                   watermark_interval, 1)),
+            watermark_interval,
+            scheduler)
 
     ]
 
+    rpc_stats_interval = config.getint('rpc', 'stats_report_interval')
+    if rpc_stats_interval > 0:
+        _operations.append(
+            Operation(rpcstats.report, rpc_stats_interval, scheduler))
+
     for op in _operations:
         op.start()
 
@@ -113,6 +133,13 @@ def stop():
     _executor.stop(wait=False)
 
 
+def dispatch(func, timeout):
+    """
+    Run func as soon as possible using the periodic executor.
+    """
+    _executor.dispatch(func, timeout)
+
+
 class Operation(object):
     """
     Operation runs a callable with a given period until
@@ -314,17 +341,76 @@ class BlockjobMonitor(object):
 
 
 class DriveWatermarkMonitor(object):
-    def __init__(self, vm):
-        self._vm = vm
+    """
+    Check the watermarks of the chunked drives of all vms using a single
+    libvirt bulk stats call, and dispatch extension only to vms having
+    drives which may need it.
 
-    @property
-    def required(self):
-        # Avoid queries from storage during recovery process
-        return self._vm.isDisksStatsCollectionEnabled()
+    Vms extending drives on block threshold events are checked only every
+    fallback_every calls.
+    """
 
-    @property
-    def runnable(self):
-        return self._vm.isDomainReadyForCommands()
+    _log = logging.getLogger("virt.periodic.DriveWatermarkMonitor")
+
+    def __init__(self, conn, get_vms, executor, timeout, fallback_every=1):
+        self._conn = conn
+        self._get_vms = get_vms
+        self._executor = executor
+        self._timeout = timeout
+        self._fallback_every = fallback_every
+        self._calls = 0
 
     def __call__(self):
-        self._vm.extendDrivesIfNeeded()
+        vms = {}
+
+        fallback = self._calls % self._fallback_every == 0
+        self._calls += 1
+
+        for vm_id, vm_obj in self._get_vms().iteritems():
+            # Avoid queries from storage during recovery process
+            if not (vm_obj.isDisksStatsCollectionEnabled() and
+                    vm_obj.hasChunkedDrives()):
+                continue
+            if not (fallback or vm_obj.needsWatermarkPolling()):
+                continue
+            vms[vm_id] = vm_obj
+
+        # Avoid blocking the bulk stats call on unresponsive domains
+        doms, skipped = sampling.get_responsive_doms(vms)
+
+        if doms:
+            bulk_stats = self._conn.domainListGetStats(
+                doms, libvirt.VIR_DOMAIN_STATS_BLOCK)
+        else:
+            bulk_stats = []
+
+        for dom, stats in bulk_stats:
+            vm_obj = vms.get(dom.UUIDString())
+            if vm_obj is None:
+                continue
+            try:
+                drives = vm_obj.getDrivesToExtend(stats)
+                if drives:
+                    self._executor.dispatch(
+                        _DriveExtension(vm_obj, drives), self._timeout)
+            except executor.TooManyTasks:
+                skipped.append(vm_obj.id)
+            except Exception:
+                self._log.exception("while checking watermarks of VM '%s'",
+                                    vm_obj.id)
+
+        if skipped:
+            self._log.warning('could not check watermarks of %s', skipped)
+        return skipped  # for testing purposes
+
+
+class _DriveExtension(object):
+    def __init__(self, vm, drives):
+        self._vm = vm
+        self._drives = drives
+
+    def __call__(self):
+        self._vm.extendDrivesIfNeeded(self._drives)
+
+    def __repr__(self):
+        return '_DriveExtension(%s)' % self._vm.id
@@ -0,0 +1,250 @@
+#
+# Copyright 2016 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+"""
+This module persists the state needed to recover the running VMs when vdsm
+is restarted.
+
+The state of each VM is kept in two files:
+
+    <vmid>.recovery     the full state, a pickled dict, as written by older
+                        vdsm versions
+    <vmid>.journal      the changes since the full state was written
+
+The journal starts with the checksum of the full state it belongs to,
+followed by (changed, removed) records of the top level keys modified by
+each write. When the journal grows larger than the full state, the full
+state is rewritten and a new journal is started. A journal left behind
+when vdsm was killed during this compaction does not match the new full
+state, and is ignored.
+
+The first state of a VM saved since vdsm was started is always written
+by the caller, so a running VM never lacks a recovery file, which would
+make the next vdsm instance destroy it during recovery. When the store is
+started, later saves only queue the state; a writer thread writes the
+latest queued state of each VM every flush_interval seconds, so many
+saves of the same VM between flushes cost a single write. Otherwise the
+state is written by the caller. Changes that must not be lost if vdsm is
+killed, like changes of the volume chain, are saved with sync=True and
+always written by the caller.
+
+load() returns the full state with the journal applied. A truncated
+record at the end of the journal is ignored.
+"""
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from vdsm import concurrent
+from vdsm import constants
+from vdsm import utils
+from vdsm.compat import pickle
+
+RECOVERY = '.recovery'
+JOURNAL = '.journal'
+
+# Readable by both python 2 and python 3.
+_PICKLE_PROTOCOL = 2
+
+
+class RecoveryStore(object):
+
+    def __init__(self, path=None):
+        """
+        Keep the files in path, or in constants.P_VDSM_RUN if not set.
+        """
+        self.log = logging.getLogger("virt.recovery")
+        self._path = path
+        self._lock = threading.Lock()
+        # Serializes writing and removing files.
+        self._io_lock = threading.Lock()
+        self._pending = {}
+        # Written journals, by recovery file path
+        self._journals = {}
+        self._flush_interval = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self, flush_interval=1):
+        """
+        Start writing the state asynchronously, every flush_interval
+        seconds.
+        """
+        self._flush_interval = flush_interval
+        self._done.clear()
+        self._thread = concurrent.thread(self._run, name="vmrecovery",
+                                         logger=self.log)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the writer thread, writing all queued states.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+        self._done.set()
+        thread.join()
+        self._thread = None
+        self.flush()
+
+    def save(self, vmid, state, sync=False):
+        """
+        Save the state of a VM. The store keeps a reference to state,
+        which must not be modified by the caller.
+
+        If sync is True, the state is written before returning.
+        """
+        if (sync or self._thread is None or
+                self._file(vmid, RECOVERY) not in self._journals):
+            with self._io_lock:
+                with self._lock:
+                    self._pending.pop(vmid, None)
+                self._write(vmid, state)
+        else:
+            with self._lock:
+                self._pending[vmid] = state
+
+    def load(self, vmid):
+        """
+        Return the saved state of a VM.
+        """
+        with open(self._file(vmid, RECOVERY), 'rb') as f:
+            data = f.read()
+        state = pickle.loads(data)
+        try:
+            with open(self._file(vmid, JOURNAL), 'rb') as f:
+                self._replay(vmid, f, _checksum(data), state)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        return state
+
+    def remove(self, vmid):
+        """
+        Drop the queued state of a VM and remove its files.
+        """
+        with self._io_lock:
+            with self._lock:
+                self._pending.pop(vmid, None)
+            recovery_file = self._file(vmid, RECOVERY)
+            self._journals.pop(recovery_file, None)
+            utils.rmFile(self._file(vmid, JOURNAL))
+            utils.rmFile(recovery_file)
+
+    def flush(self):
+        """
+        Write the queued states.
+        """
+        with self._io_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+            for vmid, state in pending.iteritems():
+                try:
+                    self._write(vmid, state)
+                except Exception:
+                    self.log.exception("Error saving state of vm %s", vmid)
+
+    def _run(self):
+        while not self._done.wait(self._flush_interval):
+            self.flush()
+
+    def _replay(self, vmid, f, checksum, state):
+        try:
+            if pickle.load(f) != checksum:
+                self.log.warning("Ignoring stale journal of vm %s", vmid)
+                return
+            while True:
+                changed, removed = pickle.load(f)
+                state.update(changed)
+                for key in removed:
+                    state.pop(key, None)
+        except EOFError:
+            pass
+        except Exception:
+            self.log.warning("Ignoring truncated journal of vm %s", vmid,
+                             exc_info=True)
+
+    def _write(self, vmid, state):
+        # Must be called with _io_lock held
+        journal = self._journals.get(self._file(vmid, RECOVERY))
+        if journal is None:
+            # First write since vdsm was started; we don't know what was
+            # written before.
+            self._compact(vmid, state)
+            return
+
+        changed = dict((key, value) for key, value in state.iteritems()
+                       if key not in journal.state or
+                       journal.state[key] != value)
+        removed = [key for key in journal.state if key not in state]
+        if not changed and not removed:
+            return
+
+        record = pickle.dumps((changed, removed), _PICKLE_PROTOCOL)
+        if journal.size + len(record) > journal.limit:
+            self._compact(vmid, state)
+            return
+
+        with open(self._file(vmid, JOURNAL), 'ab') as f:
+            f.write(record)
+        journal.size += len(record)
+        journal.state = state
+
+    def _compact(self, vmid, state):
+        data = pickle.dumps(state, _PICKLE_PROTOCOL)
+        header = pickle.dumps(_checksum(data), _PICKLE_PROTOCOL)
+        recovery_file = self._file(vmid, RECOVERY)
+        self._replace(recovery_file, data)
+        self._replace(self._file(vmid, JOURNAL), header)
+        self._journals[recovery_file] = _Journal(state, len(header),
+                                                 len(data))
+
+    def _replace(self, path, data):
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path),
+                                         delete=False) as f:
+            f.write(data)
+        os.rename(f.name, path)
+
+    def _file(self, vmid, kind):
+        path = self._path or constants.P_VDSM_RUN
+        return os.path.join(path, vmid + kind)
+
+
+class _Journal(object):
+
+    def __init__(self, state, size, limit):
+        # The last written state
+        self.state = state
+        self.size = size
+        self.limit = limit
+
+
+def _checksum(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+store = RecoveryStore()
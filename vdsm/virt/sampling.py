@@ -24,6 +24,7 @@ Support for VM and host statistics sampling.
 
 from collections import defaultdict, deque, namedtuple
 import errno
+import itertools
 import logging
 import os
 import re
@@ -40,6 +41,7 @@ from vdsm.config import config
 import v2v
 
 from . import virdomain
+from . import vmstats
 from .utils import ExpiringCache
 
 import caps
@@ -420,6 +422,8 @@ class StatsCache(object):
         self._samples = SampleWindow(size=2, timefn=self._clock)
         self._last_sample_time = 0
         self._vm_last_timestamp = defaultdict(int)
+        self._metrics = {}
+        self._generation = 0
 
     def add(self, vmid):
         """
@@ -436,6 +440,7 @@ class StatsCache(object):
         """
         with self._lock:
             del self._vm_last_timestamp[vmid]
+            self._metrics.pop(vmid, None)
 
     def get(self, vmid):
         """
@@ -458,12 +463,54 @@ class StatsCache(object):
             return StatsSample(first_sample, last_sample,
                                interval, stats_age)
 
+    def metrics(self, vmid, sample):
+        """
+        Return the vmstats.sample_metrics() of the given StatsSample of the
+        given VM, as returned by get().
+
+        The metrics are computed once per sample and shared by all the
+        callers until the next sample is put in the cache, so polling the
+        stats more often than the sampling interval is cheap.
+        """
+        if sample.first_value is None or sample.last_value is None:
+            return None
+
+        with self._lock:
+            cached = self._metrics.get(vmid)
+        if (cached is not None and
+                cached[0] is sample.first_value and
+                cached[1] is sample.last_value):
+            return cached[2]
+
+        # Computed outside of the lock; concurrent callers may compute the
+        # same metrics, but will not block sampling.
+        metrics = vmstats.sample_metrics(sample.first_value,
+                                         sample.last_value,
+                                         sample.interval)
+        with self._lock:
+            # A new sample may have been put meanwhile; do not cache the
+            # metrics of an old sample.
+            last_batch = self._samples.last()
+            if (last_batch is not None and
+                    last_batch.get(vmid) is sample.last_value):
+                self._metrics[vmid] = (sample.first_value, sample.last_value,
+                                       metrics)
+        return metrics
+
     def clock(self):
         """
         Provide timestamp compatible with what put() expects
         """
         return self._clock()
 
+    @property
+    def generation(self):
+        """
+        Number of samples put in the cache, changes when new stats are
+        available.
+        """
+        return self._generation
+
     def put(self, bulk_stats, monotonic_ts):
         """
         Add a new bulk sample to the collection.
@@ -478,6 +525,8 @@ class StatsCache(object):
             if monotonic_ts >= last_sample_time:
                 self._samples.append(bulk_stats)
                 self._last_sample_time = monotonic_ts
+                self._metrics.clear()
+                self._generation += 1
 
                 self._update_ts(bulk_stats, monotonic_ts)
             else:
@@ -494,6 +543,59 @@ class StatsCache(object):
 stats_cache = StatsCache()
 
 
+class StatsSnapshot(object):
+    """
+    Snapshot of the stats of all VMs, shared by all the callers until new
+    stats are available.
+
+    The snapshot is recomputed when a new sample is put in the stats cache,
+    when the VMs change, when invalidated (e.g. on VM status change), or
+    when older than max_age seconds, bounding the staleness of the stats
+    not coming from the stats cache, like guest agent info. If max_age is
+    0, the stats are computed on each call.
+
+    Callers must not modify the returned stats.
+    """
+
+    def __init__(self, stats_cache, max_age, clock=utils.monotonic_time):
+        self._stats_cache = stats_cache
+        self._max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._versions = itertools.count()
+        self._version = next(self._versions)
+        self._key = None
+        self._expires = 0
+        self._stats = None
+
+    def invalidate(self):
+        """
+        Recompute the stats on the next call. Never blocks, so it is safe
+        to call while holding other locks.
+        """
+        self._version = next(self._versions)
+
+    def get(self, vms):
+        """
+        Return the list of stats of the given VMs.
+        """
+        if self._max_age <= 0:
+            return [vm.getStats() for vm in vms]
+
+        # Computing the stats under the lock let concurrent callers wait for
+        # the first caller instead of computing the same stats again.
+        with self._lock:
+            now = self._clock()
+            key = (self._stats_cache.generation, self._version, vms)
+            if key != self._key or now >= self._expires:
+                # If invalidated while computing, the key will not match on
+                # the next call.
+                self._stats = [vm.getStats() for vm in vms]
+                self._key = key
+                self._expires = now + self._max_age
+            return self._stats
+
+
 # this value can be tricky to tune.
 # we should avoid as much as we can to trigger
 # false positive fast flows (getAllDomainStats call).
@@ -544,22 +646,34 @@ class VMBulkSampler(object):
             self._sampling.release()
 
     def _get_responsive_doms(self):
-        vms = self._get_vms()
-        doms = []
-        for vm_id, vm_obj in vms.iteritems():
-            to_skip = self._skip_doms.get(vm_id, False)
-            if to_skip:
-                continue
-            elif not vm_obj.isDomainReadyForCommands():
-                self._skip_doms[vm_id] = True
-            else:
-                # TODO: This racy check may fail if the underlying libvirt
-                # domain has died just after checking isDomainReadyForCommands
-                # succeeded.
-                doms.append(vm_obj._dom._dom)
+        vms = dict((vm_id, vm_obj)
+                   for vm_id, vm_obj in self._get_vms().iteritems()
+                   if not self._skip_doms.get(vm_id, False))
+        doms, unresponsive = get_responsive_doms(vms)
+        for vm_id in unresponsive:
+            self._skip_doms[vm_id] = True
         return doms
 
 
+def get_responsive_doms(vms):
+    """
+    Given a dict of vms by id, return a tuple (doms, unresponsive), where
+    doms are the libvirt domains of the vms ready for commands, and
+    unresponsive are the ids of the other vms.
+    """
+    doms = []
+    unresponsive = []
+    for vm_id, vm_obj in vms.iteritems():
+        if not vm_obj.isDomainReadyForCommands():
+            unresponsive.append(vm_id)
+        else:
+            # TODO: This racy check may fail if the underlying libvirt
+            # domain has died just after checking isDomainReadyForCommands
+            # succeeded.
+            doms.append(vm_obj._dom._dom)
+    return doms, unresponsive
+
+
 class HostStatsThread(threading.Thread):
     """
     A thread that periodically samples host statistics.
@@ -22,6 +22,7 @@
 # stdlib imports
 from collections import namedtuple
 from contextlib import contextmanager
+from functools import partial
 from xml.dom.minidom import parseString as _domParseStr
 import logging
 import os
@@ -62,6 +63,8 @@ import numaUtils
 from .domain_descriptor import DomainDescriptor
 from . import guestagent
 from . import migration
+from . import periodic
+from . import recovery
 from . import sampling
 from . import virdomain
 from . import vmdevices
@@ -123,6 +126,130 @@ def _filterSnappableDiskDevices(diskDeviceXmlElements):
                       diskDeviceXmlElements)
 
 
+def _extensionNeeded(drive, capacity, alloc, physical):
+    """
+    Return True if a chunked drive should be extended, given its
+    watermarks. Raise ImprobableResizeRequestError if the extension
+    request is improbable.
+    """
+    nextPhysSize = drive.getNextVolumeSize(physical, capacity)
+
+    # NOTE: the intent of this check is to prevent faulty images to
+    # trick qemu in requesting extremely large extensions (BZ#998443).
+    # Probably the definitive check would be comparing the allocated
+    # space with capacity + format_overhead. Anyway given that:
+    #
+    # - format_overhead is tricky to be computed (it depends on few
+    #   assumptions that may change in the future e.g. cluster size)
+    # - currently we allow only to extend by one chunk at time
+    #
+    # the current check compares alloc with the next volume size.
+    # It should be noted that alloc cannot be directly compared with
+    # the volume physical size as it includes also the clusters not
+    # written yet (pending).
+    if alloc > nextPhysSize:
+        raise ImprobableResizeRequestError(
+            "capacity: %s, allocated: %s, physical: %s, next physical "
+            "size: %s" % (capacity, alloc, physical, nextPhysSize))
+
+    if physical >= drive.getMaxVolumeSize(capacity):
+        # The volume was extended to the maximum size. physical may be
+        # larger than maximum volume size since it is rounded up to the
+        # next lvm extent.
+        return False
+
+    return physical - alloc < drive.watermarkLimit
+
+
+class PollingExtensionTrigger(object):
+    """
+    Drive extension trigger relying on periodic watermark polling.
+    """
+
+    events = False
+
+    def __init__(self, vm):
+        self._vm = vm
+
+    def armed(self, drive):
+        return False
+
+    def arm(self, drive, physical):
+        pass
+
+    def disarm(self, drive):
+        pass
+
+    def onThreshold(self, drive):
+        pass
+
+
+class ThresholdExtensionTrigger(PollingExtensionTrigger):
+    """
+    Drive extension trigger using libvirt block threshold events.
+
+    A threshold is set on chunked drives at the physical size minus the
+    watermark limit. When the guest writes beyond it, libvirt delivers a
+    single event and the drive is checked immediately. The threshold is set
+    again after the drive is extended. Drives without a threshold are
+    polled, and other drives are polled at a lower frequency as a fallback.
+
+    Libvirt sets the threshold on the top volume of the drive, so the drive
+    must be disarmed when the top volume is replaced or the drive is
+    unplugged.
+    """
+
+    events = True
+
+    def __init__(self, vm, dispatch=periodic.dispatch,
+                 timeout=config.getint('vars', 'vm_watermark_interval')):
+        super(ThresholdExtensionTrigger, self).__init__(vm)
+        self._dispatch = dispatch
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._armed = set()
+
+    def armed(self, drive):
+        return drive.name in self._armed
+
+    def arm(self, drive, physical):
+        threshold = max(physical - drive.watermarkLimit, 0)
+        try:
+            self._vm._dom.setBlockThreshold(drive.name, threshold)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() in (libvirt.VIR_ERR_NO_SUPPORT,
+                                      libvirt.VIR_ERR_OPERATION_UNSUPPORTED):
+                self._vm.log.info("Block threshold events not supported, "
+                                  "polling drive watermarks")
+                self.events = False
+            else:
+                self._vm.log.warning("Unable to set block threshold for "
+                                     "drive %s: %s", drive.name, e)
+            return
+        self._vm.log.debug("Block threshold for drive %s set to %s",
+                           drive.name, threshold)
+        with self._lock:
+            self._armed.add(drive.name)
+
+    def disarm(self, drive):
+        with self._lock:
+            self._armed.discard(drive.name)
+
+    def onThreshold(self, drive):
+        # Thresholds are removed by libvirt when the event is delivered
+        with self._lock:
+            self._armed.discard(drive.name)
+        self._dispatch(partial(self._vm.extendDrivesIfNeeded, [drive]),
+                       self._timeout)
+
+
+def _extensionTrigger(vm):
+    if (config.getboolean('vars', 'vm_watermark_events') and
+            libvirtconnection.VIR_DOMAIN_EVENT_ID_BLOCK_THRESHOLD is not None):
+        return ThresholdExtensionTrigger(vm)
+    return PollingExtensionTrigger(vm)
+
+
 class VolumeError(RuntimeError):
     def __str__(self):
         return "Bad volume specification " + RuntimeError.__str__(self)
@@ -262,8 +389,6 @@ class Vm(object):
         self.cif = cif
         self.log = SimpleLogAdapter(self.log, {"vmId": self.conf['vmId']})
         self._destroyed = False
-        self._recoveryFile = constants.P_VDSM_RUN + \
-            str(self.conf['vmId']) + '.recovery'
         self._monitorResponse = 0
         self.memCommitted = 0
         self._consoleDisconnectAction = ConsoleDisconnectAction.LOCK_SCREEN
@@ -325,6 +450,7 @@ class Vm(object):
         self._numaInfo = {}
         self._vmJobs = None
         self._clientPort = ''
+        self._extendTrigger = _extensionTrigger(self)
 
     def _get_lastStatus(self):
         # note that we don't use _statusLock here. One of the reasons is the
@@ -350,6 +476,8 @@ class Vm(object):
             if self._lastStatus != value:
                 self.saveState()
                 self._lastStatus = value
+                # Not all status changes send an event
+                self.cif.invalidateVmStats()
 
     def send_status_event(self, **kwargs):
         stats = {'status': self._getVmStatus()}
@@ -805,15 +933,20 @@ class Vm(object):
             load = len(self.cif.vmContainer)
         return base * (doubler + load) / doubler
 
-    def saveState(self):
-        self._saveStateInternal()
+    def saveState(self, sync=False):
+        """
+        Save the state of the vm for recovery. Use sync=True for changes
+        which must not be lost if vdsm is killed, like changes of the
+        volume chain; other changes may be written later.
+        """
+        self._saveStateInternal(sync)
         try:
             self._updateDomainDescriptor()
         except Exception:
             # we do not care if _dom suddenly died now
             pass
 
-    def _saveStateInternal(self):
+    def _saveStateInternal(self, sync=False):
         if self._destroyed:
             return
         toSave = self.status()
@@ -840,11 +973,7 @@ class Vm(object):
         toSave['_blockJobs'] = utils.picklecopy(
             self.conf.get('_blockJobs', {}))
 
-        with tempfile.NamedTemporaryFile(dir=constants.P_VDSM_RUN,
-                                         delete=False) as f:
-            pickle.dump(toSave, f)
-
-        os.rename(f.name, self._recoveryFile)
+        recovery.store.save(self.id, toSave, sync=sync)
 
     def onReboot(self):
         try:
@@ -920,13 +1049,77 @@ class Vm(object):
         with self._confLock:
             self.conf['timeOffset'] = newTimeOffset
 
-    def _getExtendCandidates(self):
-        ret = []
+    def _chunkedDrives(self):
+        return [drive for drive in self._devices[hwclass.DISK]
+                if drive.chunked or drive.replicaChunked]
 
-        for drive in self._devices[hwclass.DISK]:
-            if not (drive.chunked or drive.replicaChunked):
+    def hasChunkedDrives(self):
+        return any(drive.chunked or drive.replicaChunked
+                   for drive in self._devices[hwclass.DISK])
+
+    def needsWatermarkPolling(self):
+        """
+        Return True if drive watermarks must be polled, since some chunked
+        drives are not extended on block threshold events.
+        """
+        if not self._extendTrigger.events:
+            return True
+        return any(not (drive.chunked and self._extendTrigger.armed(drive))
+                   for drive in self._chunkedDrives())
+
+    def onBlockThreshold(self, dev, path, threshold, excess):
+        self.log.info("Block threshold %s exceeded by %s for drive %s (%s)",
+                      threshold, excess, dev, path)
+        try:
+            drive = self._findDriveByName(dev)
+        except LookupError:
+            self.log.warning("Unknown drive %s for block threshold event",
+                             dev)
+            return
+        self._extendTrigger.onThreshold(drive)
+
+    def getDrivesToExtend(self, blockStats):
+        """
+        Return the chunked drives which may need extension, using the
+        "block" group of libvirt bulk stats for this vm.
+
+        Drives without watermark stats, and drives replicating to a chunked
+        replica, whose physical size is not reported by libvirt, are always
+        returned, so extendDrivesIfNeeded checks them using blockInfo.
+        """
+        indexes = {}
+        for idx in range(blockStats.get('block.count', 0)):
+            indexes[blockStats['block.%d.name' % idx]] = idx
+
+        ret = []
+        for drive in self._chunkedDrives():
+            idx = indexes.get(drive.name)
+            if not drive.chunked or idx is None:
+                ret.append(drive)
+                continue
+            try:
+                capacity = blockStats['block.%d.capacity' % idx]
+                alloc = blockStats['block.%d.allocation' % idx]
+                physical = blockStats['block.%d.physical' % idx]
+            except KeyError:
+                ret.append(drive)
                 continue
+            try:
+                needed = _extensionNeeded(drive, capacity, alloc, physical)
+            except ImprobableResizeRequestError:
+                # extendDrivesIfNeeded will check it again and pause the vm
+                needed = True
+            if needed:
+                ret.append(drive)
+        return ret
+
+    def _getExtendCandidates(self, drives=None):
+        ret = []
+
+        if drives is None:
+            drives = self._chunkedDrives()
 
+        for drive in drives:
             try:
                 capacity, alloc, physical = self._getExtendInfo(drive)
             except libvirt.libvirtError as e:
@@ -961,44 +1154,22 @@ class Vm(object):
         return capacity, alloc, physical
 
     def _shouldExtendVolume(self, drive, volumeID, capacity, alloc, physical):
-        nextPhysSize = drive.getNextVolumeSize(physical, capacity)
-
-        # NOTE: the intent of this check is to prevent faulty images to
-        # trick qemu in requesting extremely large extensions (BZ#998443).
-        # Probably the definitive check would be comparing the allocated
-        # space with capacity + format_overhead. Anyway given that:
-        #
-        # - format_overhead is tricky to be computed (it depends on few
-        #   assumptions that may change in the future e.g. cluster size)
-        # - currently we allow only to extend by one chunk at time
-        #
-        # the current check compares alloc with the next volume size.
-        # It should be noted that alloc cannot be directly compared with
-        # the volume physical size as it includes also the clusters not
-        # written yet (pending).
-        if alloc > nextPhysSize:
+        try:
+            return _extensionNeeded(drive, capacity, alloc, physical)
+        except ImprobableResizeRequestError as e:
             msg = ("Improbable extension request for volume %s on domain "
-                   "%s, pausing the VM to avoid corruptions (capacity: %s, "
-                   "allocated: %s, physical: %s, next physical size: %s)" %
-                   (volumeID, drive.domainID, capacity, alloc, physical,
-                    nextPhysSize))
+                   "%s, pausing the VM to avoid corruptions (%s)" %
+                   (volumeID, drive.domainID, e))
             self.log.error(msg)
             self.pause(pauseCode='EOTHER')
             raise ImprobableResizeRequestError(msg)
 
-        if physical >= drive.getMaxVolumeSize(capacity):
-            # The volume was extended to the maximum size. physical may be
-            # larger than maximum volume size since it is rounded up to the
-            # next lvm extent.
-            return False
-
-        if physical - alloc < drive.watermarkLimit:
-            return True
-        return False
-
-    def extendDrivesIfNeeded(self):
+    def extendDrivesIfNeeded(self, drives=None):
+        """
+        Extend the chunked drives, or the given drives, if needed.
+        """
         try:
-            extend = [x for x in self._getExtendCandidates()
+            extend = [x for x in self._getExtendCandidates(drives)
                       if self._shouldExtendVolume(*x)]
         except ImprobableResizeRequestError:
             return False
@@ -1378,10 +1549,12 @@ class Vm(object):
 
         try:
             vm_sample = sampling.stats_cache.get(self.id)
+            metrics = sampling.stats_cache.metrics(self.id, vm_sample)
             decStats = vmstats.produce(self,
                                        vm_sample.first_value,
                                        vm_sample.last_value,
-                                       vm_sample.interval)
+                                       vm_sample.interval,
+                                       metrics)
             self._setUnresponsiveIfTimeout(stats, vm_sample.stats_age)
         except Exception:
             self.log.exception("Error fetching vm stats")
@@ -1635,7 +1808,7 @@ class Vm(object):
         self._cleanupDrives()
         self._cleanupFloppy()
         self._cleanupGuestAgent()
-        utils.rmFile(self._recoveryFile)
+        recovery.store.remove(self.id)
         cleanup_guest_socket(self._qemuguestSocketFile)
         self._reattachHostDevices()
         self._cleanupStatsCache()
@@ -1777,6 +1950,7 @@ class Vm(object):
 
         self._updateVcpuTuneInfo()
         self._updateVcpuLimit()
+        self._setWriteWatermarks()
 
     def _run(self):
         self.log.info("VM wrapper has started")
@@ -2600,8 +2774,9 @@ class Vm(object):
 
             with self._confLock:
                 self.conf['devices'].append(diskParams)
-            self.saveState()
+            self.saveState(sync=True)
             self._getUnderlyingDriveInfo()
+            self._resetWriteWatermark(drive)
             hooks.after_disk_hotplug(driveXml, self.conf,
                                      params=drive.custom)
 
@@ -2644,6 +2819,7 @@ class Vm(object):
             return response.error('hotunplugDisk', e.message)
         else:
             self._devices[hwclass.DISK].remove(drive)
+            self._extendTrigger.disarm(drive)
 
             # Find and remove disk device from vm's conf
             for dev in self.conf['devices'][:]:
@@ -2652,7 +2828,7 @@ class Vm(object):
                         self.conf['devices'].remove(dev)
                     break
 
-            self.saveState()
+            self.saveState(sync=True)
             hooks.after_disk_hotunplug(driveXml, self.conf,
                                        params=drive.custom)
             self._cleanupDrives(drive)
@@ -2900,6 +3076,7 @@ class Vm(object):
                 for k, v in driveParams.iteritems():
                     setattr(vmDrive, k, v)
                 self.updateDriveVolume(vmDrive)
+                self._resetWriteWatermark(vmDrive)
                 break
         else:
             self.log.error("Unable to update the drive object for: %s",
@@ -2914,7 +3091,7 @@ class Vm(object):
         else:
             with self._confLock:
                 conf.update(driveParams)
-            self.saveState()
+            self.saveState(sync=True)
 
     def freeze(self):
         """
@@ -3382,7 +3559,7 @@ class Vm(object):
         conf = self._findDriveConfigByName(drive.name)
         with self._confLock:
             conf['diskReplicate'] = replica
-        self.saveState()
+        self.saveState(sync=True)
 
         drive.diskReplicate = replica
 
@@ -3397,7 +3574,7 @@ class Vm(object):
         conf = self._findDriveConfigByName(drive.name)
         with self._confLock:
             conf['diskReplicate'] = drive.diskReplicate
-        self.saveState()
+        self.saveState(sync=True)
 
     def _delDiskReplica(self, drive):
         """
@@ -3409,7 +3586,7 @@ class Vm(object):
         conf = self._findDriveConfigByName(drive.name)
         with self._confLock:
             del conf['diskReplicate']
-        self.saveState()
+        self.saveState(sync=True)
 
     def _diskSizeExtendCow(self, drive, newSizeBytes):
         # Apparently this is what libvirt would do anyway, except that
@@ -4461,12 +4638,29 @@ class Vm(object):
                     break
         self.conf['memSize'] = self._domain.get_memory_size()
 
+    def _resetWriteWatermark(self, drive):
+        """
+        Set the block threshold of drive again after its top volume was
+        replaced by a snapshot, pivot or live merge.
+        """
+        self._extendTrigger.disarm(drive)
+        self._setWriteWatermarks()
+
     def _setWriteWatermarks(self):
         """
-        Define when to receive an event about high write to guest image
-        Currently unavailable by libvirt.
+        Define when to receive an event about high write to guest image.
+
+        The drive apparent size is never larger than the physical size, so
+        at worst the event is delivered too early.
         """
-        pass
+        if not self._extendTrigger.events:
+            return
+        for drive in self._chunkedDrives():
+            if not drive.chunked or self._extendTrigger.armed(drive):
+                continue
+            physical = int(getattr(drive, 'apparentsize', 0))
+            if physical:
+                self._extendTrigger.arm(drive, physical)
 
     def onLibvirtLifecycleEvent(self, event, detail, opaque):
         self.log.debug('event %s detail %s opaque %s',
@@ -4607,7 +4801,7 @@ class Vm(object):
                                "%s already exists for image %s", jobID,
                                job['jobID'], drive['imageID'])
                 raise BlockJobExistsError()
-        self.saveState()
+        self.saveState(sync=True)
 
     def untrackBlockJob(self, jobID):
         with self._confLock:
@@ -4617,7 +4811,7 @@ class Vm(object):
                 # If there was contention on the confLock, this may have
                 # already been removed
                 return False
-        self.saveState()
+        self.saveState(sync=True)
         return True
 
     def _activeLayerCommitReady(self, jobInfo):
@@ -4937,6 +5131,8 @@ class Vm(object):
             for v in device['volumeChain']:
                 if v['volumeID'] == volumeID:
                     v['path'] = activePath
+            self.updateDriveVolume(drive)
+            self._resetWriteWatermark(drive)
 
         # Remove any components of the volumeChain which are no longer present
         newChain = [x for x in device['volumeChain']
@@ -23,29 +23,161 @@ import time
 import select
 import logging
 
+from vdsm.rpcstats import Histogram
 from vdsm.utils import NoIntrPoll
 
 # How many times a reconnect should be performed before a cooldown will be
 # applied
 COOLDOWN_RECONNECT_THRESHOLD = 5
 
+# Buckets of the shards latency histograms (seconds)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
 
-class Listener(threading.Thread):
+
+class Listener(object):
     """
     An events driven listener which handle messages from virtual machines.
+
+    The channels are hashed to shards, each reading its channels in its own
+    thread, so slow message handlers delay only the channels of the same
+    shard. Connecting and reconnecting channels is done by a separate
+    connector thread, so reconnect storms do not delay reading.
     """
-    def __init__(self, log):
-        threading.Thread.__init__(self, name='VM Channels Listener')
-        self.daemon = True
+    def __init__(self, log, shards=1):
         self.log = log
+        self._timeout = None
+        self._lock = threading.Lock()
+        # Registered channels, by fileno
+        self._channels = {}
+        self._shards = [_Shard(self, i) for i in range(shards)]
+        self._connector = _Connector(self)
+
+    def start(self):
+        self.log.debug("Starting VM channels listener with %d shards.",
+                       len(self._shards))
+        self._connector.start()
+        for shard in self._shards:
+            shard.start()
+
+    def stop(self):
+        """" Stop the listener execution. """
+        self._connector.stop()
+        for shard in self._shards:
+            shard.stop()
+        self.log.debug("VM channels listener was stopped.")
+
+    def settimeout(self, seconds):
+        """ Set the timeout value (in seconds) for all channels. """
+        self.log.info("Setting channels' timeout to %d seconds.", seconds)
+        self._timeout = seconds
+
+    def register(self, create_callback, connect_callback, read_callback,
+                 timeout_callback, opaque):
+        """ Register a new file descriptor to the listener. """
+        fileno = create_callback(opaque)
+        self.log.debug("Add fileno %d to listener's channels.", fileno)
+        obj = {
+            'connect_cb': connect_callback,
+            'read_cb': read_callback, 'timeout_cb': timeout_callback,
+            'opaque': opaque, 'create_cb': create_callback,
+            'read_time': 0.0,
+            'shard': self._shards[hash(opaque) % len(self._shards)],
+        }
+        with self._lock:
+            self._channels[fileno] = obj
+            self._connector.add(fileno, obj)
+
+    def unregister(self, fileno):
+        """ Unregister an exist file descriptor from the listener. """
+        self.log.debug("Delete fileno %d from listener.", fileno)
+        with self._lock:
+            obj = self._channels.pop(fileno, None)
+            if obj is None:
+                return
+            obj['removed'] = True
+            self._connector.remove(fileno)
+            obj['shard'].remove(fileno)
+
+    def stats(self):
+        """
+        Return the number of channels and the latency histograms of each
+        shard:
+
+            read        time spent in a read callback
+            iteration   time spent handling the events of a single poll,
+                        delaying the next events of the shard
+        """
+        return [shard.stats() for shard in self._shards]
+
+    def _connected(self, fileno, obj):
+        """ Called by the connector when a channel was connected. """
+        with self._lock:
+            if obj.get('removed'):
+                return
+            obj['shard'].add(fileno, obj)
+
+    def _disconnected(self, fileno, obj):
+        """ Called by a shard when a channel should be reconnected. """
+        with self._lock:
+            if obj.get('removed'):
+                return
+            self._connector.reconnect(fileno, obj)
+
+    def _recreated(self, old_fileno, new_fileno, obj):
+        """ Called by the connector when a channel was recreated. """
+        with self._lock:
+            if obj.get('removed'):
+                return False
+            if self._channels.get(old_fileno) is obj:
+                del self._channels[old_fileno]
+            self._channels[new_fileno] = obj
+            return True
+
+
+class _Shard(threading.Thread):
+    """
+    Read the connected channels of a shard and handle their timeouts.
+    """
+
+    # How often to check channels timeouts (seconds)
+    TIMEOUT_CHECK_INTERVAL = 1
+
+    def __init__(self, listener, index):
+        threading.Thread.__init__(
+            self, name='VM Channels Listener %d' % index)
+        self.daemon = True
+        self.log = listener.log
+        self._listener = listener
         self._quit = False
         self._epoll = select.epoll()
         self._channels = {}
-        self._unconnected = {}
         self._update_lock = threading.Lock()
         self._add_channels = {}
         self._del_channels = []
-        self._timeout = None
+        self._next_timeout_check = 0
+        self._stats_lock = threading.Lock()
+        self._read_latency = Histogram(LATENCY_BUCKETS)
+        self._iteration_latency = Histogram(LATENCY_BUCKETS)
+
+    def add(self, fileno, obj):
+        """ Add a connected channel, called from any thread. """
+        with self._update_lock:
+            self._add_channels[fileno] = obj
+        obj['read_time'] = time.time()
+        self._epoll.register(fileno, select.EPOLLIN)
+
+    def remove(self, fileno):
+        """ Remove a channel, called from any thread. """
+        with self._update_lock:
+            self._del_channels.append(fileno)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'channels': len(self._channels),
+                'read': self._read_latency.info(),
+                'iteration': self._iteration_latency.info(),
+            }
 
     def _handle_event(self, fileno, event):
         """ Handle an epoll event occurred on a specific file descriptor. """
@@ -62,6 +194,7 @@ class Listener(threading.Thread):
             if obj:
                 obj['timeout_seen'] = False
                 obj['reconnects'] = 0
+                start = time.time()
                 try:
                     if obj['read_cb'](obj['opaque']):
                         obj['read_time'] = time.time()
@@ -69,6 +202,8 @@ class Listener(threading.Thread):
                         reconnect = True
                 except:
                     self.log.exception("Exception on read callback.")
+                with self._stats_lock:
+                    self._read_latency.add(time.time() - start)
             else:
                 self.log.debug("Received epoll event %.08X for no longer "
                                "tracked fd = %d", event, fileno)
@@ -77,15 +212,17 @@ class Listener(threading.Thread):
             self._prepare_reconnect(fileno)
 
     def _prepare_reconnect(self, fileno):
-            obj = self._channels.pop(fileno)
-            obj['timeout_seen'] = False
-            try:
-                fileno = obj['create_cb'](obj['opaque'])
-            except:
-                self.log.exception("An error occurred in the create callback "
-                                   "fileno: %d.", fileno)
-            else:
-                self._unconnected[fileno] = obj
+        obj = self._channels.pop(fileno)
+        obj['timeout_seen'] = False
+        self._unregister_fd(fileno)
+        self._listener._disconnected(fileno, obj)
+
+    def _unregister_fd(self, fileno):
+        try:
+            self._epoll.unregister(fileno)
+        except (IOError, ValueError):
+            # Already closed, and removed from epoll
+            pass
 
     def _handle_timeouts(self):
         """
@@ -93,8 +230,9 @@ class Listener(threading.Thread):
         their file descriptor.
         """
         now = time.time()
+        timeout = self._listener._timeout
         for (fileno, obj) in self._channels.items():
-            if (now - obj['read_time']) >= self._timeout:
+            if (now - obj['read_time']) >= timeout:
                 if not obj.get('timeout_seen', False):
                     self.log.debug("Timeout on fileno %d.", fileno)
                     obj['timeout_seen'] = True
@@ -104,28 +242,112 @@ class Listener(threading.Thread):
                 except:
                     self.log.exception("Exception on timeout callback.")
 
-    def _do_add_channels(self):
-        """ Add new channels to unconnected channels list. """
-        for (fileno, obj) in self._add_channels.items():
-            self.log.debug("fileno %d was added to unconnected channels.",
-                           fileno)
-            self._unconnected[fileno] = obj
-        self._add_channels.clear()
-
-    def _do_del_channels(self):
-        """ Remove requested channels from listener. """
-        for fileno in self._del_channels:
-            self._add_channels.pop(fileno, None)
-            self._unconnected.pop(fileno, None)
-            self._channels.pop(fileno, None)
-            self.log.debug("fileno %d was removed from listener.", fileno)
+    def _update_channels(self):
+        """ Update channels list. """
+        with self._update_lock:
+            self._channels.update(self._add_channels)
+            self._add_channels.clear()
+            for fileno in self._del_channels:
+                if self._channels.pop(fileno, None) is not None:
+                    self._unregister_fd(fileno)
+                    self.log.debug("fileno %d was removed from listener.",
+                                   fileno)
+            self._del_channels = []
+
+    def _wait_for_events(self):
+        """ Wait for an epoll event and handle channels' timeout. """
+        events = NoIntrPoll(self._epoll.poll, 1)
+        start = time.time()
+        self._update_channels()
+        for (fileno, event) in events:
+            self._handle_event(fileno, event)
+        timeout = self._listener._timeout
+        if (timeout is not None and timeout > 0 and
+                start >= self._next_timeout_check):
+            self._handle_timeouts()
+            self._next_timeout_check = start + self.TIMEOUT_CHECK_INTERVAL
+        if events:
+            with self._stats_lock:
+                self._iteration_latency.add(time.time() - start)
+
+    def run(self):
+        """ The listener thread's function. """
+        self.log.debug("Starting VM channels listener thread.")
+        self._quit = False
+        try:
+            while not self._quit:
+                self._wait_for_events()
+        except:
+            self.log.exception("Unhandled exception caught in vm channels "
+                               "listener thread")
+        finally:
+            self.log.debug("VM channels listener thread has ended.")
+
+    def stop(self):
+        self._quit = True
+
+
+class _Connector(threading.Thread):
+    """
+    Connect and reconnect the unconnected channels of all shards.
+    """
+
+    # How often to retry unconnected channels (seconds)
+    INTERVAL = 1
+
+    def __init__(self, listener):
+        threading.Thread.__init__(self, name='VM Channels Connector')
+        self.daemon = True
+        self.log = listener.log
+        self._listener = listener
+        self._quit = False
+        self._wakeup = threading.Event()
+        self._unconnected = {}
+        self._update_lock = threading.Lock()
+        self._add_channels = {}
+        self._reconnect_channels = {}
         self._del_channels = []
 
+    def add(self, fileno, obj):
+        with self._update_lock:
+            self._add_channels[fileno] = obj
+        self._wakeup.set()
+
+    def reconnect(self, fileno, obj):
+        with self._update_lock:
+            self._reconnect_channels[fileno] = obj
+        self._wakeup.set()
+
+    def remove(self, fileno):
+        with self._update_lock:
+            self._del_channels.append(fileno)
+
     def _update_channels(self):
-        """ Update channels list. """
         with self._update_lock:
-            self._do_add_channels()
-            self._do_del_channels()
+            for (fileno, obj) in self._add_channels.items():
+                self.log.debug("fileno %d was added to unconnected channels.",
+                               fileno)
+                self._unconnected[fileno] = obj
+            self._add_channels.clear()
+            reconnect = self._reconnect_channels
+            self._reconnect_channels = {}
+            for fileno in self._del_channels:
+                self._unconnected.pop(fileno, None)
+                reconnect.pop(fileno, None)
+            self._del_channels = []
+
+        for (fileno, obj) in reconnect.items():
+            self._recreate(fileno, obj)
+
+    def _recreate(self, fileno, obj):
+        try:
+            new_fileno = obj['create_cb'](obj['opaque'])
+        except:
+            self.log.exception("An error occurred in the create callback "
+                               "fileno: %d.", fileno)
+        else:
+            if self._listener._recreated(fileno, new_fileno, obj):
+                self._unconnected[new_fileno] = obj
 
     def _handle_unconnected(self):
         """
@@ -133,9 +355,10 @@ class Listener(threading.Thread):
         to connect their channel.
         """
         now = time.time()
+        timeout = self._listener._timeout
         for (fileno, obj) in self._unconnected.items():
             if obj.get('cooldown'):
-                if (now - obj['cooldown_time']) >= self._timeout:
+                if (now - obj['cooldown_time']) >= timeout:
                     obj['cooldown'] = False
                     self.log.log(logging.TRACE, "Reconnect attempt fileno "
                                  "%d", fileno)
@@ -151,9 +374,7 @@ class Listener(threading.Thread):
                     self.log.debug("Connecting to fileno %d succeeded.",
                                    fileno)
                     del self._unconnected[fileno]
-                    self._channels[fileno] = obj
-                    obj['read_time'] = time.time()
-                    self._epoll.register(fileno, select.EPOLLIN)
+                    self._listener._connected(fileno, obj)
                 else:
                     obj['reconnects'] = obj.get('reconnects', 0) + 1
                     if obj['reconnects'] >= COOLDOWN_RECONNECT_THRESHOLD:
@@ -162,55 +383,20 @@ class Listener(threading.Thread):
                         self.log.log(logging.TRACE, "fileno %d was moved into "
                                      "cooldown", fileno)
 
-    def _wait_for_events(self):
-        """ Wait for an epoll event and handle channels' timeout. """
-        events = NoIntrPoll(self._epoll.poll, 1)
-        for (fileno, event) in events:
-            self._handle_event(fileno, event)
-        else:
-            self._update_channels()
-            if (self._timeout is not None) and (self._timeout > 0):
-                self._handle_timeouts()
-            self._handle_unconnected()
-
     def run(self):
-        """ The listener thread's function. """
-        self.log.debug("Starting VM channels listener thread.")
-        self._quit = False
+        self.log.debug("Starting VM channels connector thread.")
         try:
             while not self._quit:
-                self._wait_for_events()
+                self._update_channels()
+                self._handle_unconnected()
+                self._wakeup.wait(self.INTERVAL)
+                self._wakeup.clear()
         except:
             self.log.exception("Unhandled exception caught in vm channels "
-                               "listener thread")
+                               "connector thread")
         finally:
-            self.log.debug("VM channels listener thread has ended.")
+            self.log.debug("VM channels connector thread has ended.")
 
     def stop(self):
-        """" Stop the listener execution. """
         self._quit = True
-        self.log.debug("VM channels listener was stopped.")
-
-    def settimeout(self, seconds):
-        """ Set the timeout value (in seconds) for all channels. """
-        self.log.info("Setting channels' timeout to %d seconds.", seconds)
-        self._timeout = seconds
-
-    def register(self, create_callback, connect_callback, read_callback,
-                 timeout_callback, opaque):
-        """ Register a new file descriptor to the listener. """
-        fileno = create_callback(opaque)
-        self.log.debug("Add fileno %d to listener's channels.", fileno)
-        with self._update_lock:
-            self._add_channels[fileno] = {
-                'connect_cb': connect_callback,
-                'read_cb': read_callback, 'timeout_cb': timeout_callback,
-                'opaque': opaque, 'create_cb': create_callback,
-                'read_time': 0.0,
-            }
-
-    def unregister(self, fileno):
-        """ Unregister an exist file descriptor from the listener. """
-        self.log.debug("Delete fileno %d from listener.", fileno)
-        with self._update_lock:
-            self._del_channels.append(fileno)
+        self._wakeup.set()
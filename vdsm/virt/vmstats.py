@@ -32,16 +32,21 @@ from .utils import isVdsmImage
 _MBPS_TO_BPS = 10 ** 6 / 8
 
 
-def produce(vm, first_sample, last_sample, interval):
+def produce(vm, first_sample, last_sample, interval, metrics=None):
     """
     Translates vm samples into stats.
+
+    metrics are the sample metrics returned by sample_metrics() for these
+    samples, computed if not specified.
     """
+    if metrics is None:
+        metrics = sample_metrics(first_sample, last_sample, interval)
 
     stats = {}
 
-    cpu(stats, first_sample, last_sample, interval)
-    networks(vm, stats, first_sample, last_sample, interval)
-    disks(vm, stats, first_sample, last_sample, interval)
+    cpu(stats, first_sample, last_sample, interval, metrics)
+    networks(vm, stats, first_sample, last_sample, interval, metrics)
+    disks(vm, stats, first_sample, last_sample, interval, metrics)
     balloon(vm, stats, last_sample)
     cpu_count(stats, last_sample)
     tune_io(vm, stats)
@@ -49,6 +54,61 @@ def produce(vm, first_sample, last_sample, interval):
     return stats
 
 
+def sample_metrics(first_sample, last_sample, interval):
+    """
+    Compute the stats depending only on the samples, in a single pass over
+    the samples. The result does not depend on the vm devices, so it can be
+    computed once per sampling interval and shared by all stats requests.
+
+    Returns a dict with these keys:
+
+    cpu     cpu stats, empty if not available
+    net     maps nic names to _nic_metrics(), or None if stats are missing
+    block   maps drive names to dicts with "rate", "latency" and "iops"
+            keys, mapped to disk stats, or None if stats are missing. "rate"
+            is not available if interval is invalid.
+    """
+    metrics = {'cpu': {}, 'net': {}, 'block': {}}
+
+    if first_sample is None or last_sample is None:
+        return metrics
+
+    metrics['cpu'] = _cpu_metrics(first_sample, last_sample, interval)
+
+    first_indexes = _find_bulk_stats_reverse_map(first_sample, 'net')
+    last_indexes = _find_bulk_stats_reverse_map(last_sample, 'net')
+    for name, last_index in last_indexes.iteritems():
+        # may happen if nic is a new hot-plugged one
+        if name not in first_indexes:
+            continue
+        try:
+            metrics['net'][name] = _nic_metrics(
+                first_sample, first_indexes[name], last_sample, last_index)
+        except KeyError:
+            metrics['net'][name] = None
+
+    first_indexes = _find_bulk_stats_reverse_map(first_sample, 'block')
+    last_indexes = _find_bulk_stats_reverse_map(last_sample, 'block')
+    for name, last_index in last_indexes.iteritems():
+        if name not in first_indexes:
+            continue
+        first_index = first_indexes[name]
+        drive_metrics = {}
+        if interval > 0:
+            drive_metrics['rate'] = _missing_as_none(
+                _disk_rate, first_sample, first_index, last_sample,
+                last_index, interval)
+        drive_metrics['latency'] = _missing_as_none(
+            _disk_latency, first_sample, first_index, last_sample,
+            last_index)
+        drive_metrics['iops'] = _missing_as_none(
+            _disk_iops_bytes, first_sample, first_index, last_sample,
+            last_index)
+        metrics['block'][name] = drive_metrics
+
+    return metrics
+
+
 def translate(vm_stats):
     stats = {}
 
@@ -97,17 +157,29 @@ def tune_io(vm, stats):
     stats['ioTune'] = io_tune_info
 
 
-def cpu(stats, first_sample, last_sample, interval):
+def cpu(stats, first_sample, last_sample, interval, metrics=None):
     stats['cpuUser'] = 0.0
     stats['cpuSys'] = 0.0
 
     if first_sample is None or last_sample is None:
         return None
+
+    if metrics is None:
+        stats.update(_cpu_metrics(first_sample, last_sample, interval))
+    else:
+        stats.update(metrics['cpu'])
+
+    return stats
+
+
+def _cpu_metrics(first_sample, last_sample, interval):
+    stats = {}
+
     if interval <= 0:
         logging.warning(
             'invalid interval %i when computing CPU stats',
             interval)
-        return None
+        return stats
 
     try:
         stats['cpuUsage'] = str(last_sample['cpu.system'] +
@@ -172,9 +244,25 @@ def cpu_count(stats, sample):
             logging.error('Failed to get VM cpu count')
 
 
-def _nic_traffic(vm_obj, name, model, mac,
-                 start_sample, start_index,
-                 end_sample, end_index, interval):
+def _nic_metrics(start_sample, start_index, end_sample, end_index):
+    """
+    Return the stats of a nic depending only on the samples.
+    """
+    end_rx = end_sample['net.%d.rx.bytes' % end_index]
+    end_tx = end_sample['net.%d.tx.bytes' % end_index]
+    return {
+        'rxErrors': str(end_sample['net.%d.rx.errs' % end_index]),
+        'rxDropped': str(end_sample['net.%d.rx.drop' % end_index]),
+        'txErrors': str(end_sample['net.%d.tx.errs' % end_index]),
+        'txDropped': str(end_sample['net.%d.tx.drop' % end_index]),
+        'rx': str(end_rx),
+        'tx': str(end_tx),
+        'rxDelta': end_rx - start_sample['net.%d.rx.bytes' % start_index],
+        'txDelta': end_tx - start_sample['net.%d.tx.bytes' % start_index],
+    }
+
+
+def _nic_stats(name, model, mac, interval, nic_metrics):
     ifSpeed = [100, 1000][model in ('e1000', 'virtio')]
 
     ifStats = {'macAddr': mac,
@@ -182,40 +270,25 @@ def _nic_traffic(vm_obj, name, model, mac,
                'speed': str(ifSpeed),
                'state': 'unknown'}
 
-    with _skip_if_missing_stats(vm_obj):
-        ifStats['rxErrors'] = str(end_sample['net.%d.rx.errs' % end_index])
-        ifStats['rxDropped'] = str(end_sample['net.%d.rx.drop' % end_index])
-        ifStats['txErrors'] = str(end_sample['net.%d.tx.errs' % end_index])
-        ifStats['txDropped'] = str(end_sample['net.%d.tx.drop' % end_index])
-
-    with _skip_if_missing_stats(vm_obj):
-        rxDelta = (
-            end_sample['net.%d.rx.bytes' % end_index] -
-            start_sample['net.%d.rx.bytes' % start_index]
-        )
-        txDelta = (
-            end_sample['net.%d.tx.bytes' % end_index] -
-            start_sample['net.%d.tx.bytes' % start_index]
-        )
+    for key in ('rxErrors', 'rxDropped', 'txErrors', 'txDropped', 'rx',
+                'tx'):
+        ifStats[key] = nic_metrics[key]
 
     ifRxBytes = (100.0 *
-                 (rxDelta % 2 ** 32) /
+                 (nic_metrics['rxDelta'] % 2 ** 32) /
                  interval / ifSpeed / _MBPS_TO_BPS)
     ifTxBytes = (100.0 *
-                 (txDelta % 2 ** 32) /
+                 (nic_metrics['txDelta'] % 2 ** 32) /
                  interval / ifSpeed / _MBPS_TO_BPS)
 
     ifStats['rxRate'] = '%.1f' % ifRxBytes
     ifStats['txRate'] = '%.1f' % ifTxBytes
-
-    ifStats['rx'] = str(end_sample['net.%d.rx.bytes' % end_index])
-    ifStats['tx'] = str(end_sample['net.%d.tx.bytes' % end_index])
     ifStats['sampleTime'] = monotonic_time()
 
     return ifStats
 
 
-def networks(vm, stats, first_sample, last_sample, interval):
+def networks(vm, stats, first_sample, last_sample, interval, metrics=None):
     stats['network'] = {}
 
     if first_sample is None or last_sample is None:
@@ -226,32 +299,38 @@ def networks(vm, stats, first_sample, last_sample, interval):
             interval, vm.id)
         return None
 
-    first_indexes = _find_bulk_stats_reverse_map(first_sample, 'net')
-    last_indexes = _find_bulk_stats_reverse_map(last_sample, 'net')
+    if metrics is None:
+        metrics = sample_metrics(first_sample, last_sample, interval)
 
     for nic in vm.getNicDevices():
         if nic.name.startswith('hostdev'):
             continue
 
         # may happen if nic is a new hot-plugged one
-        if nic.name not in first_indexes or nic.name not in last_indexes:
+        if nic.name not in metrics['net']:
             continue
 
-        stats['network'][nic.name] = _nic_traffic(
-            vm, nic.name, nic.nicModel, nic.macAddr,
-            first_sample, first_indexes[nic.name],
-            last_sample, last_indexes[nic.name],
-            interval)
+        nic_metrics = metrics['net'][nic.name]
+        if nic_metrics is None:
+            # If a VM is migration destination, libvirt doesn't give any
+            # nic stat.
+            if not vm.incomingMigrationPending():
+                raise KeyError("Missing stats for nic %s" % nic.name)
+            continue
+
+        stats['network'][nic.name] = _nic_stats(
+            nic.name, nic.nicModel, nic.macAddr, interval, nic_metrics)
 
     return stats
 
 
-def disks(vm, stats, first_sample, last_sample, interval):
+def disks(vm, stats, first_sample, last_sample, interval, metrics=None):
     if first_sample is None or last_sample is None:
         return None
 
-    first_indexes = _find_bulk_stats_reverse_map(first_sample, 'block')
-    last_indexes = _find_bulk_stats_reverse_map(last_sample, 'block')
+    if metrics is None:
+        metrics = sample_metrics(first_sample, last_sample, interval)
+
     disk_stats = {}
 
     for vm_drive in vm.getDiskDevices():
@@ -269,8 +348,8 @@ def disks(vm, stats, first_sample, last_sample, interval):
             elif "GUID" in vm_drive:
                 drive_stats['lunGUID'] = vm_drive.GUID
 
-            if (vm_drive.name in first_indexes and
-               vm_drive.name in last_indexes):
+            drive_metrics = metrics['block'].get(vm_drive.name)
+            if drive_metrics is not None:
                 # will be None if sampled during recovery
                 if interval <= 0:
                     logging.warning(
@@ -278,22 +357,10 @@ def disks(vm, stats, first_sample, last_sample, interval):
                         'stats for vm %s disk %s',
                         interval, vm.id, vm_drive.name)
                 else:
-                    with _skip_if_missing_stats(vm):
-                        drive_stats.update(
-                            _disk_rate(
-                                first_sample, first_indexes[vm_drive.name],
-                                last_sample, last_indexes[vm_drive.name],
-                                interval))
-                with _skip_if_missing_stats(vm):
-                    drive_stats.update(
-                        _disk_latency(
-                            first_sample, first_indexes[vm_drive.name],
-                            last_sample, last_indexes[vm_drive.name]))
-                with _skip_if_missing_stats(vm):
-                    drive_stats.update(
-                        _disk_iops_bytes(
-                            first_sample, first_indexes[vm_drive.name],
-                            last_sample, last_indexes[vm_drive.name]))
+                    _update_drive_stats(vm, drive_stats, drive_metrics,
+                                        'rate')
+                _update_drive_stats(vm, drive_stats, drive_metrics, 'latency')
+                _update_drive_stats(vm, drive_stats, drive_metrics, 'iops')
 
         except AttributeError:
             logging.exception("Disk %s stats not available",
@@ -307,6 +374,24 @@ def disks(vm, stats, first_sample, last_sample, interval):
     return stats
 
 
+def _update_drive_stats(vm, drive_stats, drive_metrics, key):
+    value = drive_metrics[key]
+    if value is None:
+        # If a VM is migration destination, libvirt doesn't give any disk
+        # stat.
+        if not vm.incomingMigrationPending():
+            raise KeyError("Missing %s stats" % key)
+    else:
+        drive_stats.update(value)
+
+
+def _missing_as_none(func, *args):
+    try:
+        return func(*args)
+    except KeyError:
+        return None
+
+
 def _disk_rate(first_sample, first_index, last_sample, last_index, interval):
     return {
         'readRate': str(